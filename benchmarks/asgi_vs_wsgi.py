@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并发基准测试：WSGI（开发服务器、预派生线程池服务器）对比ASGI入口（asgi.py）
+用法: python benchmarks/asgi_vs_wsgi.py [--levels 10,100,1000] [--duration S] [--threads N] [--timeout S]
+
+对每个服务器和每个并发级别N:
+    1. N个慢客户端各自发送 POST /api/chat 的请求头和一半请求体后保持连接（进行中的请求），
+       统计服务器进程（含子进程）的内存增量/连接，以及此时一个新连接上的 POST /api/chat 延迟
+       （WSGI服务器每个进行中的请求占用一个线程，线程用完后新请求只能等待）；
+    2. N个客户端同时循环发送 POST /api/chat，统计吞吐量、延迟和超时/错误数
+       （werkzeug每个响应后关闭连接，客户端随后重新连接）。
+客户端使用asyncio，在一个进程中就能打开上千个连接。基准测试写入的聊天记录在结束时删除。
+"""
+
+import os
+import sys
+import time
+import asyncio
+import sqlite3
+import argparse
+import subprocess
+
+from wsgi_servers import DEV_SERVER, SRC_DIR, free_port, wait_until_ready
+
+DB_PATH = os.path.join(SRC_DIR, '..', 'data', 'virtual_diagnostician.db')
+PATIENT_ID = 'benchmark-asgi'
+CHAT_BODY = ('{"message": "I have a headache and a fever", "patient_id": "%s"}' % PATIENT_ID).encode()
+
+
+# 进程内存
+def _children(pid: int) -> list:
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # 第4个字段是父进程ID（进程名可能含空格，从最后一个括号之后解析）
+                if int(f.read().rsplit(')', 1)[1].split()[1]) == pid:
+                    children.append(int(entry))
+        except (OSError, ValueError, IndexError):
+            continue
+    return children
+
+
+def tree_rss_kb(pid: int) -> int:
+    """进程及其所有子进程的常驻内存（KB）"""
+    total = 0
+    for process in [pid] + [grandchild for child in _children(pid) for grandchild in [child] + _children(child)]:
+        try:
+            with open(f'/proc/{process}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except OSError:
+            continue
+    return total
+
+
+# 最小HTTP/1.1客户端
+def request_head(method: str, path: str, length: int) -> bytes:
+    return (f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nConnection: keep-alive\r\n'
+            f'Content-Type: application/json\r\nContent-Length: {length}\r\n\r\n').encode()
+
+
+async def http_request(reader, writer, method: str, path: str, body: bytes = b''):
+    """发送请求并读取响应，返回 (状态码, 连接是否可以复用)"""
+    writer.write(request_head(method, path, len(body)) + body)
+    await writer.drain()
+
+    response_head = await reader.readuntil(b'\r\n\r\n')
+    status = int(response_head.split(b' ', 2)[1])
+    headers = {}
+    for line in response_head.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        headers[name.strip().lower()] = value.strip()
+
+    if b'chunked' in headers.get(b'transfer-encoding', b''):
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(int(headers.get(b'content-length', b'0')))
+    return status, headers.get(b'connection', b'').lower() != b'close'
+
+
+async def timed_chat(port: int, timeout: float):
+    """新连接上的一次 POST /api/chat，返回耗时（秒），超时或失败返回None"""
+    start = time.perf_counter()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+        try:
+            status, _ = await asyncio.wait_for(http_request(reader, writer, 'POST', '/api/chat', CHAT_BODY),
+                                               timeout)
+        finally:
+            writer.close()
+        return time.perf_counter() - start if status == 200 else None
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+        return None
+
+
+async def hold_connections(port: int, pid: int, count: int, timeout: float) -> dict:
+    """保持count个进行中的请求（请求体只发送一半），测量内存增量和新请求的延迟"""
+    baseline = tree_rss_kb(pid)
+    writers = []
+
+    async def open_one():
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+        except (OSError, asyncio.TimeoutError):
+            return
+        writer.write(request_head('POST', '/api/chat', len(CHAT_BODY)) + CHAT_BODY[:len(CHAT_BODY) // 2])
+        await writer.drain()
+        writers.append(writer)
+
+    await asyncio.gather(*(open_one() for _ in range(count)))
+    await asyncio.sleep(1.0)
+    held_rss = tree_rss_kb(pid)
+    probe = await timed_chat(port, timeout)
+
+    for writer in writers:
+        writer.close()
+    await asyncio.sleep(1.0)
+    return {
+        'held': len(writers),
+        'kb_per_conn': max(held_rss - baseline, 0) / count,
+        'probe_ms': probe * 1000 if probe is not None else None,
+    }
+
+
+async def chat_load(port: int, clients: int, duration: float, timeout: float) -> dict:
+    deadline = time.perf_counter() + duration
+    latencies, errors = [], [0]
+
+    async def client():
+        writer = None
+        try:
+            while time.perf_counter() < deadline:
+                if writer is None:
+                    reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+                start = time.perf_counter()
+                status, keep_alive = await asyncio.wait_for(
+                    http_request(reader, writer, 'POST', '/api/chat', CHAT_BODY), timeout)
+                if status == 200:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors[0] += 1
+                if not keep_alive:
+                    writer.close()
+                    writer = None
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            errors[0] += 1  # 超时或连接出错后该客户端停止
+        finally:
+            if writer is not None:
+                writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    if not latencies:
+        return {'rps': 0.0, 'p50': 0.0, 'p99': 0.0, 'errors': errors[0]}
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50': latencies[len(latencies) // 2] * 1000,
+        'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        'errors': errors[0],
+    }
+
+
+def benchmark(name: str, command: list, port: int, args) -> list:
+    process = subprocess.Popen(command, cwd=SRC_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    rows = []
+    try:
+        wait_until_ready(f'http://127.0.0.1:{port}')
+        for level in args.levels:
+            hold = asyncio.run(hold_connections(port, process.pid, level, args.timeout))
+            load = asyncio.run(chat_load(port, level, args.duration, args.timeout))
+            rows.append({'server': name, 'level': level, **hold, **load})
+            print(f"  {name} @ {level}: {load['rps']:.0f} req/s", flush=True)
+    finally:
+        process.terminate()
+        process.wait(timeout=60)
+    return rows
+
+
+def cleanup():
+    if os.path.exists(DB_PATH):
+        with sqlite3.connect(DB_PATH) as conn:
+            conn.execute("DELETE FROM chat_messages WHERE patient_id = ?", (PATIENT_ID,))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare concurrency limits and memory per connection, WSGI vs ASGI')
+    parser.add_argument('--levels', default='10,100,1000', help='Comma-separated connection counts')
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds of chat load per level')
+    parser.add_argument('--threads', type=int, default=8, help='Request threads (prefork) / executor threads (ASGI)')
+    parser.add_argument('--timeout', type=float, default=5.0, help='Seconds before a request counts as failed')
+    args = parser.parse_args()
+    args.levels = [int(level) for level in args.levels.split(',')]
+
+    servers = []
+    port = free_port()
+    servers.append(('wsgi dev server', [sys.executable, '-c', DEV_SERVER.format(port=port)], port))
+    port = free_port()
+    servers.append((f'wsgi prefork 1x{args.threads}',
+                    [sys.executable, 'server.py', '--host', '127.0.0.1', '--port', str(port), '--server', 'prefork',
+                     '--workers', '1', '--threads', str(args.threads)], port))
+    port = free_port()
+    servers.append((f'asgi {args.threads} threads',
+                    [sys.executable, 'asgi.py', '--host', '127.0.0.1', '--port', str(port), '--server', 'builtin',
+                     '--threads', str(args.threads)], port))
+
+    rows = []
+    try:
+        for name, command, port in servers:
+            rows.extend(benchmark(name, command, port, args))
+    finally:
+        cleanup()
+
+    print(f"\n{'server':<22}{'conns':>7}{'held':>6}{'KB/conn':>9}{'probe ms':>10}"
+          f"{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for row in rows:
+        probe = f"{row['probe_ms']:.1f}" if row['probe_ms'] is not None else 'timeout'
+        print(f"{row['server']:<22}{row['level']:>7}{row['held']:>6}{row['kb_per_conn']:>9.1f}{probe:>10}"
+              f"{row['rps']:>9.1f}{row['p50']:>9.1f}{row['p99']:>9.1f}{row['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+JSON编码器基准测试：在接近真实的负载上比较标准库json和orjson
+用法: python benchmarks/json_serialization.py [--messages N] [--patients N] [--repeat N]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from utils import serialization
+
+SYMPTOMS = ['头痛', '发烧', '咳嗽', '胃痛', '疲劳', '失眠', '恶心', '呕吐']
+
+
+def build_chat_history(messages: int) -> dict:
+    """/api/patient/<id>/history 的响应：长对话记录"""
+    start = datetime(2024, 1, 1, 9, 0, 0)
+    history = []
+    for i in range(messages):
+        user = i % 2 == 0
+        history.append({
+            'id': i + 1,
+            'type': 'user' if user else 'assistant',
+            'content': (f"我最近{random.choice(SYMPTOMS)}，已经持续{random.randint(1, 14)}天了。" if user else
+                        "根据您的描述，建议多休息、注意饮食，如症状持续请及时就医。" * random.randint(1, 4)),
+            'timestamp': (start + timedelta(minutes=i)).isoformat()
+        })
+    return {'history': history, 'status': 'success'}
+
+
+def build_patient_export(messages: int) -> dict:
+    """JSONHandler.save_patient_data 写出的导出文件"""
+    chat = build_chat_history(messages)['history']
+    return {
+        'export_info': {'system': 'Virtual Diagnostician', 'version': '1.0',
+                        'export_timestamp': datetime.now().isoformat(), 'format': 'JSON'},
+        'patient_data': {'id': '1234567890123', 'name': '张三', 'age': 42, 'gender': 'M',
+                         'medical_history': {'allergies': ['青霉素'], 'surgeries': [], 'chronic': ['高血压']}},
+        'chat_interaction': {'total_messages': len(chat), 'messages': chat},
+        'medical_summary': {'patient_age': 42, 'patient_gender': 'M', 'reported_symptoms': SYMPTOMS[:3],
+                            'conversation_duration': len(chat), 'last_interaction': chat[-1]['timestamp']}
+    }
+
+
+def build_training_page(patients: int) -> dict:
+    """/api/training/patients 的响应：一页训练患者"""
+    return {
+        'patients': [{
+            'id': str(1000000000000 + i), 'name': f'Patient {i}', 'age': random.randint(1, 95),
+            'gender': random.choice(['M', 'F']), 'birthdate': '1980-05-17', 'blood_type': 'A+',
+            'weight': round(random.uniform(40, 120), 1), 'height': round(random.uniform(140, 200), 1),
+            'source': 'training_data'
+        } for i in range(patients)],
+        'next_cursor': 'MTAwMDAwMDAwMDUwMA',
+        'has_more': True,
+        'limit': patients
+    }
+
+
+def measure(func, repeat: int) -> float:
+    """返回repeat次中最快的一次（毫秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare JSON encoders on realistic payloads')
+    parser.add_argument('--messages', type=int, default=5000, help='Chat messages in history/export payloads')
+    parser.add_argument('--patients', type=int, default=500, help='Patients in the training page payload')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(0)
+    payloads = {
+        'chat history': build_chat_history(args.messages),
+        'patient export': build_patient_export(args.messages),
+        'training page': build_training_page(args.patients),
+    }
+
+    backends = ['stdlib'] + (['orjson'] if serialization.orjson is not None else [])
+    if len(backends) == 1:
+        print('orjson is not installed; only the stdlib encoder is measured')
+
+    print(f"{'payload':<16}{'size':>10}  {'mode':<8}" + ''.join(f'{b:>12}' for b in backends) + '     speedup')
+    for name, payload in payloads.items():
+        size = len(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+        for pretty in (False, True):
+            timings = []
+            for backend in backends:
+                serialization.use_backend(backend)
+                timings.append(measure(lambda: serialization.dumps_bytes(payload, pretty=pretty), args.repeat))
+            speedup = f'{timings[0] / timings[-1]:>9.1f}x' if len(timings) > 1 else ''
+            print(f"{name:<16}{size:>10}  {'pretty' if pretty else 'compact':<8}"
+                  + ''.join(f'{t:>10.2f}ms' for t in timings) + f'  {speedup}')
+
+        # 解码
+        encoded = serialization.dumps_bytes(payload)
+        timings = []
+        for backend in backends:
+            serialization.use_backend(backend)
+            timings.append(measure(lambda: serialization.loads(encoded), args.repeat))
+        speedup = f'{timings[0] / timings[-1]:>9.1f}x' if len(timings) > 1 else ''
+        print(f"{name:<16}{size:>10}  {'loads':<8}" + ''.join(f'{t:>10.2f}ms' for t in timings) + f'  {speedup}')
+
+    # 对照：改动前JSONHandler的写法（ensure_ascii=False, indent=2）
+    export = payloads['patient export']
+    legacy = measure(lambda: json.dumps(export, ensure_ascii=False, indent=2), args.repeat)
+    print(f"\nLegacy json.dump(indent=2) for the patient export: {legacy:.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+启动时间基准测试：在全新的解释器中分别测量导入main、create_app、第一个请求的耗时
+用法: python benchmarks/startup_time.py [--runs N]
+
+每次运行都启动新的Python进程（与工作进程或测试进程的冷启动一致），结果取中位数。
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+PROBE = r'''
+import json, logging, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+app = main.create_app()
+t2 = time.perf_counter()
+client = app.test_client()
+client.get('/api/patients')
+t3 = time.perf_counter()
+main.stop_background_services(app)
+print(json.dumps({'import': t1 - t0, 'create_app': t2 - t1, 'first_request': t3 - t2}))
+'''
+
+
+def run_probe() -> dict:
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=SRC_DIR, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold application startup')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    run_probe()  # 预热磁盘缓存，并确保数据库已存在
+    runs = [run_probe() for _ in range(args.runs)]
+
+    print(f"{'phase':<16}{'median ms':>12}{'min ms':>10}{'max ms':>10}")
+    for phase in ('import', 'create_app', 'first_request'):
+        values = [run[phase] * 1000 for run in runs]
+        print(f"{phase:<16}{statistics.median(values):>12.1f}{min(values):>10.1f}{max(values):>10.1f}")
+    total = [sum(run.values()) * 1000 for run in runs]
+    print(f"{'total':<16}{statistics.median(total):>12.1f}{min(total):>10.1f}{max(total):>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
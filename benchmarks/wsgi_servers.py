@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+服务器吞吐量基准测试：Flask开发服务器（main.py的运行方式）对比多进程生产服务器（server.py）
+用法: python benchmarks/wsgi_servers.py [--duration S] [--clients N] [--workers N] [--threads N]
+
+负载由多个客户端进程产生（避免客户端自身受GIL限制），每个进程内有若干并发线程。
+"""
+
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+ENDPOINTS = [
+    '/api/patients',
+    '/api/training/patients?limit=50',
+    '/api/chat/history/default',
+]
+
+# 与 python main.py 相同：调试模式，但关闭重载器以便结束进程
+DEV_SERVER = ("import main; app = main.create_app(); main.start_background_services(app); "
+              "app.run(debug=True, use_reloader=False, host='127.0.0.1', port={port})")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_ready(base_url: str, timeout: float = 60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(base_url + ENDPOINTS[0], timeout=2).read()
+            return
+        except OSError:
+            time.sleep(0.3)
+    raise RuntimeError(f'Server at {base_url} did not start')
+
+
+def _client(job) -> list:
+    """客户端进程：threads个线程在duration秒内循环请求，返回每个请求的耗时（秒，失败为None）"""
+    base_url, duration, threads = job
+    deadline = time.time() + duration
+
+    def loop(offset):
+        latencies = []
+        i = offset
+        while time.time() < deadline:
+            url = base_url + ENDPOINTS[i % len(ENDPOINTS)]
+            start = time.perf_counter()
+            try:
+                urllib.request.urlopen(url, timeout=30).read()
+                latencies.append(time.perf_counter() - start)
+            except OSError:
+                latencies.append(None)
+            i += 1
+        return latencies
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return [latency for result in executor.map(loop, range(threads)) for latency in result]
+
+
+def run_load(base_url: str, duration: float, clients: int, threads: int) -> dict:
+    with Pool(clients) as pool:
+        results = pool.map(_client, [(base_url, duration, threads)] * clients)
+    latencies = sorted(latency for result in results for latency in result if latency is not None)
+    errors = sum(1 for result in results for latency in result if latency is None)
+    if not latencies:
+        return {'requests': 0, 'errors': errors, 'rps': 0.0, 'p50': 0.0, 'p99': 0.0}
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / duration,
+        'p50': latencies[len(latencies) // 2] * 1000,
+        'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+
+def benchmark(name: str, command: list, port: int, args) -> dict:
+    process = subprocess.Popen(command, cwd=SRC_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base_url = f'http://127.0.0.1:{port}'
+        wait_until_ready(base_url)
+        run_load(base_url, 1.0, args.clients, args.concurrency)  # 预热
+        result = run_load(base_url, args.duration, args.clients, args.concurrency)
+    finally:
+        process.terminate()
+        process.wait(timeout=60)
+    result['server'] = name
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the dev server with the multi-process server')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds of load per server')
+    parser.add_argument('--clients', type=int, default=4, help='Client processes')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent requests per client process')
+    parser.add_argument('--workers', type=int, default=min(os.cpu_count() or 1, 4))
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    results = []
+    port = free_port()
+    results.append(benchmark('dev server', [sys.executable, '-c', DEV_SERVER.format(port=port)], port, args))
+
+    port = free_port()
+    results.append(benchmark(f'prefork {args.workers}x{args.threads}',
+                             [sys.executable, 'server.py', '--host', '127.0.0.1', '--port', str(port),
+                              '--workers', str(args.workers), '--threads', str(args.threads)], port, args))
+
+    print(f"{'server':<20}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for result in results:
+        print(f"{result['server']:<20}{result['requests']:>10}{result['errors']:>8}{result['rps']:>10.1f}"
+              f"{result['p50']:>10.1f}{result['p99']:>10.1f}")
+    if results[0]['rps']:
+        print(f"\nSpeedup: {results[1]['rps'] / results[0]['rps']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
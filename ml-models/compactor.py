@@ -0,0 +1,314 @@
+import os
+import re
+import sys
+import json
+import math
+import time
+import argparse
+import numpy as np
+
+# Shared loaders live in the web app's utils package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from utils.parallel_loader import load_json_files
+from utils.path_resolver import PatientPathResolver
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# records:  every *.json (except *_history.json) in a patient folder is one row (diabetes Set-1)
+# clinical: patient_<id>_record/clinical_data.json is one row per patient (covid Set-4)
+KINDS = ("records", "clinical")
+
+OUTPUT_NAME = "compacted"
+ID_COLUMNS = ["_patient_id", "_source"]
+
+# Bumped when the stored types change; an older compacted file is rebuilt on the next run
+MANIFEST_VERSION = 2
+
+INT = "int"
+FLOAT = "float"
+STRING = "string"
+
+SHARD_NAME = re.compile(r"^[0-9a-f]{2}$")
+
+
+# == Source discovery ==
+
+def iterRecordFolders(folder):
+    """Yield (patientID, path) for every subdirectory of a records folder, whatever its name
+
+    Same rule as the original diabetes script; only a folder migrated to the sharded layout
+    has its two-level shard directories walked instead of being read as patients.
+    """
+    resolver = PatientPathResolver(folder)
+    sharded = resolver.layout == PatientPathResolver.SHARDED or resolver.migrating
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if not os.path.isdir(path): continue
+        if sharded and SHARD_NAME.match(name):
+            for level2 in sorted(os.listdir(path)):
+                shardPath = os.path.join(path, level2)
+                if not (SHARD_NAME.match(level2) and os.path.isdir(shardPath)): continue
+                for patientName in sorted(os.listdir(shardPath)):
+                    if os.path.isdir(os.path.join(shardPath, patientName)):
+                        yield patientName.replace("patient_", "", 1), os.path.join(shardPath, patientName)
+        else:
+            yield name.replace("patient_", "", 1), path
+
+
+def listSources(folder, kind):
+    """Yield (patientID, path) for every source JSON file of a Set-N folder"""
+    if kind == "clinical":
+        for patientID, patientPath in sorted(PatientPathResolver(folder).iter_patient_dirs()):
+            path = os.path.join(patientPath, f"patient_{patientID}_record", "clinical_data.json")
+            if os.path.exists(path):
+                yield patientID, path
+    else:
+        for patientID, patientPath in iterRecordFolders(folder):
+            for filename in sorted(os.listdir(patientPath)):
+                if filename.endswith(".json") and not filename.endswith("history.json"):
+                    yield patientID, os.path.join(patientPath, filename)
+
+
+def flatten(data, prefix = ""):
+    """Flatten nested sections into dotted column names (vital_signs.pulse)"""
+    flat = {}
+    for key, val in data.items():
+        name = prefix + key
+        if isinstance(val, dict): flat.update(flatten(val, name + "."))
+        else: flat[name] = val
+    return flat
+
+
+# == Schema ==
+
+def isNumeric(val):
+    return val is None or (isinstance(val, (int, float)) and not isinstance(val, str))
+
+
+def isInteger(val):
+    return isinstance(val, int) and not isinstance(val, bool)
+
+
+def inferSchema(rows):
+    """Column order follows first appearance; a column is float only if every value is numeric
+
+    A column is int when every row has an integer value, which is when pandas keeps int64
+    for the raw JSON too; missing or null values make it float (NaN), as they do in pandas.
+    None does not decide between float and string: a column that is null in every row stays
+    float until a non-numeric value shows up, which makes compactDataset rebuild with a string column.
+    """
+    schema = {column: STRING for column in ID_COLUMNS}
+    integers = {}
+    for row in rows:
+        for column, val in row.items():
+            if column in ID_COLUMNS: continue
+            numeric = isNumeric(val)
+            if column not in schema:
+                schema[column] = FLOAT if numeric else STRING
+            elif not numeric:
+                schema[column] = STRING
+            if isInteger(val): integers[column] = integers.get(column, 0) + 1
+    for column, count in integers.items():
+        if schema[column] == FLOAT and count == len(rows):
+            schema[column] = INT
+    return [[column, dtype] for column, dtype in schema.items()]
+
+
+def schemaConflicts(schema, rows):
+    """Columns of rows that the schema cannot hold: unknown columns, non-numeric values in float
+    columns, or values in int columns that are missing or not integers"""
+    types = dict(schema)
+    conflicts = set()
+    for row in rows:
+        for column, val in row.items():
+            dtype = types.get(column)
+            if dtype is None or (dtype == FLOAT and not isNumeric(val)):
+                conflicts.add(column)
+        for column, dtype in schema:
+            if dtype == INT and not isInteger(row.get(column)):
+                conflicts.add(column)
+    return sorted(conflicts)
+
+
+def coerce(val, dtype):
+    if dtype == INT: return int(val)
+    if dtype == FLOAT:
+        if isinstance(val, (int, float)): return float(val)
+        if isinstance(val, str):
+            try: return float(val)
+            except ValueError: return math.nan
+        return math.nan
+    if val is None: return None
+    if isinstance(val, str): return val
+    if isinstance(val, (list, dict)): return json.dumps(val, ensure_ascii = False)
+    return str(val)
+
+
+# == Storage ==
+
+def outputPaths(folder, fmt):
+    base = os.path.join(folder, OUTPUT_NAME)
+    return base + (".parquet" if fmt == "parquet" else ".npz"), base + ".manifest.json"
+
+
+def readManifest(folder):
+    path = os.path.join(folder, OUTPUT_NAME + ".manifest.json")
+    if not os.path.exists(path): return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def readColumns(dataPath, fmt, schema):
+    """Read every column as a Python list (None / NaN for missing values)"""
+    if fmt == "parquet":
+        columns = pq.read_table(dataPath).to_pydict()
+        return {column: [math.nan if (dtype == FLOAT and v is None) else v for v in columns[column]]
+                for column, dtype in schema}
+
+    columns = {}
+    with np.load(dataPath) as archive:
+        for column, dtype in schema:
+            values = archive[column].tolist()
+            if dtype == STRING:
+                isNull = archive[column + "__isnull"].tolist()
+                values = [None if null else v for v, null in zip(values, isNull)]
+            columns[column] = values
+    return columns
+
+
+def writeColumns(dataPath, fmt, schema, columns):
+    """Write columns atomically (temp file + rename)"""
+    tmpPath = dataPath + ".tmp"
+    if fmt == "parquet":
+        arrays = {}
+        for column, dtype in schema:
+            if dtype == INT:
+                arrays[column] = pa.array(columns[column], type = pa.int64())
+            elif dtype == FLOAT:
+                arrays[column] = pa.array(columns[column], type = pa.float64(), from_pandas = True)
+            else:
+                arrays[column] = pa.array(columns[column], type = pa.string())
+        pq.write_table(pa.table(arrays), tmpPath)
+    else:
+        arrays = {}
+        for column, dtype in schema:
+            if dtype == INT:
+                arrays[column] = np.array(columns[column], dtype = np.int64)
+            elif dtype == FLOAT:
+                arrays[column] = np.array(columns[column], dtype = np.float64)
+            else:
+                arrays[column] = np.array(["" if v is None else v for v in columns[column]], dtype = str)
+                arrays[column + "__isnull"] = np.array([v is None for v in columns[column]], dtype = bool)
+        with open(tmpPath, "wb") as f:
+            np.savez(f, **arrays)
+    os.replace(tmpPath, dataPath)
+
+
+# == Compaction ==
+
+def compactDataset(folder, kind = "records", fmt = None, rebuild = False, workers = None):
+    """Convert (or incrementally update) a Set-N folder into one typed columnar file"""
+    if kind not in KINDS: raise ValueError("Unknown kind: " + kind)
+
+    start = time.time()
+    manifest = None if rebuild else readManifest(folder)
+    fmt = (manifest or {}).get("format") or fmt or ("parquet" if pa is not None else "npz")
+    if manifest and (manifest["kind"] != kind or manifest.get("version") != MANIFEST_VERSION): manifest = None
+
+    if fmt == "parquet" and pa is None: raise RuntimeError("pyarrow is required for the parquet format")
+    dataPath, manifestPath = outputPaths(folder, fmt)
+    if manifest and not os.path.exists(dataPath): manifest = None
+
+    known = (manifest or {}).get("sources", {})
+    sources = {}
+    changed = []
+    for patientID, path in listSources(folder, kind):
+        rel = os.path.relpath(path, folder)
+        stat = os.stat(path)
+        sources[rel] = [stat.st_mtime_ns, stat.st_size]
+        if known.get(rel) != sources[rel]:
+            changed.append((patientID, rel, path))
+    removed = set(known) - set(sources)
+
+    stats = {"rows": (manifest or {}).get("rows", 0), "added": len(changed), "removed": len(removed),
+             "failed": 0, "format": fmt, "path": dataPath}
+    if manifest and not changed and not removed:
+        return stats
+
+    # Parse only new or modified files
+    newRows = []
+    for (patientID, rel, path), result in zip(changed, load_json_files([c[2] for c in changed], max_workers = workers)):
+        if result.error is not None or not isinstance(result.value, dict):
+            stats["failed"] += 1
+            sources.pop(rel)
+            continue
+        row = flatten(result.value)
+        row["_patient_id"] = patientID
+        row["_source"] = rel
+        newRows.append(row)
+
+    # Incremental updates keep the schema; a new column or a type change re-infers it from every file
+    if manifest:
+        conflicts = schemaConflicts(manifest["schema"], newRows)
+        if conflicts:
+            print("Schema changed (" + ", ".join(conflicts) + "), rebuilding " + folder)
+            return compactDataset(folder, kind, fmt, rebuild = True, workers = workers)
+    schema = manifest["schema"] if manifest else inferSchema(newRows)
+
+    if manifest:
+        columns = readColumns(dataPath, fmt, schema)
+        stale = {rel for _, rel, _ in changed} | removed
+        keep = [i for i, rel in enumerate(columns["_source"]) if rel not in stale]
+        columns = {column: [values[i] for i in keep] for column, values in columns.items()}
+    else:
+        columns = {column: [] for column, _ in schema}
+
+    for row in newRows:
+        for column, dtype in schema:
+            columns[column].append(coerce(row.get(column), dtype))
+
+    writeColumns(dataPath, fmt, schema, columns)
+
+    stats["rows"] = len(columns["_source"])
+    with open(manifestPath + ".tmp", "w") as f:
+        json.dump({"version": MANIFEST_VERSION, "kind": kind, "format": fmt, "schema": schema, "rows": stats["rows"],
+                   "sources": sources, "updated": time.time()}, f)
+    os.replace(manifestPath + ".tmp", manifestPath)
+
+    print(f"Compacted {folder}: {stats['rows']} rows ({stats['added']} parsed, "
+          f"{stats['removed']} removed) in {time.time() - start:.3f} seconds.")
+    return stats
+
+
+def loadDataset(folder):
+    """Load a compacted folder as {column: numpy array} (ints are int64, floats use NaN, strings use None)"""
+    manifest = readManifest(folder)
+    if manifest is None: raise FileNotFoundError("No compacted dataset in " + folder)
+
+    dataPath, _ = outputPaths(folder, manifest["format"])
+    columns = readColumns(dataPath, manifest["format"], manifest["schema"])
+    dtypes = {INT: np.int64, FLOAT: np.float64, STRING: object}
+    return {column: np.array(columns[column], dtype = dtypes[dtype]) for column, dtype in manifest["schema"]}
+
+
+# Main Program
+def main():
+    parser = argparse.ArgumentParser(description = "Compact a Set-N patient folder into a columnar file")
+    parser.add_argument("folder", help = "Set-N folder, e.g. ../data/Set-1")
+    parser.add_argument("--kind", choices = KINDS, default = "records")
+    parser.add_argument("--format", choices = ["parquet", "npz"], default = None,
+                        help = "Output format (default: parquet when pyarrow is installed, else npz)")
+    parser.add_argument("--rebuild", action = "store_true", help = "Re-infer the schema and rewrite everything")
+    parser.add_argument("--workers", type = int, default = None, help = "Parallel JSON readers")
+    args = parser.parse_args()
+
+    stats = compactDataset(args.folder, args.kind, args.format, args.rebuild, args.workers)
+    print(json.dumps(stats, indent = 2))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,11 +3,18 @@ import torch.nn as nn
 import torch.optim as optim
 from torchvision import models, transforms
 from torch.utils.data import Dataset, DataLoader, random_split
-import os, cv2, json
+import os, sys, cv2, json
 import numpy as np
 from pathlib import Path
 from tqdm import tqdm
 
+# Shared loaders live in the web app's utils package; the columnar cache in ml-models
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from utils.parallel_loader import parallel_map
+from utils.path_resolver import PatientPathResolver
+from compactor import compactDataset, loadDataset
+
 PATIENT_INFO_KEYS = ["age", "sex_F", "weight", "height", "bmi"]           
 
 VITAL_SIGN_KEYS   = [                                                      
@@ -45,9 +52,10 @@ OUTCOME_KEYS      = [
 
 
 class patientDataset(Dataset):
-    def __init__(self, rootDir, frameCount = 16, resize = (112, 112), ext = "*.mp4"):
+    def __init__(self, rootDir, frameCount = 16, resize = (112, 112), ext = "*.mp4", loaderWorkers = None):
         super().__init__()
         self.datafile = Path(rootDir)
+        self.resolver = PatientPathResolver(str(rootDir))
         self.frameCount = frameCount
         self.resize = resize
         
@@ -61,6 +69,10 @@ class patientDataset(Dataset):
                 side = "L" if "_L" in str(videopath) else "R"
                 self.scans.append((patientID, videopath, side))
 
+        # Load each patient's clinical record once, instead of once per video
+        patientIDs = sorted({scan[0] for scan in self.scans})
+        self.clinicalRecords = self.loadClinicalRecords(patientIDs, loaderWorkers)
+
         # Colour transform: BGR -> RGB -> Grayscale
         self.toTensor = transforms.Compose([
             transforms.ToPILImage(), transforms.Resize(resize),
@@ -74,7 +86,8 @@ class patientDataset(Dataset):
         patientID, videoPath, side = self.scans[index]
 
         videoTensor = self.readVideo(videoPath)
-        clinicRecord = self.readClinical(patientID)
+        clinicRecord = self.clinicalRecords.get(patientID)
+        if clinicRecord is None: clinicRecord = self.readClinical(patientID)
         label = self.readLabel(patientID)
         # label = 0
 
@@ -108,28 +121,51 @@ class patientDataset(Dataset):
 
         return video
     
+    def loadClinicalRecords(self, patientIDs, workers = None):
+        # Prefer the columnar cache (updated incrementally); fall back to parsing every JSON file
+        try:
+            compactDataset(str(self.datafile), kind = "clinical", workers = workers)
+            columns = loadDataset(str(self.datafile))
+        except (OSError, RuntimeError) as e:
+            print("Columnar cache unavailable, parsing JSON files: " + str(e))
+            return {
+                result.item: result.value
+                for result in parallel_map(self.readClinical, patientIDs, max_workers = workers)
+                if result.error is None
+            }
+
+        records = {}
+        for i, patientID in enumerate(columns["_patient_id"]):
+            records[patientID] = self.clinicalVector(
+                lambda section, key: columns[section + "." + key][i] if section + "." + key in columns else None
+            )
+        return records
+
     def readClinical(self, patientID):
-        # Flatten nested JSON into numeric vector
-        jsonPath = self.datafile / ("patient_" + patientID) / ("patient_" + patientID + "_record") / "clinical_data.json"
+        jsonPath = Path(self.resolver.record_dir(patientID)) / "clinical_data.json"
         data = json.load(open(jsonPath))
 
+        return self.clinicalVector(lambda section, key: data.get(section, {}).get(key))
+
+    def clinicalVector(self, getValue):
+        # Flatten nested clinical sections into numeric vector
         flat = []
 
         def safeFloat(val):
-            if isinstance(val, (int, float)): return float(val)
+            if isinstance(val, float) and np.isnan(val): return 0.0
+            elif isinstance(val, (int, float)): return float(val)
             elif isinstance(val, str):
                 try: return float(val)
                 except ValueError: return 0.0
             elif val is None: return 0.0
             return 0.0
 
-        info = data["patient_info"]
         flat.extend([
-            safeFloat(info.get("age")),
-            1.0 if info.get("sex") == "F" else 0.0,
-            safeFloat(info.get("weight")),
-            safeFloat(info.get("height")),
-            safeFloat(info.get("bmi"))
+            safeFloat(getValue("patient_info", "age")),
+            1.0 if getValue("patient_info", "sex") == "F" else 0.0,
+            safeFloat(getValue("patient_info", "weight")),
+            safeFloat(getValue("patient_info", "height")),
+            safeFloat(getValue("patient_info", "bmi"))
         ])
         
         # for section in ["vital_signs", "symptoms", "comorbidities", "lab_findings"]:
@@ -143,9 +179,8 @@ class patientDataset(Dataset):
                 ("lab_findings",  LAB_FINDING_KEYS),
                 ("outcomes",      OUTCOME_KEYS),
             ]:
-                values = data.get(section, {})
                 for k in keys:
-                    flat.append(safeFloat(values.get(k)))
+                    flat.append(safeFloat(getValue(section, k)))
 
         # outcomes = data.get("outcomes", {})
         # for key, val in outcomes.items():
@@ -154,7 +189,7 @@ class patientDataset(Dataset):
         return torch.tensor(flat, dtype = torch.float32)
     
     def readLabel(self, patientID):
-        labelPath = self.datafile / ("patient_" + patientID) / ("patient_" + patientID + "_record") / "covid_classification.json"
+        labelPath = Path(self.resolver.record_dir(patientID)) / "covid_classification.json"
         # if os.path.exists(labelPath):
         # data = json.load(open(labelPath))
         # result = data["Covid_test_result"].strip().lower()
@@ -6,9 +6,15 @@ from google.oauth2 import service_account
 import json
 import pandas as pd
 import os
+import sys
 import joblib
 import time
 
+# Shared loaders live in the web app's utils package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from utils.parallel_loader import load_json_files
+from compactor import compactDataset, iterRecordFolders, loadDataset, ID_COLUMNS
+
 class randomForestModel:
 
     def __init__(self):
@@ -16,17 +22,32 @@ class randomForestModel:
         self.df = pd.DataFrame()
     
     # Extract and preprocess data
-    def preprocess_data(self, folder):
-        data = []
-
+    def preprocess_data(self, folder, workers = None, compact = True):
         print("Processing data...")
-        for patientFolder in os.listdir(folder):
-            patientPath = os.path.join(folder, patientFolder)
-            for filename in os.listdir(patientPath):
+
+        # compact = False reads the JSON files directly and writes nothing into the folder
+        if not compact:
+            return self.readRecords(folder, workers)
+
+        # Prefer the columnar cache (updated incrementally); fall back to parsing every JSON file
+        try:
+            compactDataset(folder, kind = "records", workers = workers)
+            return pd.DataFrame(loadDataset(folder)).drop(columns = ID_COLUMNS)
+        except (OSError, RuntimeError) as e:
+            print("Columnar cache unavailable, parsing JSON files: " + str(e))
+            return self.readRecords(folder, workers)
+
+    def readRecords(self, folder, workers = None):
+        paths = []
+
+        # Every patient subfolder, whatever its name (shard folders are walked in a sharded layout)
+        for patientID, patientPath in iterRecordFolders(folder):
+            for filename in sorted(os.listdir(patientPath)):
                 if not filename.endswith("history.json"):
-                    filepath = os.path.join(patientPath, filename)
-                    with open(filepath, "r") as f:
-                        data.append(json.load(f))
+                    paths.append(os.path.join(patientPath, filename))
+
+        # Read files with a thread pool; order is kept and unreadable files are skipped
+        data = [result.value for result in load_json_files(paths, max_workers = workers) if result.error is None]
 
         # self.df = pd.DataFrame(data)
         return pd.DataFrame(data)
@@ -50,12 +71,12 @@ class randomForestModel:
         self.model.fit(x, y)
         print("Done training model.")
 
-    # Predict test data
-    def predict(self, folder):
+    # Predict test data (compact = True keeps a columnar cache in the test folder)
+    def predict(self, folder, compact = False):
         start = time.time()
 
         print("Retrieve test data...")
-        testdf = self.preprocess_data(folder)
+        testdf = self.preprocess_data(folder, compact = compact)
         x, y = self.getInputAndTarget(testdf)
         print("Data processed.")
 
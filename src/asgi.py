@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+虚拟诊断助手ASGI入口（asyncio）
+用法: python asgi.py [--host HOST] [--port PORT] [--threads N] [--max-pending N] [--server auto|uvicorn|builtin]
+      或 uvicorn asgi:app
+
+提供与Flask应用（main.py）完全相同的路由：
+    - 聊天接口（POST /api/chat、GET /api/chat/history/<patient_id>）由协程直接处理，
+      只有数据库读写在有界线程池中执行，等待中的对话只占用一个协程而不是一个线程；
+    - 其他路由通过WSGI桥接交给Flask应用，在同一个线程池中执行，钩子、指标、压缩和错误处理与WSGI部署一致。
+线程池中等待执行的调用超过 --max-pending 时返回503。
+安装uvicorn时默认使用uvicorn，否则使用内置的最小asyncio HTTP/1.1服务器（utils/asgi_server.py）。
+"""
+
+import io
+import re
+import sys
+import time
+import signal
+import asyncio
+import logging
+import argparse
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger('asgi')
+
+try:
+    # 可选依赖：安装uvicorn后优先使用
+    import uvicorn
+except ImportError:
+    uvicorn = None
+
+import main
+from services.async_services import (AsyncChatService, BlockingExecutor, ExecutorBusyError,
+                                     DEFAULT_MAX_PENDING, DEFAULT_THREADS)
+from utils import serialization
+from utils.asgi_server import AsgiHttpServer, DEFAULT_MAX_CONNECTIONS
+
+JSON_HEADERS = [(b'content-type', b'application/json')]
+INLINE_BODY_LIMIT = 1024 * 1024  # 不超过该长度的WSGI响应体在一次线程池调用中读出
+
+
+class AsgiApplication:
+    """ASGI应用 - 聊天接口原生异步处理，其余路由桥接到Flask应用"""
+
+    def __init__(self, flask_app=None, threads: int = DEFAULT_THREADS, max_pending: int = DEFAULT_MAX_PENDING):
+        self.flask_app = flask_app or main.create_app()
+        self.executor = BlockingExecutor(threads, max_pending, thread_name_prefix='asgi')
+        self._chat_service: Optional[AsyncChatService] = None
+
+        # (方法, 路径模式, 处理函数, 指标中的路由标签)
+        self.routes: List[Tuple[str, re.Pattern, Callable, str]] = [
+            ('POST', re.compile(r'^/api/chat$'), self.chat, '/api/chat'),
+            ('GET', re.compile(r'^/api/chat/history/(?P<patient_id>[^/]+)$'), self.chat_history,
+             '/api/chat/history/<patient_id>'),
+        ]
+
+    @property
+    def chat_service(self) -> AsyncChatService:
+        if self._chat_service is None:
+            self._chat_service = AsyncChatService(self.flask_app.extensions['services'].chat_service, self.executor)
+        return self._chat_service
+
+    async def __call__(self, scope: Dict, receive: Callable, send: Callable):
+        if scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        else:
+            raise ValueError(f"Unsupported scope type: {scope['type']}")
+
+    async def _lifespan(self, receive: Callable, send: Callable):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    main.start_background_services(self.flask_app)
+                except Exception as e:
+                    logger.error(f"Failed to start background services: {str(e)}")
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                main.stop_background_services(self.flask_app)
+                self.executor.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope: Dict, receive: Callable, send: Callable):
+        for method, pattern, handler, route in self.routes:
+            if scope['method'] != method:
+                continue
+            match = pattern.match(scope['path'])
+            if match:
+                await self._native(scope, receive, send, handler, route, match.groupdict())
+                return
+        await self._wsgi(scope, receive, send)
+
+    @staticmethod
+    async def _read_body(receive: Callable) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+        return b''.join(chunks)
+
+    # 原生异步路由
+    async def _native(self, scope: Dict, receive: Callable, send: Callable, handler: Callable, route: str,
+                      params: Dict):
+        request_metrics = self.flask_app.extensions['metrics']
+        method = scope['method']
+        start = time.perf_counter()
+        request_metrics.in_flight.labels(method, route).inc()
+        try:
+            status, payload = await handler(scope, await self._read_body(receive), **params)
+        except ExecutorBusyError as e:
+            status, payload = 503, {'error': str(e)}
+        except Exception as e:
+            logger.error(f"Error handling {method} {scope['path']}: {str(e)}")
+            status, payload = 500, {'error': 'Internal server error'}
+        finally:
+            request_metrics.in_flight.labels(method, route).dec()
+
+        headers = list(JSON_HEADERS)
+        if any(name == b'origin' for name, _ in scope['headers']):
+            headers.append((b'access-control-allow-origin', b'*'))  # 与flask_cors的默认设置一致
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': serialization.dumps_bytes(payload)})
+
+        request_metrics.requests.labels(method, route, str(status)).inc()
+        request_metrics.latency.labels(method, route, str(status)).observe(time.perf_counter() - start)
+
+    async def chat(self, scope: Dict, body: bytes) -> Tuple[int, Dict]:
+        """处理聊天请求"""
+        try:
+            data = serialization.loads(body) if body else None
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            return 400, {'error': 'Invalid JSON body'}
+
+        user_message = data.get('message', '')
+        patient_id = data.get('patient_id', 'default')
+        if not user_message:
+            return 400, {'error': 'Message cannot be empty'}
+
+        response = await self.chat_service.process_message(user_message, patient_id)
+        return 200, {
+            'response': response,
+            'timestamp': datetime.now().isoformat(),
+            'status': 'success'
+        }
+
+    async def chat_history(self, scope: Dict, body: bytes, patient_id: str) -> Tuple[int, List]:
+        """获取聊天历史"""
+        return 200, await self.chat_service.get_chat_history(patient_id)
+
+    # WSGI桥接
+    def _environ(self, scope: Dict, body: bytes) -> Dict:
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client')
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': str(server[0]),
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0] if client else '',
+            'REMOTE_PORT': str(client[1]) if client else '',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope['headers']:
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                environ[name] = value
+                continue
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    def _call_flask(self, environ: Dict, start_response: Callable):
+        """在线程池中执行：调用Flask应用；长度已知且较小的响应体直接读出，避免再为每一块切换线程"""
+        result = self.flask_app(environ, start_response)
+        length = dict(start_response.headers).get(b'content-length')
+        if length is not None and int(length) <= INLINE_BODY_LIMIT:
+            try:
+                return b''.join(result), None
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        return None, result
+
+    async def _wsgi(self, scope: Dict, receive: Callable, send: Callable):
+        """在线程池中运行Flask应用，流式响应逐块发送"""
+        environ = self._environ(scope, await self._read_body(receive))
+
+        def start_response(status: str, headers: List[Tuple[str, str]], exc_info=None):
+            start_response.status = int(status.split(' ', 1)[0])
+            start_response.headers = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                      for name, value in headers]
+
+        try:
+            body, result = await self.executor.run(self._call_flask, environ, start_response)
+        except ExecutorBusyError as e:
+            await send({'type': 'http.response.start', 'status': 503, 'headers': list(JSON_HEADERS)})
+            await send({'type': 'http.response.body', 'body': serialization.dumps_bytes({'error': str(e)})})
+            return
+
+        await send({'type': 'http.response.start', 'status': start_response.status,
+                    'headers': start_response.headers})
+        if result is None:
+            await send({'type': 'http.response.body', 'body': body})
+            return
+
+        # 响应已经开始发送：后续读取不受max_pending限制，否则繁忙时会截断已接受的响应
+        try:
+            iterator = iter(result)
+            while True:
+                chunk = await self.executor.run(next, iterator, None, exempt=True)
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(result, 'close'):
+                try:
+                    await self.executor.run(result.close, exempt=True)
+                except Exception:
+                    result.close()  # 线程池已关闭等情况下直接在当前线程关闭，保证释放资源
+
+
+_app: Optional[AsgiApplication] = None
+
+
+def __getattr__(name: str):
+    """供 uvicorn asgi:app 使用：第一次访问 asgi.app 时才创建应用，直接运行本文件时只创建main_cli中的实例"""
+    global _app
+    if name == 'app':
+        if _app is None:
+            _app = AsgiApplication()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def run_builtin(application: AsgiApplication, host: str, port: int, max_connections: int):
+    server = AsgiHttpServer(application, host, port, max_connections=max_connections)
+
+    async def run():
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+        await server.serve(stop_event)
+
+    asyncio.run(run())
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Run the Virtual Diagnostician as an ASGI application')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS,
+                        help='Threads for database calls and bridged Flask routes')
+    parser.add_argument('--max-pending', type=int, default=DEFAULT_MAX_PENDING,
+                        help='Blocking calls allowed to wait for a thread before returning 503')
+    parser.add_argument('--max-connections', type=int, default=DEFAULT_MAX_CONNECTIONS,
+                        help='Open connections accepted by the built-in server')
+    parser.add_argument('--server', choices=['auto', 'uvicorn', 'builtin'], default='auto',
+                        help='auto: uvicorn when installed, otherwise the built-in asyncio server')
+    return parser
+
+
+def main_cli(argv=None):
+    args = build_parser().parse_args(argv)
+    application = AsgiApplication(threads=args.threads, max_pending=args.max_pending)
+
+    use_uvicorn = args.server == 'uvicorn' or (args.server == 'auto' and uvicorn is not None)
+    if use_uvicorn:
+        if uvicorn is None:
+            print("uvicorn is not installed: pip install uvicorn")
+            return 1
+        uvicorn.run(application, host=args.host, port=args.port, limit_concurrency=args.max_connections,
+                    lifespan='on')
+        return 0
+
+    try:
+        run_builtin(application, args.host, args.port, args.max_connections)
+    except OSError as e:
+        print(f"Cannot listen on port {args.port}: {str(e)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
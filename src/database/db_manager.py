@@ -1,7 +1,9 @@
+import time
 import sqlite3
 import logging
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, Iterator, List, Any, Optional
 import json
 
 logger = logging.getLogger(__name__)
@@ -9,6 +11,9 @@ logger = logging.getLogger(__name__)
 class DatabaseManager:
     """数据库管理器 - 处理SQLite数据库的所有操作"""
     
+    # 数据库结构版本（保存在PRAGMA user_version中），修改init_database中的表结构时加1
+    SCHEMA_VERSION = 4
+    
     def __init__(self, db_path: str = 'virtual_diagnostician.db'):
         import os
         # 确保数据库存储在data目录中
@@ -20,8 +25,11 @@ class DatabaseManager:
             self.db_path = os.path.join(data_dir, db_path)
         else:
             self.db_path = db_path
+        
+        # 语句耗时回调 (query, seconds)，用于指标统计
+        self.query_observers: List[Callable[[str, float], None]] = []
             
-        self.init_database()
+        self.ensure_schema()
     
     def get_connection(self) -> sqlite3.Connection:
         """获取数据库连接"""
@@ -29,6 +37,16 @@ class DatabaseManager:
         conn.row_factory = sqlite3.Row  # 返回字典格式的结果
         return conn
     
+    def ensure_schema(self):
+        """数据库结构不是最新版本时执行init_database（已是最新时只读取一次user_version）"""
+        conn = self.get_connection()
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+        finally:
+            conn.close()
+        if version < self.SCHEMA_VERSION:
+            self.init_database()
+    
     def init_database(self):
         """初始化数据库表结构"""
         with self.get_connection() as conn:
@@ -82,19 +100,156 @@ class DatabaseManager:
                 )
             ''')
             
+            # 训练数据清单表（Set-0目录索引）
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS training_manifest (
+                    patient_id TEXT PRIMARY KEY,
+                    file_path TEXT NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    name TEXT,
+                    gender TEXT,
+                    birthdate TEXT,
+                    birth_year INTEGER,
+                    blood_type TEXT,
+                    indexed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # 训练数据清单元信息（目录mtime、上次全量扫描时间等）
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS training_manifest_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            ''')
+            
+            # 导出文件目录表（代替每次列目录并stat所有文件）
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS export_catalog (
+                    filename TEXT PRIMARY KEY,
+                    patient_id TEXT,
+                    kind TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    sha256 TEXT,
+                    created_at TEXT NOT NULL,
+                    modified_at TEXT NOT NULL,
+                    storage TEXT DEFAULT 'file',  -- 'file': 导出目录中的文件; 'blob': 按内容哈希共享的存储
+                    export_timestamp TEXT  -- blob存储时单独保存的导出时间
+                )
+            ''')
+            self._add_missing_columns(conn, 'export_catalog', {
+                'storage': "TEXT DEFAULT 'file'",
+                'export_timestamp': 'TEXT'
+            })
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_export_catalog_modified
+                ON export_catalog (modified_at DESC, filename DESC)
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_export_catalog_patient
+                ON export_catalog (patient_id, modified_at DESC, filename DESC)
+            ''')
+            
+            # 导出内容存储（按sha256去重）及引用计数
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS export_blobs (
+                    sha256 TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    refcount INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # 后台导出任务表
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS export_jobs (
+                    id TEXT PRIMARY KEY,
+                    patient_id TEXT NOT NULL,
+                    status TEXT NOT NULL,  -- queued / running / completed / failed
+                    progress REAL DEFAULT 0,
+                    stage TEXT,
+                    filename TEXT,
+                    error TEXT,
+                    worker_pid INTEGER,  -- 执行任务的进程
+                    heartbeat_at TIMESTAMP,  -- 执行进程最近一次续租的时间，超时未续租的任务视为中断
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    started_at TIMESTAMP,
+                    finished_at TIMESTAMP
+                )
+            ''')
+            self._add_missing_columns(conn, 'export_jobs', {'heartbeat_at': 'TIMESTAMP'})
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_export_jobs_patient_status
+                ON export_jobs (patient_id, status)
+            ''')
+            
+            # 患者工作区按患者读取聊天记录和诊断记录
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_chat_messages_patient
+                ON chat_messages (patient_id, timestamp, id)
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_diagnosis_records_patient
+                ON diagnosis_records (patient_id, created_at)
+            ''')
+            
+            # 删除记录（墓碑），增量/差异备份据此在恢复时删除对应的行
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS deleted_rows (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    table_name TEXT NOT NULL,
+                    row_id NOT NULL,  -- 不声明类型，保留原主键的类型（TEXT或INTEGER）
+                    deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            for table in ('patients', 'chat_messages', 'diagnosis_records'):
+                conn.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS trg_{table}_deleted AFTER DELETE ON {table}
+                    BEGIN
+                        INSERT INTO deleted_rows (table_name, row_id) VALUES ('{table}', OLD.id);
+                    END
+                ''')
+            
+            conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
             conn.commit()
             logger.info("Database initialization completed")
     
+    @staticmethod
+    def _add_missing_columns(conn: sqlite3.Connection, table: str, columns: Dict[str, str]):
+        """为已存在的旧表补充新增的列"""
+        existing = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for column, definition in columns.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    
+    def add_query_observer(self, observer: Callable[[str, float], None]):
+        """注册语句耗时回调"""
+        self.query_observers.append(observer)
+    
+    @contextmanager
+    def _timed(self, query: str):
+        if not self.query_observers:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            for observer in self.query_observers:
+                observer(query, elapsed)
+    
     def execute_query(self, query: str, params: tuple = ()) -> List[Dict]:
         """执行查询语句"""
-        with self.get_connection() as conn:
+        with self._timed(query), self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(query, params)
             return [dict(row) for row in cursor.fetchall()]
     
     def execute_insert(self, query: str, params: tuple = ()) -> int:
         """执行插入语句，返回插入的ID"""
-        with self.get_connection() as conn:
+        with self._timed(query), self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(query, params)
             conn.commit()
@@ -102,12 +257,34 @@ class DatabaseManager:
     
     def execute_update(self, query: str, params: tuple = ()) -> int:
         """执行更新语句，返回受影响的行数"""
-        with self.get_connection() as conn:
+        with self._timed(query), self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(query, params)
             conn.commit()
             return cursor.rowcount
     
+    def execute_many(self, query: str, params_list: List[tuple]) -> int:
+        """批量执行语句（单个事务），返回受影响的行数"""
+        with self._timed(query), self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(query, params_list)
+            conn.commit()
+            return cursor.rowcount
+    
+    def iter_query(self, query: str, params: tuple = (), chunk_size: int = 1000) -> Iterator[List[Dict]]:
+        """分块执行查询，每次产出最多chunk_size行，内存占用与结果集大小无关"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield [dict(row) for row in rows]
+        finally:
+            conn.close()
+    
     # 患者相关操作
     def insert_patient(self, patient_data: Dict) -> str:
         """插入新患者"""
@@ -230,4 +407,54 @@ class DatabaseManager:
             if record['symptoms']:
                 record['symptoms'] = json.loads(record['symptoms'])
         
-        return results 
\ No newline at end of file
+        return results
+    
+    # 患者工作区
+    def get_patient_workspace(self, patient_id: str, message_limit: int = 50,
+                              include_patient: bool = True) -> Dict:
+        """在一个读事务中获取患者资料、诊断记录、最近一页聊天记录和对话统计"""
+        with self._timed('patient_workspace'), self.get_connection() as conn:
+            # 显式开启事务，保证几次读取看到同一个数据库快照
+            conn.execute("BEGIN")
+            try:
+                patient = None
+                if include_patient:
+                    row = conn.execute("SELECT * FROM patients WHERE id = ?", (patient_id,)).fetchone()
+                    if row is not None:
+                        patient = dict(row)
+                        if patient['medical_history']:
+                            patient['medical_history'] = json.loads(patient['medical_history'])
+                        if patient.get('original_format'):
+                            patient['original_format'] = json.loads(patient['original_format'])
+                
+                diagnoses = [dict(row) for row in conn.execute('''
+                    SELECT * FROM diagnosis_records
+                    WHERE patient_id = ?
+                    ORDER BY created_at DESC
+                ''', (patient_id,))]
+                for record in diagnoses:
+                    if record['symptoms']:
+                        record['symptoms'] = json.loads(record['symptoms'])
+                
+                # 最近的一页消息（倒序取出后恢复为时间正序）
+                messages = [dict(row) for row in conn.execute('''
+                    SELECT * FROM chat_messages
+                    WHERE patient_id = ?
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT ?
+                ''', (patient_id, message_limit))]
+                messages.reverse()
+                
+                stats = dict(conn.execute('''
+                    SELECT COUNT(*) AS total_messages,
+                           COALESCE(SUM(message_type = 'user'), 0) AS user_messages,
+                           COALESCE(SUM(message_type = 'assistant'), 0) AS assistant_messages,
+                           MIN(timestamp) AS first_message,
+                           MAX(timestamp) AS last_message
+                    FROM chat_messages
+                    WHERE patient_id = ?
+                ''', (patient_id,)).fetchone())
+            finally:
+                conn.rollback()  # 只读事务，不需要提交
+        
+        return {'patient': patient, 'diagnoses': diagnoses, 'messages': messages, 'stats': stats}
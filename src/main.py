@@ -1,34 +1,64 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Blueprint, Flask, Response, current_app, render_template, request, jsonify, send_from_directory
+from werkzeug.exceptions import NotFound
+from werkzeug.local import LocalProxy
 from flask_cors import CORS
+import os
+import time
 import logging
+import zipfile
 from datetime import datetime
+from typing import Optional
 
-from database.db_manager import DatabaseManager
-from services.chat_service import ChatService
-from services.patient_service import PatientService
-from services.training_data_service import TrainingDataService
-from utils.json_handler import JSONHandler
+from services.container import ServiceContainer
+from services.export_job_service import ExportJobService, ExportQueueFullError
+from utils.batch import BatchExecutor, BatchRequestError
+from utils.compression import ResponseCompressor, compress
+from utils import metrics
+from utils.serialization import FastJSONProvider
+from utils.static_assets import StaticAssets
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-CORS(app)  # 允许跨域请求
+bp = Blueprint('main', __name__)
 
-# 初始化服务
-db_manager = DatabaseManager()
-chat_service = ChatService(db_manager)
-patient_service = PatientService(db_manager)
-training_data_service = TrainingDataService(db_manager)
-json_handler = JSONHandler()
+# 当前应用的服务（第一次使用时才创建）
+services = LocalProxy(lambda: current_app.extensions['services'])
+chat_service = LocalProxy(lambda: services.chat_service)
+patient_service = LocalProxy(lambda: services.patient_service)
+training_data_service = LocalProxy(lambda: services.training_data_service)
+json_handler = LocalProxy(lambda: services.json_handler)
+export_job_service = LocalProxy(lambda: services.export_job_service)
+compressor = LocalProxy(lambda: current_app.extensions['compression'])
+batch_executor = LocalProxy(lambda: current_app.extensions['batch'])
 
-@app.route('/')
+def create_app(container: Optional[ServiceContainer] = None) -> Flask:
+    """创建应用（不创建任何服务，服务在第一次使用时由容器创建）"""
+    start = time.perf_counter()
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)  # jsonify使用更快的JSON编码器（有orjson时）
+    CORS(app)  # 允许跨域请求
+    
+    container = container or ServiceContainer()
+    app.extensions['services'] = container
+    
+    request_metrics = metrics.RequestMetrics(app)  # 请求延迟、数据库耗时等指标
+    container.add_query_observer(request_metrics.observe_query)
+    ResponseCompressor(app)  # 按Accept-Encoding压缩较大的JSON响应
+    app.extensions['batch'] = BatchExecutor(app)  # /api/batch 子请求执行器
+    StaticAssets(app)  # 静态资源URL附加内容指纹，并返回长期缓存头
+    
+    app.register_blueprint(bp)
+    logger.info(f"Application created in {(time.perf_counter() - start) * 1000:.1f}ms")
+    return app
+
+@bp.route('/')
 def index():
     """主页面"""
     return render_template('index.html')
 
-@app.route('/api/chat', methods=['POST'])
+@bp.route('/api/chat', methods=['POST'])
 def chat():
     """处理聊天请求"""
     try:
@@ -52,7 +82,20 @@ def chat():
         logger.error(f"Chat processing error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/api/patient/<patient_id>', methods=['GET'])
+@bp.route('/api/batch', methods=['POST'])
+def batch():
+    """批量请求：一次往返执行多个API子请求，按顺序返回各自的状态码和响应"""
+    try:
+        sub_requests = batch_executor.parse(request.get_json(silent=True))
+        return jsonify({'status': 'success', 'responses': batch_executor.execute(sub_requests)})
+    
+    except BatchRequestError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Batch request error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@bp.route('/api/patient/<patient_id>', methods=['GET'])
 def get_patient(patient_id):
     """获取患者信息"""
     try:
@@ -75,7 +118,32 @@ def get_patient(patient_id):
         logger.error(f"Error getting patient information: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/api/patient', methods=['POST'])
+@bp.route('/api/patient/<patient_id>/workspace', methods=['GET'])
+def get_patient_workspace(patient_id):
+    """获取患者工作区（资料、诊断、最近聊天记录和对话统计），聊天界面一次请求加载完成"""
+    try:
+        limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+        
+        profile = None
+        if patient_id.startswith('training_'):
+            profile = training_data_service.load_patient_from_file(patient_id.replace('training_', ''))
+            if not profile:
+                return jsonify({'error': 'Training patient not found'}), 404
+            profile['id'] = patient_id  # 保持training_前缀
+        
+        workspace = patient_service.get_patient_workspace(patient_id, limit, profile=profile)
+        # 'default' 是未选择患者时的对话，没有患者资料
+        if workspace['patient'] is None and patient_id != 'default':
+            return jsonify({'error': 'Patient not found'}), 404
+        
+        workspace['status'] = 'success'
+        return jsonify(workspace)
+    
+    except Exception as e:
+        logger.error(f"Error getting patient workspace: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@bp.route('/api/patient', methods=['POST'])
 def create_patient():
     """创建新患者"""
     try:
@@ -87,7 +155,7 @@ def create_patient():
         logger.error(f"Error creating patient: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/api/patients', methods=['GET'])
+@bp.route('/api/patients', methods=['GET'])
 def get_patients():
     """获取患者列表（仅普通患者）"""
     try:
@@ -99,7 +167,7 @@ def get_patients():
         logger.error(f"Error getting patient list: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/api/chat/history/<patient_id>', methods=['GET'])
+@bp.route('/api/chat/history/<patient_id>', methods=['GET'])
 def get_chat_history(patient_id):
     """获取聊天历史"""
     try:
@@ -110,7 +178,7 @@ def get_chat_history(patient_id):
         logger.error(f"Error getting chat history: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/api/export/patient/<patient_id>', methods=['GET'])
+@bp.route('/api/export/patient/<patient_id>', methods=['GET'])
 def export_patient_data(patient_id):
     """导出患者数据为JSON"""
     try:
@@ -152,20 +220,133 @@ def export_patient_data(patient_id):
         logger.error(f"Error exporting patient data: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@bp.route('/api/export/jobs', methods=['POST'])
+def create_export_job():
+    """提交后台导出任务（同一患者的重复任务会被合并）"""
+    try:
+        data = request.get_json(silent=True) or {}
+        patient_id = data.get('patient_id')
+        if not patient_id:
+            return jsonify({'error': 'patient_id is required'}), 400
+        
+        job = export_job_service.submit(patient_id)
+        return jsonify({'status': 'success', 'job': job}), 202
+    
+    except ExportQueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        logger.error(f"Error creating export job: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@bp.route('/api/export/jobs/<job_id>', methods=['GET'])
+def get_export_job(job_id):
+    """获取导出任务状态和进度"""
+    try:
+        job = export_job_service.get_job(job_id)
+        if not job:
+            return jsonify({'error': 'Export job not found'}), 404
+        return jsonify({'status': 'success', 'job': job})
+    
+    except Exception as e:
+        logger.error(f"Error getting export job: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@bp.route('/api/export/jobs/<job_id>/download', methods=['GET'])
+@compress(level=1)  # 导出文件较大且为流式发送，使用最快的压缩级别
+def download_export_job(job_id):
+    """下载已完成的导出任务文件"""
+    try:
+        job = export_job_service.get_job(job_id)
+        if not job:
+            return jsonify({'error': 'Export job not found'}), 404
+        if job['status'] != ExportJobService.COMPLETED:
+            return jsonify({'error': f"Export job is {job['status']}"}), 409
+        
+        if json_handler.get_export_entry(job['filename']) is None:
+            return jsonify({'error': 'Export file not found'}), 404
+        
+        # 按内容哈希存储的导出由export_path还原为完整文件
+        filepath = os.path.abspath(json_handler.export_path(job['filename']))
+        return send_from_directory(os.path.dirname(filepath), os.path.basename(filepath), as_attachment=True)
+    
+    except NotFound:
+        return jsonify({'error': 'Export file not found'}), 404
+    except Exception as e:
+        logger.error(f"Error downloading export: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@bp.route('/api/exports', methods=['GET'])
+def list_exports():
+    """获取导出文件列表（按修改时间倒序的游标分页，可按患者过滤）"""
+    try:
+        limit = request.args.get('limit', 50, type=int)
+        page = json_handler.list_exports(
+            limit=limit,
+            cursor=request.args.get('cursor'),
+            patient_id=request.args.get('patient_id'),
+            kind=request.args.get('kind')
+        )
+        return jsonify(page)
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error listing exports: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@bp.route('/api/exports/<filename>', methods=['DELETE'])
+def delete_export(filename):
+    """删除导出文件"""
+    try:
+        if json_handler.delete_export_file(filename):
+            return jsonify({'status': 'success', 'filename': filename})
+        return jsonify({'error': 'Export file not found'}), 404
+    
+    except Exception as e:
+        logger.error(f"Error deleting export: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus文本格式的运行指标"""
+    try:
+        return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+    
+    except Exception as e:
+        logger.error(f"Error rendering metrics: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@bp.route('/api/compression-stats', methods=['GET'])
+def get_compression_stats():
+    """获取响应压缩统计（压缩率和CPU耗时）"""
+    try:
+        return jsonify(compressor.get_stats())
+    
+    except Exception as e:
+        logger.error(f"Error getting compression stats: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 # 训练数据相关API端点
-@app.route('/api/training/patients', methods=['GET'])
+@bp.route('/api/training/patients', methods=['GET'])
 def get_training_patients():
-    """获取训练数据患者列表"""
+    """获取训练数据患者列表（按ID排序的游标分页）"""
     try:
+        cursor = request.args.get('cursor')
         limit = request.args.get('limit', 20, type=int)
-        patients = training_data_service.load_training_patients(limit)
-        return jsonify(patients)
+        fields = request.args.get('fields')
+        fields = [field.strip() for field in fields.split(',') if field.strip()] if fields else None
+        
+        page = training_data_service.get_training_patients_page(cursor, limit, fields)
+        return jsonify(page)
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     except Exception as e:
         logger.error(f"Error getting training patients: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/api/training/patient/<patient_id>', methods=['GET'])
+@bp.route('/api/training/patient/<patient_id>', methods=['GET'])
 def get_training_patient(patient_id):
     """获取单个训练数据患者信息"""
     try:
@@ -182,7 +363,7 @@ def get_training_patient(patient_id):
         logger.error(f"Error getting training patient: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/api/training/summary', methods=['GET'])
+@bp.route('/api/training/summary', methods=['GET'])
 def get_training_summary():
     """获取训练数据统计信息"""
     try:
@@ -193,7 +374,17 @@ def get_training_summary():
         logger.error(f"Error getting training summary: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/api/training/import', methods=['POST'])
+@bp.route('/api/training/cache-stats', methods=['GET'])
+def get_training_cache_stats():
+    """获取训练数据记录缓存命中率"""
+    try:
+        return jsonify(training_data_service.get_cache_stats())
+    
+    except Exception as e:
+        logger.error(f"Error getting training cache stats: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@bp.route('/api/training/import', methods=['POST'])
 def import_training_patients():
     """将训练数据患者导入到数据库"""
     try:
@@ -207,7 +398,7 @@ def import_training_patients():
         logger.error(f"Error importing training patients: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/api/training/import-json', methods=['POST'])
+@bp.route('/api/training/import-json', methods=['POST'])
 def import_json_to_training():
     """导入JSON文件到训练数据Set-0文件夹"""
     try:
@@ -258,7 +449,37 @@ def import_json_to_training():
         logger.error(f"Error importing JSON file: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/api/training/rename-patient', methods=['POST'])
+@bp.route('/api/training/import-bulk', methods=['POST'])
+def import_bulk_to_training():
+    """批量导入zip压缩包或NDJSON数据到训练数据Set-0文件夹"""
+    try:
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file provided'}), 400
+        
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'error': 'No file selected'}), 400
+        
+        # 根据文件扩展名选择读取方式，记录逐条流式处理
+        if file.filename.endswith('.zip'):
+            records = training_data_service.iter_zip_records(file.stream)
+        elif file.filename.endswith(('.ndjson', '.jsonl')):
+            records = training_data_service.iter_ndjson_records(file.stream)
+        else:
+            return jsonify({'error': 'File must be a .zip, .ndjson or .jsonl file'}), 400
+        
+        workers = request.args.get('workers', type=int)
+        report = training_data_service.import_records_to_set0(records, workers)
+        return jsonify(report)
+    
+    except zipfile.BadZipFile:
+        return jsonify({'error': 'Invalid zip archive'}), 400
+    
+    except Exception as e:
+        logger.error(f"Error importing bulk training data: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@bp.route('/api/training/rename-patient', methods=['POST'])
 def rename_training_patient():
     """重命名训练数据患者文件夹"""
     try:
@@ -285,16 +506,19 @@ def rename_training_patient():
         logger.error(f"Error renaming patient: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+def start_background_services(app: Flask):
+    """启动后台服务（开发服务器启动时，或多进程部署时在每个工作进程fork之后调用）"""
+    app.extensions['services'].start_background_services()
+
+def stop_background_services(app: Flask):
+    """停止后台服务（工作进程退出前调用）"""
+    app.extensions['batch'].shutdown()
+    app.extensions['services'].shutdown()
+
 if __name__ == '__main__':
-    # 初始化数据库
-    db_manager.init_database()
-    
-    # 创建示例患者数据
-    try:
-        patient_service.create_sample_patients()
-        logger.info("Sample patient data creation completed")
-    except Exception as e:
-        logger.info("Sample patients already exist or creation failed")
+    # 数据库初始化和示例数据由一次性命令完成: python manage.py bootstrap
+    app = create_app()
+    start_background_services(app)
     
     print("🏥 Virtual Diagnostic System Starting...")
     print("📋 System Features:")
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+虚拟诊断助手管理命令
+用法: python manage.py <命令> [参数]
+"""
+
+import os
+import sys
+import logging
+import argparse
+
+from database.db_manager import DatabaseManager
+from services.container import ServiceContainer
+from services.training_data_service import TrainingDataService
+from utils.json_handler import JSONHandler
+from utils.backup import available_compressions, verify_backup
+from utils.backup_chain import BACKUP_TYPES
+from utils.backup_restore import BackupRestorer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def cmd_bootstrap(args):
+    """一次性初始化：创建数据库结构并写入示例患者（服务器启动时不再执行）"""
+    result = ServiceContainer().bootstrap(sample_data=not args.no_sample_data)
+    
+    print(f"Database ready: {result['db_path']}")
+    print(f"Export files cataloged: {result['exports_cataloged']}")
+    print(f"Sample patients created: {result['sample_patients_created']}")
+    return True
+
+def cmd_migrate_layout(args):
+    """在线迁移训练数据目录布局（flat <-> sharded）"""
+    training_data_service = TrainingDataService(DatabaseManager(), training_data_path=args.root)
+    resolver = training_data_service.resolver
+
+    print(f"Migrating {resolver.root}: {resolver.layout} -> {args.layout}")
+    stats = resolver.migrate(args.layout)
+
+    # 迁移后路径发生变化，同步清单
+    training_data_service.manifest.refresh(force=True)
+
+    print(f"Moved: {stats['moved']}, skipped: {stats['skipped']}, failed: {stats['failed']}")
+    return stats['failed'] == 0
+
+def cmd_backup(args):
+    """流式导出压缩的数据库备份"""
+    db_manager = DatabaseManager()
+    json_handler = JSONHandler(args.output_dir or 'exports', db_manager)
+    result = json_handler.export_database_backup_stream(db_manager, args.compression,
+                                                        args.chunk_size, args.type)
+    
+    print(f"Backup written: {os.path.join(json_handler.export_dir, result['filename'])} "
+          f"({result['backup_type']}, {result['size']} bytes)")
+    for table, count in result['counts'].items():
+        print(f"  {table}: {count} rows")
+    return True
+
+def cmd_compact_backups(args):
+    """把备份链（全量 + 差异 + 增量）合并为新的全量备份"""
+    json_handler = JSONHandler(args.output_dir or 'exports', DatabaseManager())
+    chain = json_handler.get_backup_chain()
+    
+    files = [entry['filename'] for entry in chain.current_chain()]
+    if not files:
+        print("No full backup found")
+        return False
+    print(f"Compacting {len(files)} backups: {', '.join(files)}")
+    
+    result = chain.compact(args.compression, args.chunk_size)
+    json_handler.register_export(result['filename'], kind='backup')
+    print(f"Full backup written: {result['filename']}")
+    for table, count in result['counts'].items():
+        print(f"  {table}: {count} rows")
+    return True
+
+def cmd_export_files(args):
+    """把按内容哈希存储的导出还原为导出目录中的普通文件"""
+    json_handler = JSONHandler(args.output_dir or 'exports', DatabaseManager())
+    stats = json_handler.materialize_exports(patient_id=args.patient)
+    
+    print(f"Export files written to {json_handler.export_dir}: {stats['written']} "
+          f"(already present: {stats['existing']})")
+    return True
+
+def cmd_verify_backup(args):
+    """校验备份文件的行数和校验和"""
+    result = verify_backup(args.path)
+    if not result['valid']:
+        print(f"Invalid backup: {result['error']}")
+        return False
+    
+    print(f"Backup OK ({result['header']['backup_type']}, created {result['header']['created_at']})")
+    for table, count in result['counts'].items():
+        print(f"  {table}: {count} rows")
+    return True
+
+def cmd_restore(args):
+    """从（压缩的）备份文件或备份链批量恢复数据库"""
+    if args.chain:
+        json_handler = JSONHandler(args.output_dir or 'exports')
+        paths = [os.path.join(json_handler.export_dir, entry['filename'])
+                 for entry in json_handler.get_backup_chain().current_chain()]
+    else:
+        paths = args.paths
+    if not paths:
+        print("No backup files to restore")
+        return False
+    
+    restorer = BackupRestorer(DatabaseManager(), chunk_size=args.chunk_size)
+    print(f"Restoring {len(paths)} backup file(s) into {restorer.db_manager.db_path}")
+    stats = restorer.restore(paths, resume=not args.no_resume, clear=args.clear, verify=not args.no_verify)
+    
+    for table, count in stats['tables'].items():
+        print(f"  {table}: {count} rows")
+    if stats['tombstones']:
+        print(f"Applied deletions: {stats['tombstones']}")
+    if stats['skipped_invalid']:
+        print(f"Skipped invalid rows: {stats['skipped_invalid']}")
+    print(f"Restored {stats['rows']} rows in {stats['seconds']}s ({stats['rows_per_sec']} rows/sec)")
+    return True
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Virtual Diagnostician management commands')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    bootstrap = subparsers.add_parser('bootstrap', help='Create the database schema and seed sample patients (run once)')
+    bootstrap.add_argument('--no-sample-data', action='store_true', help='Only create the schema')
+    bootstrap.set_defaults(func=cmd_bootstrap)
+    
+    migrate = subparsers.add_parser('migrate-layout', help='Migrate training data folders between flat and sharded layouts')
+    migrate.add_argument('layout', choices=['flat', 'sharded'], help='Target layout')
+    migrate.add_argument('--root', help='Training data folder (default: training_data/Set-0)')
+    migrate.set_defaults(func=cmd_migrate_layout)
+    
+    backup = subparsers.add_parser('backup', help='Write a streaming, compressed database backup')
+    backup.add_argument('--type', choices=BACKUP_TYPES, default='full',
+                        help='incremental: changes since the last backup; differential: changes since the last full backup')
+    backup.add_argument('--compression', choices=available_compressions(), default='gzip')
+    backup.add_argument('--chunk-size', type=int, default=1000, help='Rows fetched per database round trip')
+    backup.add_argument('--output-dir', help='Backup folder (default: exports)')
+    backup.set_defaults(func=cmd_backup)
+    
+    compact = subparsers.add_parser('compact-backups', help='Merge the current backup chain into a new full backup')
+    compact.add_argument('--compression', choices=available_compressions(), default='gzip')
+    compact.add_argument('--chunk-size', type=int, default=1000, help='Rows per batch')
+    compact.add_argument('--output-dir', help='Backup folder (default: exports)')
+    compact.set_defaults(func=cmd_compact_backups)
+    
+    restore = subparsers.add_parser('restore', help='Bulk-load backup files into the database (resumable)')
+    restore.add_argument('paths', nargs='*', help='Backup files, applied in order (full backup first)')
+    restore.add_argument('--chain', action='store_true', help='Restore the current backup chain from the backup folder')
+    restore.add_argument('--output-dir', help='Backup folder for --chain (default: exports)')
+    restore.add_argument('--chunk-size', type=int, default=5000, help='Rows per transaction')
+    restore.add_argument('--clear', action='store_true', help='Empty the tables before loading')
+    restore.add_argument('--no-resume', action='store_true', help='Ignore an existing checkpoint and start over')
+    restore.add_argument('--no-verify', action='store_true', help='Skip the checksum pass before loading')
+    restore.set_defaults(func=cmd_restore)
+    
+    export_files = subparsers.add_parser('export-files',
+                                         help='Write deduplicated exports back into the export folder as plain files')
+    export_files.add_argument('--patient', help='Only this patient\'s exports')
+    export_files.add_argument('--output-dir', help='Export folder (default: exports)')
+    export_files.set_defaults(func=cmd_export_files)
+    
+    verify = subparsers.add_parser('verify-backup', help='Check the counts and checksums of a backup file')
+    verify.add_argument('path', help='Backup file')
+    verify.set_defaults(func=cmd_verify_backup)
+
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    success = args.func(args)
+    return 0 if success else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
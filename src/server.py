@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+虚拟诊断助手生产环境服务器（多进程预派生 + 线程池）
+用法: python server.py [--host HOST] [--port PORT] [--workers N] [--threads N] [--max-queued N] [--server auto|gunicorn|prefork]
+
+安装gunicorn时默认使用gunicorn，否则使用内置的预派生服务器。
+主进程只负责监听端口和管理工作进程，应用和服务（数据库、缓存、线程池、目录监视）
+在每个工作进程fork之后才导入和创建，进程之间不共享任何连接或线程。
+训练数据目录监视器通过文件锁只在一个工作进程中运行，其他工作进程只读取共享的清单。
+
+信号（内置服务器）:
+    SIGHUP          平滑重载：启动新的工作进程后，让旧的工作进程处理完当前请求再退出
+    SIGTERM/SIGINT  平滑停止
+    SIGTTIN/SIGTTOU 增加/减少一个工作进程
+"""
+
+import os
+import sys
+import time
+import errno
+import signal
+import socket
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(process)d] %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger('server')
+
+try:
+    # 可选依赖：安装gunicorn后优先使用
+    import gunicorn.app.base as gunicorn_base
+except ImportError:
+    gunicorn_base = None
+
+DEFAULT_WORKERS = min(os.cpu_count() or 1, 4)
+DEFAULT_THREADS = 8
+DEFAULT_MAX_QUEUED = 64  # 每个工作进程中已接受但等待线程的连接数上限
+GRACEFUL_TIMEOUT = 30.0
+
+_app = None  # 本工作进程的应用
+
+
+def prepare_database():
+    """启动前在主进程中执行一次：创建或升级数据库结构（此后才fork工作进程，避免多个进程同时建表）"""
+    from database.db_manager import DatabaseManager
+    DatabaseManager()
+
+
+def load_application():
+    """在工作进程中创建应用（fork之后），并启动本进程的后台服务"""
+    global _app
+    import main
+    _app = main.create_app()
+    main.start_background_services(_app)
+    return _app
+
+
+def stop_application():
+    """工作进程退出前停止后台服务"""
+    if _app is not None:
+        import main
+        main.stop_background_services(_app)
+
+
+# 内置预派生服务器
+SERVICE_UNAVAILABLE = (b'HTTP/1.1 503 Service Unavailable\r\nContent-Type: application/json\r\n'
+                       b'Content-Length: 30\r\nRetry-After: 1\r\nConnection: close\r\n\r\n'
+                       b'{"error": "Server overloaded"}')
+
+
+def _make_wsgi_server(listener: socket.socket, app, threads: int, max_queued: int = DEFAULT_MAX_QUEUED):
+    from werkzeug.serving import BaseWSGIServer
+
+    class PooledWSGIServer(BaseWSGIServer):
+        """在固定大小的线程池中处理请求的WSGI服务器（werkzeug的线程服务器每个连接一个线程，没有上限）
+
+        正在处理和等待线程的连接合计不超过 threads + max_queued，超出时直接返回503并关闭连接，
+        线程池的任务队列不会无限增长。
+        """
+
+        multithread = True
+        daemon_threads = True
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='http')
+            self.slots = threading.BoundedSemaphore(threads + max_queued)
+            self.rejected = 0
+
+        def process_request(self, request, client_address):
+            if not self.slots.acquire(blocking=False):
+                self._reject(request)
+                return
+            try:
+                self.pool.submit(self._process_request, request, client_address)
+            except RuntimeError:  # 线程池已关闭
+                self.slots.release()
+                self.shutdown_request(request)
+
+        def _reject(self, request):
+            self.rejected += 1
+            try:
+                request.settimeout(1.0)
+                request.sendall(SERVICE_UNAVAILABLE)
+            except OSError:
+                pass
+            finally:
+                self.shutdown_request(request)
+
+        def _process_request(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                self.slots.release()
+
+        def server_close(self):
+            super().server_close()
+            if hasattr(self, 'pool'):
+                self.pool.shutdown(wait=True)
+
+    host, port = listener.getsockname()[:2]
+    return PooledWSGIServer(host, port, app, fd=listener.fileno())
+
+
+def _worker_main(listener: socket.socket, threads: int, max_queued: int = DEFAULT_MAX_QUEUED):
+    """工作进程入口：导入应用、处理请求，收到SIGTERM后处理完当前请求再退出"""
+    for sig in (signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+        signal.signal(sig, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # 由主进程统一处理Ctrl+C
+
+    app = load_application()
+    server = _make_wsgi_server(listener, app, threads, max_queued)
+    listener.close()  # werkzeug已复制了监听套接字
+
+    def handle_term(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, handle_term)
+    logger.info(f"Worker ready ({threads} threads, {max_queued} queued connections)")
+
+    try:
+        server.serve_forever(poll_interval=0.5)
+    finally:
+        server.server_close()  # 等待线程池中的请求处理完成
+        stop_application()
+    logger.info("Worker exited")
+
+
+class PreforkServer:
+    """预派生多进程服务器 - 主进程监听端口并管理工作进程，工作进程共享监听套接字"""
+
+    def __init__(self, host: str, port: int, workers: int = DEFAULT_WORKERS, threads: int = DEFAULT_THREADS,
+                 graceful_timeout: float = GRACEFUL_TIMEOUT, backlog: int = 2048,
+                 max_queued: int = DEFAULT_MAX_QUEUED):
+        self.host = host
+        self.port = port
+        self.num_workers = workers
+        self.threads = threads
+        self.max_queued = max_queued
+        self.graceful_timeout = graceful_timeout
+        self.backlog = backlog
+
+        self.listener: Optional[socket.socket] = None
+        self.workers: Dict[int, float] = {}    # pid -> 启动时间
+        self.retiring: Dict[int, float] = {}   # pid -> 收到SIGTERM的时间
+        self._signals = []
+        self._stopping = False
+
+    def _bind(self):
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        self.listener = socket.socket(family, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((self.host, self.port))
+        self.listener.listen(self.backlog)
+        self.listener.set_inheritable(True)
+        self.port = self.listener.getsockname()[1]
+
+    def _spawn_worker(self):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = time.time()
+            return
+
+        # 子进程
+        exit_code = 0
+        try:
+            _worker_main(self.listener, self.threads, self.max_queued)
+        except Exception as e:
+            logger.error(f"Worker failed: {str(e)}")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    def _retire(self, pids):
+        for pid in pids:
+            self.workers.pop(pid, None)
+            self.retiring[pid] = time.time()
+            self._kill(pid, signal.SIGTERM)
+
+    @staticmethod
+    def _kill(pid: int, sig: int):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def _reap(self):
+        """回收已退出的工作进程"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            if self.workers.pop(pid, None) is not None:
+                logger.warning(f"Worker {pid} exited unexpectedly (status {status})")
+            self.retiring.pop(pid, None)
+
+    def _kill_stale(self):
+        """超过平滑超时仍未退出的旧工作进程强制结束"""
+        now = time.time()
+        for pid, since in list(self.retiring.items()):
+            if now - since > self.graceful_timeout:
+                logger.warning(f"Worker {pid} did not exit in {self.graceful_timeout}s, killing it")
+                self._kill(pid, signal.SIGKILL)
+
+    def _handle_signal(self, signum, frame):
+        self._signals.append(signum)
+
+    def _process_signals(self):
+        while self._signals:
+            signum = self._signals.pop(0)
+            if signum in (signal.SIGTERM, signal.SIGINT):
+                self._stopping = True
+            elif signum == signal.SIGHUP:
+                logger.info("Reloading: starting new workers and retiring the old ones")
+                old = list(self.workers)
+                for _ in range(self.num_workers):
+                    self._spawn_worker()
+                self._retire(old)
+            elif signum == signal.SIGTTIN:
+                self.num_workers += 1
+            elif signum == signal.SIGTTOU and self.num_workers > 1:
+                self.num_workers -= 1
+
+    def run(self):
+        self._bind()
+        logger.info(f"Listening on http://{self.host}:{self.port} "
+                    f"({self.num_workers} workers x {self.threads} threads, pid {os.getpid()})")
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+            signal.signal(sig, self._handle_signal)
+
+        try:
+            while not self._stopping:
+                self._reap()
+                self._process_signals()
+                if self._stopping:
+                    break
+
+                # 保持工作进程数量
+                while len(self.workers) < self.num_workers:
+                    self._spawn_worker()
+                if len(self.workers) > self.num_workers:
+                    self._retire(sorted(self.workers, key=self.workers.get)[:len(self.workers) - self.num_workers])
+
+                self._kill_stale()
+                time.sleep(0.2)
+        finally:
+            self.stop()
+
+    def stop(self):
+        """平滑停止：通知所有工作进程处理完当前请求后退出"""
+        logger.info("Shutting down workers")
+        self._retire(list(self.workers))
+        deadline = time.time() + self.graceful_timeout
+        while self.retiring and time.time() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self.retiring):
+            self._kill(pid, signal.SIGKILL)
+        self._reap()
+        if self.listener is not None:
+            self.listener.close()
+
+
+# gunicorn
+def run_gunicorn(host: str, port: int, workers: int, threads: int, graceful_timeout: float):
+    """使用gunicorn运行（每个工作进程fork后导入应用）"""
+
+    class Application(gunicorn_base.BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('graceful_timeout', graceful_timeout)
+            self.cfg.set('preload_app', False)
+            self.cfg.set('on_starting', lambda arbiter: prepare_database())
+            self.cfg.set('worker_exit', lambda arbiter, worker: stop_application())
+
+        def load(self):
+            return load_application()
+
+    Application().run()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Run the Virtual Diagnostician with multiple worker processes')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Worker processes')
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS, help='Request threads per worker')
+    parser.add_argument('--max-queued', type=int, default=DEFAULT_MAX_QUEUED,
+                        help='Accepted connections per worker that may wait for a thread before returning 503 (prefork)')
+    parser.add_argument('--graceful-timeout', type=float, default=GRACEFUL_TIMEOUT,
+                        help='Seconds a retiring worker may spend finishing its requests')
+    parser.add_argument('--server', choices=['auto', 'gunicorn', 'prefork'], default='auto',
+                        help='auto: gunicorn when installed, otherwise the bundled prefork server')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not hasattr(os, 'fork'):
+        print("The multi-process server needs os.fork (Linux/macOS)")
+        return 1
+
+    use_gunicorn = args.server == 'gunicorn' or (args.server == 'auto' and gunicorn_base is not None)
+    if use_gunicorn:
+        if gunicorn_base is None:
+            print("gunicorn is not installed: pip install gunicorn")
+            return 1
+        run_gunicorn(args.host, args.port, args.workers, args.threads, args.graceful_timeout)
+        return 0
+
+    prepare_database()
+    try:
+        PreforkServer(args.host, args.port, args.workers, args.threads, args.graceful_timeout,
+                      max_queued=args.max_queued).run()
+    except OSError as e:
+        if e.errno == errno.EADDRINUSE:
+            print(f"Port {args.port} is in use")
+            return 1
+        raise
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from services.chat_service import ChatService
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THREADS = 8
+DEFAULT_MAX_PENDING = 1000
+
+
+class ExecutorBusyError(RuntimeError):
+    """等待执行的阻塞调用已达上限"""
+
+
+class BlockingExecutor:
+    """有界阻塞调用执行器 - 在固定大小的线程池中执行SQLite读写、文件读取等阻塞调用
+
+    事件循环只在调用真正执行期间占用一个线程，等待中的请求只占用一个协程；
+    等待执行的调用超过max_pending时直接拒绝（ExecutorBusyError），而不是无限排队；
+    exempt=True的调用（如已开始发送的流式响应的后续读取）计入pending但不会被拒绝。
+    只能在事件循环线程中调用run()（计数不加锁）。
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_THREADS, max_pending: int = DEFAULT_MAX_PENDING,
+                 thread_name_prefix: str = 'blocking'):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+
+    async def run(self, fn: Callable, *args, exempt: bool = False, **kwargs):
+        if self.pending >= self.max_pending and not exempt:
+            raise ExecutorBusyError(f'Too many pending blocking calls (limit {self.max_pending})')
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self.pending -= 1
+
+    def get_stats(self) -> Dict:
+        return {'threads': self.max_workers, 'pending': self.pending, 'max_pending': self.max_pending}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+class AsyncChatService:
+    """异步聊天服务 - 按ChatService的步骤处理消息，数据库读写在执行器中进行
+
+    处理一条消息时只有两次写入各占用一次线程，生成回复期间（以后是模型推理）不占用线程，
+    因此同时进行中的对话数量不再受线程数限制。
+    """
+
+    def __init__(self, chat_service: ChatService, executor: BlockingExecutor):
+        self.chat_service = chat_service
+        self.executor = executor
+
+    async def process_message(self, user_message: str, patient_id: str = 'default') -> str:
+        """处理用户消息"""
+        try:
+            await self.executor.run(self.chat_service.save_user_message, patient_id, user_message)
+            response = await self.generate_response(user_message, patient_id)
+            await self.executor.run(self.chat_service.save_response, patient_id, user_message, response)
+            return response
+
+        except ExecutorBusyError:
+            raise
+        except Exception as e:
+            logger.error(f"Error processing message: {str(e)}")
+            return self.chat_service.FALLBACK_RESPONSE
+
+    async def generate_response(self, message: str, patient_id: str) -> str:
+        """生成AI回复（基于规则，不阻塞；接入模型推理时在这里await）"""
+        return self.chat_service.generate_response(message, patient_id)
+
+    async def get_chat_history(self, patient_id: str, limit: int = 50) -> List[Dict]:
+        """获取聊天历史"""
+        return await self.executor.run(self.chat_service.get_chat_history, patient_id, limit)
@@ -57,25 +57,40 @@ class ChatService:
             }
         }
     
+    # 处理失败时返回给用户的回复
+    FALLBACK_RESPONSE = "Sorry, I encountered a technical issue. Please try again later."
+    
     def process_message(self, user_message: str, patient_id: str = 'default') -> str:
         """处理用户消息"""
         try:
             # 保存用户消息
-            self.db_manager.insert_chat_message(patient_id, 'user', user_message)
+            self.save_user_message(patient_id, user_message)
             
             # 生成回复
-            response = self._generate_response(user_message, patient_id)
+            response = self.generate_response(user_message, patient_id)
             
             # 保存AI回复
-            self.db_manager.insert_chat_message(patient_id, 'assistant', response)
-            
-            logger.info(f"Processed message - Patient: {patient_id}, Message: {user_message[:50]}...")
+            self.save_response(patient_id, user_message, response)
             
             return response
             
         except Exception as e:
             logger.error(f"Error processing message: {str(e)}")
-            return "Sorry, I encountered a technical issue. Please try again later."
+            return self.FALLBACK_RESPONSE
+    
+    # 处理消息的各个步骤（异步入口在线程池中分别执行两次写入）
+    def save_user_message(self, patient_id: str, user_message: str):
+        """保存用户消息"""
+        self.db_manager.insert_chat_message(patient_id, 'user', user_message)
+    
+    def generate_response(self, message: str, patient_id: str) -> str:
+        """生成AI回复（基于规则，不访问数据库）"""
+        return self._generate_response(message, patient_id)
+    
+    def save_response(self, patient_id: str, user_message: str, response: str):
+        """保存AI回复"""
+        self.db_manager.insert_chat_message(patient_id, 'assistant', response)
+        logger.info(f"Processed message - Patient: {patient_id}, Message: {user_message[:50]}...")
     
     def _generate_response(self, message: str, patient_id: str) -> str:
         """生成AI回复"""
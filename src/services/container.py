@@ -0,0 +1,130 @@
+import os
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+    """服务容器 - 按需创建并缓存应用使用的服务
+
+    创建容器本身没有任何副作用：数据库连接、训练数据清单、导出线程池等都在第一次访问时才创建，
+    因此导入应用、创建应用和fork工作进程都很快，测试也可以只创建用到的服务。
+    服务之间的依赖通过属性访问自动按需创建。
+    """
+
+    def __init__(self, db_path: Optional[str] = None, export_dir: str = 'exports',
+                 training_data_path: Optional[str] = None):
+        self.db_path = db_path
+        self.export_dir = export_dir
+        self.training_data_path = training_data_path
+
+        self._lock = threading.RLock()
+        self._instances: Dict[str, object] = {}
+        self._query_observers: List[Callable[[str, float], None]] = []
+
+    def _get(self, name: str, factory: Callable[[], object]):
+        instance = self._instances.get(name)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(name)
+                if instance is None:
+                    instance = factory()
+                    self._instances[name] = instance
+                    logger.debug(f"Service created: {name}")
+        return instance
+
+    def is_created(self, name: str) -> bool:
+        return name in self._instances
+
+    def add_query_observer(self, observer: Callable[[str, float], None]):
+        """注册数据库语句耗时回调（数据库管理器创建后生效，不会因此提前创建）"""
+        with self._lock:
+            self._query_observers.append(observer)
+            if self.is_created('db_manager'):
+                self.db_manager.add_query_observer(observer)
+
+    # 服务
+    @property
+    def db_manager(self):
+        def factory():
+            from database.db_manager import DatabaseManager
+            db_manager = DatabaseManager(self.db_path) if self.db_path else DatabaseManager()
+            for observer in self._query_observers:
+                db_manager.add_query_observer(observer)
+            return db_manager
+        return self._get('db_manager', factory)
+
+    @property
+    def chat_service(self):
+        def factory():
+            from services.chat_service import ChatService
+            return ChatService(self.db_manager)
+        return self._get('chat_service', factory)
+
+    @property
+    def patient_service(self):
+        def factory():
+            from services.patient_service import PatientService
+            return PatientService(self.db_manager)
+        return self._get('patient_service', factory)
+
+    @property
+    def training_data_service(self):
+        def factory():
+            from services.training_data_service import TrainingDataService
+            return TrainingDataService(self.db_manager, training_data_path=self.training_data_path)
+        return self._get('training_data_service', factory)
+
+    @property
+    def training_watcher(self):
+        def factory():
+            from services.training_watcher import TrainingDataWatcher
+            # 锁文件与数据库放在一起：共用同一个数据库的进程中只有一个监视目录
+            lock_path = os.path.join(os.path.dirname(os.path.abspath(self.db_manager.db_path)),
+                                     'training-watcher.lock')
+            return TrainingDataWatcher(self.training_data_service, lock_path=lock_path)
+        return self._get('training_watcher', factory)
+
+    @property
+    def json_handler(self):
+        def factory():
+            from utils.json_handler import JSONHandler
+            return JSONHandler(self.export_dir, db_manager=self.db_manager)
+        return self._get('json_handler', factory)
+
+    @property
+    def export_job_service(self):
+        def factory():
+            from services.export_job_service import ExportJobService
+            return ExportJobService(self.db_manager, self.patient_service, self.chat_service,
+                                    self.training_data_service, self.json_handler)
+        return self._get('export_job_service', factory)
+
+    # 生命周期
+    def bootstrap(self, sample_data: bool = True) -> Dict:
+        """一次性初始化：创建/升级数据库结构，登记导出目录中已有的文件，并创建示例患者"""
+        self.db_manager.init_database()
+        exports = self.json_handler.sync_catalog()
+        created = 0
+        if sample_data:
+            before = self.db_manager.execute_query("SELECT COUNT(*) AS count FROM patients")[0]['count']
+            self.patient_service.create_sample_patients()
+            created = self.db_manager.execute_query("SELECT COUNT(*) AS count FROM patients")[0]['count'] - before
+        return {'db_path': self.db_manager.db_path, 'exports_cataloged': exports['total'],
+                'sample_patients_created': created}
+
+    def start_background_services(self):
+        """启动后台服务（开发服务器启动时，或多进程部署时在每个工作进程fork之后调用）"""
+        # 监视训练数据目录，保持清单和缓存与磁盘同步
+        self.training_watcher.start()
+
+    def shutdown(self):
+        """停止已创建的后台服务"""
+        if self.is_created('training_watcher'):
+            self.training_watcher.stop()
+        if self.is_created('export_job_service'):
+            self.export_job_service.shutdown()
+        if self.is_created('training_data_service'):
+            self.training_data_service.shutdown()
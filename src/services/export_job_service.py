@@ -0,0 +1,212 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Optional
+from database.db_manager import DatabaseManager
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+class ExportQueueFullError(RuntimeError):
+    """等待中的导出任务已达上限"""
+
+class ExportJobService:
+    """导出任务服务 - 在有界线程池中异步导出患者数据，任务状态保存在SQLite中
+
+    同一患者已有排队或运行中的任务时，新的请求直接返回该任务（合并重复任务）。
+    执行进程每隔HEARTBEAT_INTERVAL秒为本进程排队或运行中的任务续租（heartbeat_at）；
+    超过LEASE_SECONDS未续租的任务（进程已退出或被杀死）在提交和查询时被标记为失败。
+    """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+    # 续租间隔和租约有效期（秒）
+    HEARTBEAT_INTERVAL = 15
+    LEASE_SECONDS = 60
+
+    def __init__(self, db_manager: DatabaseManager, patient_service, chat_service, training_data_service,
+                 json_handler, max_workers: int = 2, max_pending: int = 100):
+        self.db_manager = db_manager
+        self.patient_service = patient_service
+        self.chat_service = chat_service
+        self.training_data_service = training_data_service
+        self.json_handler = json_handler
+        self.max_pending = max_pending
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='export-job')
+        self._lock = threading.Lock()
+        self._active: Dict[str, str] = {}  # 患者ID -> 排队或运行中的任务ID
+
+        # 续租线程在第一次提交任务时启动；创建服务不访问数据库
+        self._heartbeat_thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._last_expiry_check = 0.0
+
+        metrics.registry.register_collector('export_jobs', self._collect_metrics)
+
+    # 租约
+    def _ensure_heartbeat(self):
+        if self._heartbeat_thread is None:
+            self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name='export-job-heartbeat',
+                                                      daemon=True)
+            self._heartbeat_thread.start()
+
+    def _heartbeat_loop(self):
+        while not self._stop_event.wait(self.HEARTBEAT_INTERVAL):
+            with self._lock:
+                job_ids = [(job_id,) for job_id in self._active.values()]
+            if not job_ids:
+                continue
+            try:
+                self.db_manager.execute_many(
+                    "UPDATE export_jobs SET heartbeat_at = CURRENT_TIMESTAMP WHERE id = ?", job_ids
+                )
+            except Exception as e:
+                logger.error(f"Export job heartbeat failed: {str(e)}")
+
+    def _expire_stale_jobs(self, force: bool = False):
+        """租约过期的未完成任务标记为失败（查询时每个续租间隔最多检查一次）"""
+        now = time.monotonic()
+        if not force and now - self._last_expiry_check < self.HEARTBEAT_INTERVAL:
+            return
+        self._last_expiry_check = now
+        expired = self.db_manager.execute_update(
+            f"UPDATE export_jobs SET status = '{self.FAILED}', stage = 'failed', "
+            f"error = 'Interrupted: the worker process stopped', finished_at = CURRENT_TIMESTAMP "
+            f"WHERE status IN (?, ?) AND COALESCE(heartbeat_at, created_at) < datetime('now', ?)",
+            (*self.ACTIVE_STATUSES, f'-{self.LEASE_SECONDS} seconds')
+        )
+        if expired:
+            logger.info(f"Marked {expired} interrupted export jobs as failed")
+
+    # 提交与查询
+    def submit(self, patient_id: str) -> Dict:
+        """提交导出任务，返回任务信息（coalesced表示合并到了已有任务）"""
+        with self._lock:
+            # 先查本进程，再查数据库（其他工作进程提交的任务，租约过期的不再合并）
+            job_id = self._active.get(patient_id)
+            if job_id is None:
+                self._expire_stale_jobs(force=True)
+                active = self.db_manager.execute_query(
+                    "SELECT id FROM export_jobs WHERE patient_id = ? AND status IN (?, ?) "
+                    "ORDER BY created_at DESC LIMIT 1", (patient_id, *self.ACTIVE_STATUSES)
+                )
+                job_id = active[0]['id'] if active else None
+            if job_id is not None:
+                job = self.get_job(job_id)
+                if job is not None:
+                    job['coalesced'] = True
+                    return job
+                # 任务记录在查询后被删除：不再合并，创建新任务
+                if self._active.get(patient_id) == job_id:
+                    del self._active[patient_id]
+
+            if len(self._active) >= self.max_pending:
+                raise ExportQueueFullError('Too many pending export jobs')
+
+            job_id = uuid.uuid4().hex
+            self.db_manager.execute_insert(
+                "INSERT INTO export_jobs (id, patient_id, status, progress, stage, worker_pid, heartbeat_at) "
+                "VALUES (?, ?, ?, 0, ?, ?, CURRENT_TIMESTAMP)",
+                (job_id, patient_id, self.QUEUED, 'queued', os.getpid())
+            )
+            self._active[patient_id] = job_id
+            self._ensure_heartbeat()
+
+        self._executor.submit(self._run, job_id, patient_id)
+        logger.info(f"Export job queued: {job_id} (patient {patient_id})")
+
+        job = self.get_job(job_id)
+        job['coalesced'] = False
+        return job
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """获取任务状态和进度"""
+        self._expire_stale_jobs()
+        results = self.db_manager.execute_query("SELECT * FROM export_jobs WHERE id = ?", (job_id,))
+        return results[0] if results else None
+
+    def get_stats(self) -> Dict:
+        """获取任务统计"""
+        rows = self.db_manager.execute_query("SELECT status, COUNT(*) AS count FROM export_jobs GROUP BY status")
+        with self._lock:
+            active = len(self._active)
+        return {
+            'active': active,
+            'max_pending': self.max_pending,
+            'by_status': {row['status']: row['count'] for row in rows}
+        }
+
+    def _collect_metrics(self):
+        stats = self.get_stats()
+        return [
+            ('export_jobs', 'gauge', 'Export jobs by status',
+             [({'status': status}, count) for status, count in sorted(stats['by_status'].items())]),
+            ('export_jobs_pending', 'gauge', 'Export jobs queued or running in this process', [({}, stats['active'])]),
+        ]
+
+    # 执行
+    def _update(self, job_id: str, timestamp_column: Optional[str] = None, **fields):
+        """更新任务字段（同时续租）；timestamp_column指定的列设为当前时间"""
+        columns = [f"{column} = ?" for column in fields] + ["heartbeat_at = CURRENT_TIMESTAMP"]
+        if timestamp_column:
+            columns.append(f"{timestamp_column} = CURRENT_TIMESTAMP")
+        self.db_manager.execute_update(f"UPDATE export_jobs SET {', '.join(columns)} WHERE id = ?",
+                                       (*fields.values(), job_id))
+
+    def _run(self, job_id: str, patient_id: str):
+        try:
+            self._update(job_id, 'started_at', status=self.RUNNING, stage='loading patient', progress=0.1)
+            filename = self._export(job_id, patient_id)
+            self._update(job_id, 'finished_at', status=self.COMPLETED, stage='completed', progress=1.0,
+                         filename=filename)
+            logger.info(f"Export job completed: {job_id} -> {filename}")
+
+        except Exception as e:
+            logger.error(f"Export job failed: {job_id}: {str(e)}")
+            self._update(job_id, 'finished_at', status=self.FAILED, stage='failed', error=str(e))
+
+        finally:
+            with self._lock:
+                if self._active.get(patient_id) == job_id:
+                    del self._active[patient_id]
+
+    def _export(self, job_id: str, patient_id: str) -> str:
+        """导出患者数据并返回文件名（与 /api/export/patient/<id> 的内容一致）"""
+        if patient_id.startswith('training_'):
+            export_data = self.training_data_service.export_training_patient(patient_id)
+            if not export_data:
+                raise ValueError('Training patient not found')
+            self._update(job_id, stage='writing file', progress=0.7)
+            return self.json_handler.save_training_patient_data(
+                patient_id.replace('training_', '', 1), export_data['data']
+            )
+
+        patient_data = self.patient_service.get_patient_by_id(patient_id)
+
+        self._update(job_id, stage='loading chat history', progress=0.4)
+        chat_history = self.chat_service.get_chat_history(patient_id)
+
+        self._update(job_id, stage='writing file', progress=0.7)
+        export_data = {
+            'patient_info': patient_data,
+            'chat_history': chat_history,
+            'export_timestamp': datetime.now().isoformat()
+        }
+        return self.json_handler.save_patient_data(patient_id, export_data)
+
+    def shutdown(self, wait: bool = True):
+        """停止线程池和续租线程"""
+        self._executor.shutdown(wait=wait)
+        self._stop_event.set()
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join()
+            self._heartbeat_thread = None
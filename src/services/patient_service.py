@@ -59,7 +59,45 @@ class PatientService:
         except Exception as e:
             logger.error(f"Error getting patient information: {str(e)}")
             return None
-    
+
+    def get_patient_workspace(self, patient_id: str, message_limit: int = 50,
+                              profile: Optional[Dict] = None) -> Dict:
+        """获取患者工作区：资料、诊断记录、最近一页聊天记录和对话统计（一次数据库读事务）
+
+        profile不为空时（训练数据患者）直接使用该资料，不再查询患者表。
+        """
+        workspace = self.db_manager.get_patient_workspace(patient_id, message_limit,
+                                                          include_patient=profile is None)
+        patient = profile if profile is not None else workspace['patient']
+        if patient is not None:
+            patient['diagnoses'] = workspace['diagnoses']
+            if profile is None:
+                patient = self._format_patient_data(patient)
+
+        messages = workspace['messages']
+        stats = workspace['stats']
+        return {
+            'patient': patient,
+            'chat_history': [
+                {
+                    'id': msg['id'],
+                    'type': msg['message_type'],
+                    'content': msg['content'],
+                    'timestamp': msg['timestamp']
+                }
+                for msg in messages
+            ],
+            'has_more_history': stats['total_messages'] > len(messages),
+            'conversation': {
+                'total_messages': stats['total_messages'],
+                'user_messages': stats['user_messages'],
+                'assistant_messages': stats['assistant_messages'],
+                'first_conversation': stats['first_message'],
+                'last_conversation': stats['last_message'],
+                'patient_id': patient_id
+            }
+        }
+
     def update_patient(self, patient_id: str, patient_data: Dict) -> bool:
         """更新患者信息"""
         try:
@@ -1,23 +1,78 @@
 import os
+import re
+import copy
 import json
+import time
+import base64
 import logging
+import zipfile
+import threading
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Any, Dict, IO, Iterable, Iterator, List, Optional, Tuple
 from database.db_manager import DatabaseManager
+from services.training_manifest import TrainingManifest
+from utils.record_cache import RecordCache
+from utils.parallel_loader import create_loader_pool, iter_parallel, parallel_map
+from utils.path_resolver import PatientPathResolver
+from utils.validation import ValidationSummary, training_patient_validator
+from utils import metrics, serialization
 
 logger = logging.getLogger(__name__)
 
 class TrainingDataService:
     """训练数据服务 - 处理Set-0文件夹下的患者数据读取和导出"""
     
-    def __init__(self, db_manager: DatabaseManager):
+    # 分页接口单页最大条数
+    MAX_PAGE_SIZE = 500
+    
+    # 可以直接由清单提供、无需读取患者文件的字段
+    MANIFEST_FIELDS = {'id', 'name', 'age', 'gender', 'birthdate', 'blood_type', 'source'}
+    
+    # 批量导入时每批解析、验证和写入的记录数
+    IMPORT_BATCH_SIZE = 500
+    
+    # 批量导入报告中最多列出的失败记录数
+    MAX_REPORTED_FAILURES = 100
+    
+    def __init__(self, db_manager: DatabaseManager, cache_size: int = 1024,
+                 loader_workers: Optional[int] = None, training_data_path: Optional[str] = None):
         self.db_manager = db_manager
         # 训练数据路径
-        self.training_data_path = os.path.join(
+        self.training_data_path = training_data_path or os.path.join(
             os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 
             'training_data', 'Set-0'
         )
         logger.info(f"Training data path: {self.training_data_path}")
+        # 患者路径解析器（兼容扁平和分片目录布局）
+        self.resolver = PatientPathResolver(self.training_data_path)
+        # Set-0目录清单，避免每次请求都遍历和解析所有文件
+        self.manifest = TrainingManifest(db_manager, self.resolver)
+        # 已格式化患者记录缓存，文件变化时自动失效
+        self.record_cache = RecordCache(cache_size)
+        metrics.registry.register_cache('training_records', self.record_cache.get_stats)
+        # 并行读取患者文件的线程数（None表示使用默认值）
+        self.loader_workers = loader_workers
+        # 读取线程池在第一次使用时创建，之后所有请求共用（fork之后才会启动线程）
+        self._loader_pool = None
+        self._pool_lock = threading.Lock()
+        # 分配患者ID并创建目录时加锁，避免并发导入时ID冲突
+        self._id_lock = threading.Lock()
+    
+    @property
+    def loader_pool(self):
+        """共用的读取线程池"""
+        if self._loader_pool is None:
+            with self._pool_lock:
+                if self._loader_pool is None:
+                    self._loader_pool = create_loader_pool(self.loader_workers)
+        return self._loader_pool
+    
+    def shutdown(self):
+        """关闭读取线程池"""
+        with self._pool_lock:
+            pool, self._loader_pool = self._loader_pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
     
     def load_training_patients(self, limit: int = 20) -> List[Dict]:
         """加载训练数据患者列表"""
@@ -27,19 +82,17 @@ class TrainingDataService:
                 return []
             
             patients = []
-            patient_dirs = [d for d in os.listdir(self.training_data_path) 
-                          if d.startswith('patient_') and os.path.isdir(os.path.join(self.training_data_path, d))]
+            self.manifest.refresh()
             
-            # 限制读取数量
-            patient_dirs = patient_dirs[:limit]
+            # 从清单中按ID顺序取前limit个患者，并行读取文件
+            patient_ids = [entry['patient_id'] for entry in self.manifest.list_patients(limit)]
+            results = parallel_map(self.load_patient_from_file, patient_ids, executor=self.loader_pool)
             
-            for patient_dir in patient_dirs:
-                patient_id = patient_dir.replace('patient_', '')
-                patient_data = self.load_patient_from_file(patient_id)
-                
+            for result in results:
+                patient_data = result.value
                 if patient_data:
                     # 添加training前缀以区分训练数据
-                    patient_data['id'] = f'training_{patient_id}'
+                    patient_data['id'] = f'training_{result.item}'
                     patient_data['source'] = 'training_data'
                     patients.append(patient_data)
             
@@ -50,41 +103,115 @@ class TrainingDataService:
             logger.error(f"Error loading training patients: {str(e)}")
             return []
     
+    def get_training_patients_page(self, cursor: Optional[str] = None, limit: int = 20,
+                                   fields: Optional[List[str]] = None) -> Dict:
+        """按患者ID排序的游标分页，每页只读取本页需要的文件
+
+        fields只包含清单字段时完全不读取患者文件；cursor无效时抛出ValueError。
+        """
+        limit = max(1, min(limit, self.MAX_PAGE_SIZE))
+        after = self._decode_cursor(cursor) if cursor else None
+        
+        self.manifest.refresh()
+        # 多取一条用于判断是否还有下一页
+        entries = self.manifest.list_patients(limit + 1, after=after)
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        
+        if fields and set(fields) <= self.MANIFEST_FIELDS:
+            current_year = datetime.now().year
+            patients = [
+                {
+                    'id': f"training_{entry['patient_id']}",
+                    'name': entry['name'] or f"Patient {entry['patient_id']}",
+                    'age': current_year - entry['birth_year'] if entry['birth_year'] else None,
+                    'gender': entry['gender'],
+                    'birthdate': entry['birthdate'],
+                    'blood_type': entry['blood_type'],
+                    'source': 'training_data'
+                }
+                for entry in entries
+            ]
+        else:
+            patients = []
+            patient_ids = [entry['patient_id'] for entry in entries]
+            for result in parallel_map(self.load_patient_from_file, patient_ids, executor=self.loader_pool):
+                if result.value:
+                    result.value['id'] = f'training_{result.item}'
+                    result.value['source'] = 'training_data'
+                    patients.append(result.value)
+        
+        # 稀疏字段选择（id始终返回）
+        if fields:
+            selected = set(fields) | {'id'}
+            patients = [{key: value for key, value in patient.items() if key in selected} for patient in patients]
+        
+        return {
+            'patients': patients,
+            'next_cursor': self._encode_cursor(entries[-1]['patient_id']) if has_more else None,
+            'has_more': has_more,
+            'limit': limit
+        }
+    
+    @staticmethod
+    def _encode_cursor(patient_id: str) -> str:
+        return base64.urlsafe_b64encode(patient_id.encode('utf-8')).decode('ascii')
+    
+    @staticmethod
+    def _decode_cursor(cursor: str) -> str:
+        try:
+            return base64.b64decode(cursor.encode('ascii'), altchars=b'-_', validate=True).decode('utf-8')
+        except Exception:
+            raise ValueError(f'Invalid cursor: {cursor}')
+    
     def load_patient_from_file(self, patient_id: str) -> Optional[Dict]:
         """从文件加载单个患者数据"""
         try:
             # 构造文件路径
-            patient_dir = f'patient_{patient_id}'
-            patient_file = f'patient_{patient_id}_history.json'
-            file_path = os.path.join(self.training_data_path, patient_dir, patient_file)
+            file_path = self.resolver.history_file(patient_id)
             
-            if not os.path.exists(file_path):
+            try:
+                file_stat = os.stat(file_path)
+            except FileNotFoundError:
                 logger.warning(f"Patient file not found: {file_path}")
                 return None
             
-            with open(file_path, 'r', encoding='utf-8') as f:
-                raw_data = json.load(f)
-            
-            # 转换为统一格式
-            formatted_data = self._format_training_patient_data(raw_data, patient_id)
-            return formatted_data
+            # 文件未变化时直接使用缓存的格式化结果
+            formatted_data = self.record_cache.get(file_path, file_stat)
+            if formatted_data is None:
+                raw_data = serialization.load_file(file_path)
+                
+                # 转换为统一格式
+                formatted_data = self._format_training_patient_data(raw_data, patient_id)
+                if not formatted_data:
+                    return formatted_data
+                self.record_cache.put(file_path, file_stat, formatted_data)
+            
+            # 返回深拷贝：嵌套的medical_history、original_format与缓存不共享，调用方可以任意修改；
+            # 年龄随当前日期变化，每次读取时重新计算
+            patient = copy.deepcopy(formatted_data)
+            patient['age'] = self._calculate_age(patient.get('birthdate'))
+            return patient
             
         except Exception as e:
             logger.error(f"Error loading patient {patient_id}: {str(e)}")
             return None
     
+    @staticmethod
+    def _calculate_age(birthdate: Optional[str]) -> Optional[int]:
+        """按出生日期计算当前年龄"""
+        if not birthdate:
+            return None
+        try:
+            return datetime.now().year - int(str(birthdate).split('-')[0])
+        except ValueError:
+            return None
+    
     def _format_training_patient_data(self, raw_data: Dict, patient_id: str) -> Dict:
         """格式化训练数据患者信息"""
         try:
             # 计算年龄（如果有出生日期）
-            age = None
-            if raw_data.get('birthdate'):
-                try:
-                    birth_year = int(raw_data['birthdate'].split('-')[0])
-                    current_year = datetime.now().year
-                    age = current_year - birth_year
-                except:
-                    pass
+            age = self._calculate_age(raw_data.get('birthdate'))
             
             # 转换性别格式
             gender_map = {'M': 'Male', 'F': 'Female'}
@@ -147,50 +274,33 @@ class TrainingDataService:
             logger.error(f"Error exporting training patient: {str(e)}")
             return None
     
+    def get_cache_stats(self) -> Dict:
+        """获取患者记录缓存的命中统计"""
+        return self.record_cache.get_stats()
+    
     def get_training_patients_summary(self) -> Dict:
         """获取训练数据患者统计信息"""
         try:
             if not os.path.exists(self.training_data_path):
                 return {'error': 'Training data path not found'}
             
-            # 统计患者数量
-            patient_dirs = [d for d in os.listdir(self.training_data_path) 
-                          if d.startswith('patient_') and os.path.isdir(os.path.join(self.training_data_path, d))]
-            
-            total_patients = len(patient_dirs)
-            
-            # 读取一些样本数据进行统计
-            sample_size = min(50, total_patients)
-            sample_patients = []
-            
-            for i, patient_dir in enumerate(patient_dirs[:sample_size]):
-                patient_id = patient_dir.replace('patient_', '')
-                patient_data = self.load_patient_from_file(patient_id)
-                if patient_data:
-                    sample_patients.append(patient_data)
-            
-            # 统计性别分布
-            gender_stats = {}
-            age_stats = {'known': 0, 'unknown': 0, 'average': 0.0}
+            self.manifest.refresh()
             
-            ages = []
-            for patient in sample_patients:
-                gender = patient.get('gender', 'Unknown')
-                gender_stats[gender] = gender_stats.get(gender, 0) + 1
-                
-                if patient.get('age'):
-                    ages.append(patient['age'])
-                    age_stats['known'] += 1
-                else:
-                    age_stats['unknown'] += 1
+            # 基于清单的全量精确统计（无需读取患者文件）；
+            # 与原实现一致，年龄为0（今年出生）的患者计为年龄未知
+            current_year = datetime.now().year
+            statistics = self.manifest.get_statistics(exclude_birth_year=current_year)
+            total_patients = statistics['total']
+            known = statistics['known_birth_year']
             
-            if ages:
-                age_stats['average'] = sum(ages) / len(ages)
+            age_stats = {'known': known, 'unknown': total_patients - known, 'average': 0.0}
+            if known:
+                age_stats['average'] = current_year - statistics['average_birth_year']
             
             return {
                 'total_patients': total_patients,
-                'sample_size': len(sample_patients),
-                'gender_distribution': gender_stats,
+                'sample_size': total_patients,
+                'gender_distribution': statistics['gender_distribution'],
                 'age_statistics': age_stats,
                 'data_path': self.training_data_path,
                 'last_updated': datetime.now().isoformat()
@@ -238,24 +348,37 @@ class TrainingDataService:
             # 解析JSON数据
             data = json.loads(file_content)
             
-            # 验证必要字段
-            if not data.get('name'):
-                raise ValueError('Missing required field: name')
+            result = self._write_record_to_set0(data, original_filename)
             
-            # 尝试从文件名提取患者ID
-            import re
-            import time
+            self.record_cache.invalidate_prefix(os.path.dirname(result['file_path']))
+            self.manifest.upsert_patient(result['patient_id'])
+            logger.info(f"Successfully imported JSON data to: {result['file_path']}")
             
-            patient_id = None
-            filename_match = re.search(r'patient_(\d+)', original_filename)
+            return result
             
+        except json.JSONDecodeError as e:
+            logger.error(f"Invalid JSON format: {str(e)}")
+            return {'error': f'Invalid JSON format: {str(e)}', 'status': 'failed'}
+        
+        except Exception as e:
+            logger.error(f"Error importing JSON to Set-0: {str(e)}")
+            return {'error': str(e), 'status': 'failed'}
+    
+    def _write_record_to_set0(self, data: Dict, original_filename: str) -> Dict:
+        """分配患者ID并写入患者文件（失败时抛出异常）"""
+        # 验证必要字段
+        if not data.get('name'):
+            raise ValueError('Missing required field: name')
+        
+        # 尝试从文件名提取患者ID
+        filename_match = re.search(r'patient_(\d+)', original_filename)
+        
+        with self._id_lock:
+            patient_id = None
             if filename_match:
                 extracted_id = filename_match.group(1)
                 # 检查是否已存在
-                patient_dir = f'patient_{extracted_id}'
-                patient_dir_path = os.path.join(self.training_data_path, patient_dir)
-                
-                if not os.path.exists(patient_dir_path):
+                if not self.resolver.exists(extracted_id):
                     patient_id = extracted_id
                     logger.info(f"Using ID from filename: {patient_id}")
                 else:
@@ -263,85 +386,155 @@ class TrainingDataService:
             
             # 如果无法从文件名提取ID或ID已存在，则生成新的时间戳ID
             if not patient_id:
-                patient_id = str(int(time.time() * 1000))  # 毫秒时间戳
+                timestamp_id = int(time.time() * 1000)  # 毫秒时间戳
+                while self.resolver.exists(str(timestamp_id)):
+                    timestamp_id += 1
+                patient_id = str(timestamp_id)
                 logger.info(f"Generated new timestamp ID: {patient_id}")
             
-            # 确保Set-0目录存在
-            if not os.path.exists(self.training_data_path):
-                os.makedirs(self.training_data_path, exist_ok=True)
-            
-            # 创建患者目录
-            patient_dir = f'patient_{patient_id}'
-            patient_dir_path = os.path.join(self.training_data_path, patient_dir)
+            # 创建患者目录（在锁内创建以占用该ID）
+            patient_dir_path = self.resolver.patient_dir(patient_id)
             os.makedirs(patient_dir_path, exist_ok=True)
-            
-            # 创建JSON文件
-            filename = f'patient_{patient_id}_history.json'
-            file_path = os.path.join(patient_dir_path, filename)
-            
-            # 保存JSON数据
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=4, ensure_ascii=False)
-            
-            logger.info(f"Successfully imported JSON data to: {file_path}")
-            
-            return {
-                'status': 'success',
-                'patient_id': patient_id,
-                'filename': filename,
-                'file_path': file_path,
-                'message': f'Data imported successfully as {filename}',
-                'id_source': 'filename' if filename_match and patient_id == filename_match.group(1) else 'generated'
-            }
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON format: {str(e)}")
-            return {'error': f'Invalid JSON format: {str(e)}', 'status': 'failed'}
         
-        except Exception as e:
-            logger.error(f"Error importing JSON to Set-0: {str(e)}")
-            return {'error': str(e), 'status': 'failed'}
+        # 创建JSON文件
+        filename = f'patient_{patient_id}_history.json'
+        file_path = os.path.join(patient_dir_path, filename)
+        
+        # 保存JSON数据
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+        
+        return {
+            'status': 'success',
+            'patient_id': patient_id,
+            'filename': filename,
+            'file_path': file_path,
+            'message': f'Data imported successfully as {filename}',
+            'id_source': 'filename' if filename_match and patient_id == filename_match.group(1) else 'generated'
+        }
     
-    def validate_json_format(self, data: Dict) -> Dict:
-        """验证JSON数据格式"""
-        errors = []
-        warnings = []
+    def import_records_to_set0(self, records: Iterable[Tuple[str, Any]], max_workers: Optional[int] = None) -> Dict:
+        """批量导入记录到Set-0文件夹
         
-        # 必需字段检查
-        required_fields = ['name']
-        for field in required_fields:
-            if not data.get(field):
-                errors.append(f'Missing required field: {field}')
+        records为 (来源名称, JSON文本或文件对象) 的迭代器，按批处理：线程池并行解析，
+        整批按列验证，再并行写入。每次只保留一批记录，报告只包含计数和前
+        MAX_REPORTED_FAILURES条失败记录，因此内存占用与导入总量无关。
+        """
+        report = {'status': 'success', 'total': 0, 'imported': 0, 'failed': 0, 'failures': []}
+        summary = ValidationSummary()
+        workers = max_workers or self.loader_workers
         
-        # 推荐字段检查
-        recommended_fields = ['birthdate', 'gender', 'blood_type', 'address', 'weight', 'height']
-        for field in recommended_fields:
-            if not data.get(field):
-                warnings.append(f'Missing recommended field: {field}')
+        batch = []
+        for item in records:
+            batch.append(item)
+            if len(batch) >= self.IMPORT_BATCH_SIZE:
+                self._import_bulk_batch(batch, workers, report, summary)
+                batch = []
+        if batch:
+            self._import_bulk_batch(batch, workers, report, summary)
         
-        # 数据类型检查
-        if data.get('weight') and not isinstance(data['weight'], (int, float)):
-            errors.append('Weight should be a number')
+        report['failures_truncated'] = report['failed'] > len(report['failures'])
+        report['validation'] = summary.to_dict()
+        logger.info(f"Bulk import finished: {report['imported']} imported, {report['failed']} failed")
+        return report
+    
+    def _import_bulk_batch(self, batch: List[Tuple[str, Any]], workers: int,
+                           report: Dict, summary: ValidationSummary):
+        """解析、验证并写入一批记录，计数累加到报告，失败记录按输入顺序追加"""
+        errors: List[Optional[str]] = [None] * len(batch)
         
-        if data.get('height') and not isinstance(data['height'], (int, float)):
-            errors.append('Height should be a number')
+        # 并行解析
+        parsed = []
+        for index, result in enumerate(parallel_map(self._parse_bulk_record, batch, workers, executor=self.loader_pool)):
+            if result.error is not None:
+                errors[index] = str(result.error)
+            else:
+                parsed.append((index, result.item[0], result.value))
         
-        if data.get('gender') and data['gender'] not in ['M', 'F', 'Male', 'Female']:
-            warnings.append('Gender should be M/F or Male/Female')
+        # 整批按列验证
+        validation = training_patient_validator.validate_batch([data for _, _, data in parsed])
+        summary.merge(validation)
         
-        return {
-            'valid': len(errors) == 0,
-            'errors': errors,
-            'warnings': warnings
-        }
+        pending = []
+        for (index, source, data), check in zip(parsed, validation['records']):
+            if check['valid']:
+                pending.append((index, source, data))
+            else:
+                errors[index] = '; '.join(check['errors'])
+        
+        # 并行写入
+        manifest_rows = []
+        for result in parallel_map(self._write_bulk_record, pending, workers, executor=self.loader_pool):
+            if result.error is not None:
+                errors[result.item[0]] = str(result.error)
+            else:
+                manifest_rows.append(result.value)
+        
+        if manifest_rows:
+            self.manifest.upsert_rows(manifest_rows)
+        
+        report['total'] += len(batch)
+        report['imported'] += len(manifest_rows)
+        for (source, _), error in zip(batch, errors):
+            if error is None:
+                continue
+            report['failed'] += 1
+            if len(report['failures']) < self.MAX_REPORTED_FAILURES:
+                report['failures'].append({'source': source, 'error': error})
+    
+    @staticmethod
+    def _parse_bulk_record(item: Tuple[str, Any]) -> Any:
+        """解析单条批量导入记录（文件对象在这里读取并关闭）"""
+        content = item[1]
+        if hasattr(content, 'read'):
+            with content:
+                content = content.read()
+        if isinstance(content, bytes):
+            content = content.decode('utf-8')
+        try:
+            return serialization.loads(content)
+        except json.JSONDecodeError as e:
+            raise ValueError(f'Invalid JSON format: {str(e)}')
+    
+    def _write_bulk_record(self, item: Tuple[int, str, Dict]) -> Tuple:
+        """写入单条已验证的记录，返回清单记录"""
+        _, source, data = item
+        result = self._write_record_to_set0(data, source)
+        return self.manifest.build_row(result['patient_id'], raw_data=data)
+    
+    @staticmethod
+    def iter_zip_records(fileobj: IO[bytes]) -> Iterator[Tuple[str, IO[bytes]]]:
+        """逐个打开zip压缩包中的JSON文件，成员在解析时才解压读取"""
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                name = os.path.basename(info.filename)
+                if info.is_dir() or not name.endswith('.json') or info.filename.startswith('__MACOSX/'):
+                    continue
+                yield name, archive.open(info)
+    
+    @staticmethod
+    def iter_ndjson_records(fileobj: IO[bytes]) -> Iterator[Tuple[str, bytes]]:
+        """逐行读取NDJSON数据流"""
+        for line_number, line in enumerate(fileobj, 1):
+            line = line.strip()
+            if line:
+                yield f'line_{line_number}', line
+    
+    def validate_json_format(self, data: Dict) -> Dict:
+        """验证JSON数据格式"""
+        return training_patient_validator.validate(data)
+    
+    def validate_json_batch(self, records: List[Any]) -> Dict:
+        """按列批量验证多条JSON记录，返回汇总报告"""
+        return training_patient_validator.validate_batch(records)
     
     def rename_patient_folder(self, old_patient_id: str, new_patient_id: str) -> Dict:
         """重命名患者文件夹和文件"""
         try:
             old_dir = f'patient_{old_patient_id}'
             new_dir = f'patient_{new_patient_id}'
-            old_dir_path = os.path.join(self.training_data_path, old_dir)
-            new_dir_path = os.path.join(self.training_data_path, new_dir)
+            old_dir_path = self.resolver.patient_dir(old_patient_id)
+            new_dir_path = self.resolver.patient_dir(new_patient_id)
             
             # 检查源文件夹是否存在
             if not os.path.exists(old_dir_path):
@@ -351,8 +544,11 @@ class TrainingDataService:
             if os.path.exists(new_dir_path):
                 return {'error': f'Target patient folder already exists: {new_dir}', 'status': 'failed'}
             
-            # 重命名文件夹
+            # 重命名文件夹（分片布局下目标分片目录可能尚不存在）
+            os.makedirs(os.path.dirname(new_dir_path), exist_ok=True)
             os.rename(old_dir_path, new_dir_path)
+            self.record_cache.invalidate_prefix(old_dir_path)
+            self.record_cache.invalidate_prefix(new_dir_path)
             
             # 重命名文件夹内的JSON文件
             old_filename = f'patient_{old_patient_id}_history.json'
@@ -362,6 +558,8 @@ class TrainingDataService:
             
             if os.path.exists(old_file_path):
                 os.rename(old_file_path, new_file_path)
+                self.manifest.remove_patient(old_patient_id)
+                self.manifest.upsert_patient(new_patient_id)
                 logger.info(f"Renamed patient folder from {old_dir} to {new_dir}")
                 
                 return {
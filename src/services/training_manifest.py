@@ -0,0 +1,417 @@
+import os
+import time
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+from database.db_manager import DatabaseManager
+from utils.path_resolver import PatientPathResolver
+from utils import serialization
+
+logger = logging.getLogger(__name__)
+
+class TrainingManifest:
+    """训练数据清单 - 在SQLite中持久化Set-0目录索引，按mtime增量刷新"""
+
+    # 两次stat扫描之间的最短间隔（秒）：监视器未运行时，文件内容修改最多在这段时间后开始反映到清单
+    DEFAULT_MAX_AGE = 5
+
+    # 每批写入清单的记录数
+    BATCH_SIZE = 500
+
+    GENDER_MAP = {'M': 'Male', 'F': 'Female'}
+
+    def __init__(self, db_manager: DatabaseManager, resolver: PatientPathResolver, max_age: int = DEFAULT_MAX_AGE):
+        self.db_manager = db_manager
+        self.resolver = resolver
+        self.max_age = max_age
+        # 目录监视器运行时由其负责同步清单，读取时无需扫描目录
+        self.watcher_active = False
+        # 本进程的后台扫描线程（同一时间最多一个）
+        self._scan_lock = threading.Lock()
+        self._scan_thread: Optional[threading.Thread] = None
+
+    # 路径相关（统一由路径解析器处理目录布局）
+    @property
+    def training_data_path(self) -> str:
+        return self.resolver.root
+
+    def patient_dir(self, patient_id: str) -> str:
+        """患者目录路径"""
+        return self.resolver.patient_dir(patient_id)
+
+    def patient_file(self, patient_id: str) -> str:
+        """患者JSON文件路径"""
+        return self.resolver.history_file(patient_id)
+
+    # 元信息
+    def _get_meta(self, key: str) -> Optional[str]:
+        results = self.db_manager.execute_query(
+            "SELECT value FROM training_manifest_meta WHERE key = ?", (key,)
+        )
+        return results[0]['value'] if results else None
+
+    def _set_meta(self, values: Dict[str, str]):
+        self.db_manager.execute_many(
+            "INSERT OR REPLACE INTO training_manifest_meta (key, value) VALUES (?, ?)",
+            [(key, str(value)) for key, value in values.items()]
+        )
+
+    # 统计计数器（保存在training_manifest_meta中，写入清单时在同一事务内按行增量更新）
+    @staticmethod
+    def _stat_keys(gender: Optional[str], birth_year: Optional[int]) -> List[Tuple[str, int]]:
+        """一条清单记录对各计数器的贡献"""
+        keys = [('stat:total', 1), (f"stat:gender:{gender or 'Unknown'}", 1)]
+        if birth_year is not None:
+            keys += [('stat:birth_year_count', 1), ('stat:birth_year_sum', birth_year),
+                     (f'stat:birth_year:{birth_year}', 1)]
+        return keys
+
+    def _apply_stat_deltas(self, conn, rows: List[Tuple[Optional[str], Optional[int], int]]):
+        """按 (性别, 出生年份, 权重) 更新计数器：旧记录权重为-1，新记录为+1"""
+        deltas: Dict[str, int] = {}
+        for gender, birth_year, weight in rows:
+            for key, value in self._stat_keys(gender, birth_year):
+                deltas[key] = deltas.get(key, 0) + value * weight
+        conn.executemany('''
+            INSERT INTO training_manifest_meta (key, value) VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + excluded.value
+        ''', [(key, delta) for key, delta in deltas.items() if delta])
+
+    def _ensure_statistics(self, conn):
+        """计数器不存在时（旧版本清单、切换训练数据目录后）用一次聚合查询重建"""
+        if conn.execute("SELECT 1 FROM training_manifest_meta WHERE key = 'stat:initialized'").fetchone():
+            return
+        conn.execute("DELETE FROM training_manifest_meta WHERE key LIKE 'stat:%' OR key IN ('statistics', 'generation')")
+        self._apply_stat_deltas(conn, [
+            (row['gender'], row['birth_year'], row['count'])
+            for row in conn.execute(
+                "SELECT gender, birth_year, COUNT(*) AS count FROM training_manifest GROUP BY gender, birth_year"
+            )
+        ])
+        conn.execute("INSERT INTO training_manifest_meta (key, value) VALUES ('stat:initialized', '1')")
+
+    def _fetch_stat_fields(self, conn, patient_ids: List[str]) -> List[Tuple[Optional[str], Optional[int]]]:
+        """读取已有清单记录的统计字段"""
+        fields = []
+        for start in range(0, len(patient_ids), self.BATCH_SIZE):
+            chunk = patient_ids[start:start + self.BATCH_SIZE]
+            fields.extend(
+                (row['gender'], row['birth_year'])
+                for row in conn.execute(
+                    f"SELECT gender, birth_year FROM training_manifest WHERE patient_id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                )
+            )
+        return fields
+
+    # 刷新
+    def refresh(self, force: bool = False) -> Dict:
+        """刷新清单（供请求路径调用，只在首次建立清单时同步扫描）
+
+        force=True时在当前线程同步扫描；否则只检查Set-0目录的mtime和上次扫描时间，
+        清单过期时在后台线程扫描并立即返回，请求只读取清单中已有的内容。
+        """
+        stats = {'scanned': 0, 'added': 0, 'updated': 0, 'removed': 0, 'skipped': False}
+
+        if self.watcher_active and not force:
+            stats['skipped'] = True
+            return stats
+
+        if not os.path.exists(self.training_data_path):
+            return stats
+
+        meta = self._get_scan_meta()
+        if force or meta.get('root_path') != self.training_data_path:
+            return self.scan()
+
+        if self._is_stale(meta):
+            self._scan_in_background(meta.get('last_full_scan'))
+        stats['skipped'] = True
+        return stats
+
+    def _get_scan_meta(self) -> Dict[str, str]:
+        return {
+            row['key']: row['value']
+            for row in self.db_manager.execute_query(
+                "SELECT key, value FROM training_manifest_meta WHERE key IN ('root_path', 'root_mtime_ns', 'last_full_scan')"
+            )
+        }
+
+    def _root_mtime_ns(self) -> Optional[int]:
+        try:
+            return os.stat(self.training_data_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _is_stale(self, meta: Dict[str, str]) -> bool:
+        """Set-0目录项有变化（扁平布局下的新增、删除）或超过max_age未扫描"""
+        if meta.get('root_mtime_ns') != str(self._root_mtime_ns()):
+            return True
+        return time.time() - float(meta.get('last_full_scan') or 0) >= self.max_age
+
+    def _scan_in_background(self, last_full_scan: Optional[str]):
+        """启动后台扫描；本进程已在扫描，或其他进程已认领本轮扫描时直接返回"""
+        with self._scan_lock:
+            if self._scan_thread is not None and self._scan_thread.is_alive():
+                return
+            # 以last_full_scan做比较交换：多个进程同时发现过期时只有一个进程扫描
+            claimed = self.db_manager.execute_update(
+                "UPDATE training_manifest_meta SET value = ? WHERE key = 'last_full_scan' AND value IS ?",
+                (str(time.time()), last_full_scan)
+            )
+            if not claimed:
+                return
+            # 同时记录当前的目录mtime，扫描进行期间其他进程不会因同一变化再次认领
+            self._set_meta({'root_mtime_ns': self._root_mtime_ns()})
+            self._scan_thread = threading.Thread(target=self._background_scan, name='training-manifest-scan',
+                                                 daemon=True)
+            self._scan_thread.start()
+
+    def _background_scan(self):
+        try:
+            self.scan()
+        except Exception as e:
+            logger.error(f"Error refreshing training manifest: {str(e)}")
+
+    def scan(self) -> Dict:
+        """同步扫描Set-0：stat每个患者文件，只重新解析mtime、大小或路径发生变化的文件
+
+        分两遍进行，内存占用只与批大小有关：先按患者ID分批读取清单，检查已知患者的文件；
+        再遍历患者目录，分批查询清单找出新增的患者。
+        """
+        stats = {'scanned': 0, 'added': 0, 'updated': 0, 'removed': 0, 'skipped': False}
+        if not os.path.exists(self.training_data_path):
+            return stats
+
+        # 训练数据目录变更时清空旧清单
+        if self._get_meta('root_path') != self.training_data_path:
+            with self.db_manager.get_connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("DELETE FROM training_manifest")
+                conn.execute("DELETE FROM training_manifest_meta WHERE key LIKE 'stat:%'")
+                conn.commit()
+            self._set_meta({'root_path': self.training_data_path, 'root_mtime_ns': '', 'last_full_scan': '0'})
+        root_mtime_ns = self._root_mtime_ns()
+
+        # 第一遍：已知患者（文件被修改、删除，或因布局迁移换了路径）
+        after = None
+        while True:
+            rows = self.db_manager.execute_query(
+                "SELECT patient_id, file_path, mtime_ns, size FROM training_manifest "
+                "WHERE patient_id > ? ORDER BY patient_id LIMIT ?",
+                (after or '', self.BATCH_SIZE)
+            )
+            if not rows:
+                break
+            after = rows[-1]['patient_id']
+
+            pending, removed = [], []
+            for row in rows:
+                stats['scanned'] += 1
+                file_path = self.patient_file(row['patient_id'])
+                try:
+                    file_stat = os.stat(file_path)
+                except FileNotFoundError:
+                    removed.append(row['patient_id'])
+                    continue
+                if (file_stat.st_mtime_ns, file_stat.st_size, file_path) == \
+                        (row['mtime_ns'], row['size'], row['file_path']):
+                    continue
+                new_row = self.build_row(row['patient_id'], file_stat)
+                if new_row is None:
+                    removed.append(row['patient_id'])
+                    continue
+                pending.append(new_row)
+
+            if pending:
+                self.upsert_rows(pending)
+                stats['updated'] += len(pending)
+            if removed:
+                self.remove_rows(removed)
+                stats['removed'] += len(removed)
+
+        # 第二遍：清单中还没有的患者目录
+        batch = []
+        for patient_id, _ in self.resolver.iter_patient_dirs():
+            batch.append(patient_id)
+            if len(batch) >= self.BATCH_SIZE:
+                stats['added'] += self._add_new_patients(batch)
+                batch = []
+        if batch:
+            stats['added'] += self._add_new_patients(batch)
+        stats['scanned'] += stats['added']
+
+        self._set_meta({'root_mtime_ns': root_mtime_ns, 'last_full_scan': time.time()})
+
+        if stats['added'] or stats['updated'] or stats['removed']:
+            logger.info(f"Training manifest refreshed: {stats}")
+        return stats
+
+    def _add_new_patients(self, patient_ids: List[str]) -> int:
+        """为清单中不存在的患者建立记录，返回新增的数量"""
+        placeholders = ','.join('?' * len(patient_ids))
+        known = {
+            row['patient_id'] for row in self.db_manager.execute_query(
+                f"SELECT patient_id FROM training_manifest WHERE patient_id IN ({placeholders})",
+                tuple(patient_ids)
+            )
+        }
+        rows = []
+        for patient_id in patient_ids:
+            if patient_id in known:
+                continue
+            try:
+                file_stat = os.stat(self.patient_file(patient_id))
+            except FileNotFoundError:
+                continue
+            row = self.build_row(patient_id, file_stat)
+            if row is not None:
+                rows.append(row)
+        if rows:
+            self.upsert_rows(rows)
+        return len(rows)
+
+    def build_row(self, patient_id: str, file_stat: Optional[os.stat_result] = None,
+                  raw_data: Optional[Dict] = None) -> Optional[Tuple]:
+        """提取清单字段；未提供raw_data时读取患者文件"""
+        file_path = self.patient_file(patient_id)
+        try:
+            if file_stat is None:
+                file_stat = os.stat(file_path)
+            if raw_data is None:
+                raw_data = serialization.load_file(file_path)
+        except Exception as e:
+            logger.warning(f"Skipping unreadable training file {file_path}: {str(e)}")
+            return None
+
+        fields = self.extract_summary_fields(raw_data)
+        return (
+            patient_id,
+            file_path,
+            file_stat.st_mtime_ns,
+            file_stat.st_size,
+            fields['name'],
+            fields['gender'],
+            fields['birthdate'],
+            fields['birth_year'],
+            fields['blood_type']
+        )
+
+    def upsert_rows(self, rows: List[Tuple]):
+        """批量写入build_row生成的清单记录，并在同一事务中按新旧记录的差值更新统计计数器"""
+        # 同一批中重复的患者只保留最后一条（与INSERT OR REPLACE的结果一致）
+        rows = list({row[0]: row for row in rows}.values())
+        with self.db_manager.get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._ensure_statistics(conn)
+            previous = self._fetch_stat_fields(conn, [row[0] for row in rows])
+            conn.executemany('''
+                INSERT OR REPLACE INTO training_manifest
+                    (patient_id, file_path, mtime_ns, size, name, gender, birthdate, birth_year, blood_type)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            self._apply_stat_deltas(conn, [(gender, birth_year, -1) for gender, birth_year in previous] +
+                                    [(row[5], row[7], 1) for row in rows])
+            conn.commit()
+
+    @classmethod
+    def extract_summary_fields(cls, raw_data: Dict) -> Dict:
+        """提取列表和统计所需的摘要字段"""
+        birth_year = None
+        if raw_data.get('birthdate'):
+            try:
+                birth_year = int(str(raw_data['birthdate']).split('-')[0])
+            except ValueError:
+                pass
+
+        raw_gender = raw_data.get('gender', 'Unknown')
+        gender = cls.GENDER_MAP.get(raw_gender, raw_gender) if raw_gender else 'Unknown'
+
+        return {
+            'name': raw_data.get('name'),
+            'gender': gender,
+            'birthdate': raw_data.get('birthdate'),
+            'birth_year': birth_year,
+            'blood_type': raw_data.get('blood_type')
+        }
+
+    # 单条更新（供导入、重命名等写操作调用）
+    def upsert_patient(self, patient_id: str) -> bool:
+        """根据磁盘文件更新单个患者的清单记录"""
+        try:
+            file_stat = os.stat(self.patient_file(patient_id))
+        except FileNotFoundError:
+            self.remove_patient(patient_id)
+            return False
+
+        row = self.build_row(patient_id, file_stat)
+        if row is None:
+            return False
+        self.upsert_rows([row])
+        return True
+
+    def remove_patient(self, patient_id: str):
+        """删除单个患者的清单记录"""
+        self.remove_rows([patient_id])
+
+    def remove_rows(self, patient_ids: List[str]):
+        """批量删除清单记录，并在同一事务中从统计计数器中减去"""
+        with self.db_manager.get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._ensure_statistics(conn)
+            previous = self._fetch_stat_fields(conn, patient_ids)
+            conn.executemany("DELETE FROM training_manifest WHERE patient_id = ?",
+                             [(patient_id,) for patient_id in patient_ids])
+            self._apply_stat_deltas(conn, [(gender, birth_year, -1) for gender, birth_year in previous])
+            conn.commit()
+
+    # 查询
+    def count(self) -> int:
+        """清单中的患者总数"""
+        results = self.db_manager.execute_query("SELECT COUNT(*) as total FROM training_manifest")
+        return results[0]['total'] if results else 0
+
+    def list_patients(self, limit: int = 20, after: Optional[str] = None) -> List[Dict]:
+        """按患者ID排序返回清单记录，after不为空时从该ID之后开始（游标分页）"""
+        if after is None:
+            return self.db_manager.execute_query(
+                "SELECT * FROM training_manifest ORDER BY patient_id LIMIT ?", (limit,)
+            )
+        return self.db_manager.execute_query(
+            "SELECT * FROM training_manifest WHERE patient_id > ? ORDER BY patient_id LIMIT ?",
+            (after, limit)
+        )
+
+    def get_statistics(self, exclude_birth_year: Optional[int] = None) -> Dict:
+        """全量统计（性别分布、出生年份），直接读取持久化的计数器，耗时与患者数量无关
+
+        exclude_birth_year不为空时，该年出生的患者不计入出生年份统计。
+        """
+        with self.db_manager.get_connection() as conn:
+            if not conn.execute("SELECT 1 FROM training_manifest_meta WHERE key = 'stat:initialized'").fetchone():
+                conn.execute("BEGIN IMMEDIATE")
+                self._ensure_statistics(conn)
+                conn.commit()
+            values = {
+                row['key']: int(row['value'])
+                for row in conn.execute(
+                    "SELECT key, value FROM training_manifest_meta WHERE key LIKE 'stat:%' AND key != 'stat:initialized'"
+                )
+            }
+
+        known = values.get('stat:birth_year_count', 0)
+        year_sum = values.get('stat:birth_year_sum', 0)
+        if exclude_birth_year is not None:
+            excluded = values.get(f'stat:birth_year:{exclude_birth_year}', 0)
+            known -= excluded
+            year_sum -= excluded * exclude_birth_year
+
+        return {
+            'total': values.get('stat:total', 0),
+            'known_birth_year': known,
+            'average_birth_year': year_sum / known if known else None,
+            'gender_distribution': {
+                key[len('stat:gender:'):]: count
+                for key, count in values.items() if key.startswith('stat:gender:') and count
+            }
+        }
@@ -0,0 +1,248 @@
+import os
+import time
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # Windows：没有文件锁，每个进程各自监视
+    fcntl = None
+
+try:
+    # 可选依赖：有watchdog时使用inotify等系统通知，否则退回到轮询
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+
+class _SetEventHandler(FileSystemEventHandler):
+    """将watchdog文件事件转换为患者ID"""
+
+    def __init__(self, watcher: 'TrainingDataWatcher'):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        for path in (getattr(event, 'src_path', None), getattr(event, 'dest_path', None)):
+            patient_id = self.watcher.patient_id_from_path(path) if path else None
+            if patient_id:
+                self.watcher.apply(patient_id)
+
+
+class TrainingDataWatcher:
+    """训练数据目录监视器 - 将新增、重命名、删除事件同步到内存索引、清单和缓存
+
+    启动后清单不再需要在读取时扫描目录：扁平布局下新增和删除由目录mtime变化发现，
+    文件内容修改（以及分片布局下的所有变化）由定期的全量stat检查（或inotify事件）发现。
+    多进程部署时通过lock_path上的文件锁保证只有一个进程监视目录并维护共享的清单；
+    其他进程只读取清单，并定期尝试获取锁，在监视进程退出后接替它。
+    """
+
+    def __init__(self, training_data_service, poll_interval: float = 2.0,
+                 full_scan_interval: float = 60.0, use_inotify: bool = True,
+                 lock_path: Optional[str] = None, lock_retry_interval: float = 10.0):
+        self.service = training_data_service
+        self.manifest = training_data_service.manifest
+        self.poll_interval = poll_interval
+        self.full_scan_interval = full_scan_interval
+        self.use_inotify = use_inotify and Observer is not None
+        self.lock_path = lock_path if fcntl is not None else None
+        self.lock_retry_interval = lock_retry_interval
+        self._lock_file = None
+
+        # 内存索引：患者ID -> (mtime_ns, size)
+        self.index: Dict[str, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._observer = None
+        self._root_mtime_ns = None
+        self._events = {'added': 0, 'updated': 0, 'removed': 0}
+
+    @property
+    def root(self) -> str:
+        return self.service.training_data_path
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def leader(self) -> bool:
+        """本进程是否负责监视目录"""
+        return self._lock_file is not None or (self.lock_path is None and self.running)
+
+    def start(self):
+        """启动监视（后台线程）；其他进程已在监视时只等待接替"""
+        if self.running:
+            return
+
+        self._stop_event.clear()
+        self.manifest.watcher_active = True
+        if self._acquire_lock():
+            self._sync()
+            target = self._poll_loop
+        else:
+            target = self._wait_for_lock
+        self._thread = threading.Thread(target=target, name='training-watcher', daemon=True)
+        self._thread.start()
+        logger.info(f"Training data watcher started ({self._role()}): {self.root}")
+
+    def stop(self):
+        """停止监视"""
+        self.manifest.watcher_active = False
+        self._stop_event.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._release_lock()
+
+    def _role(self) -> str:
+        if self.lock_path is not None and self._lock_file is None:
+            return 'standby'
+        return 'inotify' if self._observer else 'polling'
+
+    def _acquire_lock(self) -> bool:
+        """尝试获取监视锁（非阻塞）；没有配置锁文件时总是成功"""
+        if self.lock_path is None:
+            return True
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _release_lock(self):
+        if self._lock_file is not None:
+            self._lock_file.close()  # 关闭文件即释放flock
+            self._lock_file = None
+
+    def _sync(self):
+        """全量同步清单，加载内存索引，并启动inotify"""
+        self.manifest.refresh(force=True)
+        with self._lock:
+            self.index = {
+                row['patient_id']: (row['mtime_ns'], row['size'])
+                for row in self.service.db_manager.execute_query(
+                    "SELECT patient_id, mtime_ns, size FROM training_manifest"
+                )
+            }
+        self._root_mtime_ns = self._stat_root()
+
+        if self.use_inotify and os.path.isdir(self.root):
+            self._observer = Observer()
+            self._observer.schedule(_SetEventHandler(self), self.root, recursive=True)
+            self._observer.start()
+
+    def _wait_for_lock(self):
+        """等待监视进程退出后接替监视"""
+        while not self._stop_event.wait(self.lock_retry_interval):
+            if self._acquire_lock():
+                try:
+                    self._sync()
+                except Exception as e:
+                    logger.error(f"Training data watcher error: {str(e)}")
+                logger.info(f"Training data watcher took over ({self._role()}): {self.root}")
+                self._poll_loop()
+                return
+
+    def _stat_root(self) -> Optional[int]:
+        try:
+            return os.stat(self.root).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def patient_id_from_path(self, path: str) -> Optional[str]:
+        """从Set-0下的任意路径提取患者ID（兼容分片布局）"""
+        relative = os.path.relpath(path, self.root)
+        for part in relative.split(os.sep)[:3]:
+            if part.startswith('patient_'):
+                return part[len('patient_'):]
+        return None
+
+    def _poll_loop(self):
+        last_full_scan = time.monotonic()
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                root_mtime_ns = self._stat_root()
+                sharded = self.service.resolver.layout == self.service.resolver.SHARDED
+                if root_mtime_ns != self._root_mtime_ns and not sharded:
+                    # 目录项发生变化：只比较目录名，不stat已知患者文件
+                    self._root_mtime_ns = root_mtime_ns
+                    self.scan(stat_all=False)
+                elif not self._observer and time.monotonic() - last_full_scan >= self.full_scan_interval:
+                    # 没有inotify时定期stat所有文件以发现内容修改
+                    self.scan(stat_all=True)
+                    last_full_scan = time.monotonic()
+            except Exception as e:
+                logger.error(f"Training data watcher error: {str(e)}")
+
+    def scan(self, stat_all: bool = False):
+        """对比目录与内存索引并分发事件"""
+        present = {patient_id for patient_id, _ in self.service.resolver.iter_patient_dirs()}
+
+        with self._lock:
+            known = set(self.index)
+
+        # 只比较目录名时仅处理新增的目录；全量检查时stat每个患者文件
+        candidates = present if stat_all else present - known
+        for patient_id in candidates | (known - present):
+            self.apply(patient_id)
+
+    def apply(self, patient_id: str):
+        """根据磁盘上的当前状态更新单个患者"""
+        try:
+            file_stat = os.stat(self.manifest.patient_file(patient_id))
+            signature = (file_stat.st_mtime_ns, file_stat.st_size)
+        except FileNotFoundError:
+            signature = None
+
+        with self._lock:
+            previous = self.index.get(patient_id)
+            if previous == signature:
+                return
+
+        if signature is None:
+            event = 'removed'
+            self.manifest.remove_patient(patient_id)
+        else:
+            event = 'added' if previous is None else 'updated'
+            if not self.manifest.upsert_patient(patient_id):
+                # 文件正在写入或无法解析：不更新索引，下一个事件或轮询时重试
+                return
+
+        # 清单写入成功后才更新索引（写入抛出异常时同样保持原状）
+        with self._lock:
+            if signature is None:
+                self.index.pop(patient_id, None)
+            else:
+                self.index[patient_id] = signature
+
+        # 使依赖该患者文件的缓存失效
+        self.service.record_cache.invalidate_prefix(self.manifest.patient_dir(patient_id))
+        self._events[event] += 1
+        logger.debug(f"Training patient {event}: {patient_id}")
+
+    def get_stats(self) -> Dict:
+        """获取监视器状态"""
+        with self._lock:
+            indexed = len(self.index)
+        return {
+            'running': self.running,
+            'leader': self.leader,
+            'backend': self._role(),
+            'indexed_patients': indexed,
+            'events': dict(self._events)
+        }
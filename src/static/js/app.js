@@ -4,13 +4,13 @@ class VirtualDiagnostician {
         this.messageCount = 0;
         this.chatStartTime = null;
         this.loadedTrainingPatients = [];
+        this.trainingCursor = null;
         this.trainingDataStats = null;
         
         this.initializeElements();
         this.bindEvents();
-        this.loadPatients();
+        this.loadInitialData();
         this.initializeChat();
-        this.loadTrainingDataStats();
     }
 
     initializeElements() {
@@ -74,8 +74,7 @@ class VirtualDiagnostician {
         // 患者选择事件
         this.patientSelect.addEventListener('change', (e) => {
             this.currentPatientId = e.target.value;
-            this.loadPatientInfo();
-            this.loadChatHistory();
+            this.loadPatientWorkspace();
         });
 
         // 按钮事件
@@ -240,6 +239,79 @@ class VirtualDiagnostician {
         }
     }
 
+    async batch(requests) {
+        // 多个API请求合并为一次往返（/api/batch），返回 {id: {status, body}}
+        const response = await fetch('/api/batch', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ requests })
+        });
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || `Batch request failed (${response.status})`);
+        }
+        
+        const results = {};
+        data.responses.forEach(result => {
+            results[result.id] = result;
+        });
+        return results;
+    }
+
+    async loadInitialData() {
+        // 首次加载：患者列表和训练数据统计合并为一次请求
+        try {
+            const results = await this.batch([
+                { id: 'patients', path: '/api/patients' },
+                { id: 'summary', path: '/api/training/summary' }
+            ]);
+            
+            if (results.summary.status === 200) {
+                this.trainingDataStats = results.summary.body;
+            }
+            if (results.patients.status === 200) {
+                const regularPatients = results.patients.body.filter(p => !p.id.startsWith('training_'));
+                this.updatePatientSelect(regularPatients, this.loadedTrainingPatients);
+            } else {
+                this.updateTrainingDataStats();
+            }
+            
+            this.loadPatientInfo();
+        } catch (error) {
+            console.error('Failed to load initial data:', error);
+        }
+    }
+
+    async loadPatientWorkspace() {
+        // 切换患者：患者信息、聊天记录和对话统计由一个接口一次返回
+        const patientId = this.currentPatientId;
+        try {
+            const response = await fetch(`/api/patient/${patientId}/workspace`);
+            if (patientId !== this.currentPatientId) {
+                return;  // 请求期间已切换到其他患者
+            }
+            if (!response.ok) {
+                return;
+            }
+            
+            const workspace = await response.json();
+            if (patientId === 'default') {
+                this.loadPatientInfo();
+            } else {
+                this.updatePatientDisplay(workspace.patient);
+            }
+            this.displayChatHistory(workspace.chat_history);
+            if (workspace.chat_history.length > 0) {
+                this.messageCount = workspace.conversation.total_messages;
+                this.updateMessageCount();
+            }
+        } catch (error) {
+            console.error('Failed to load patient workspace:', error);
+        }
+    }
+
     async loadPatients() {
         try {
             // 只加载普通患者
@@ -433,8 +505,7 @@ class VirtualDiagnostician {
                 this.currentPatientId = data.patient_id;
                 
                 this.hideNewPatientModal();
-                this.loadPatientInfo();
-                this.loadChatHistory();
+                this.loadPatientWorkspace();
                 
                 this.showSuccess('Patient created successfully');
             } else {
@@ -828,9 +899,22 @@ class VirtualDiagnostician {
             this.loadMoreTrainingBtn.disabled = true;
             this.loadMoreTrainingBtn.innerHTML = '<i class="fas fa-spinner fa-spin mr-1"></i>Loading...';
             
-            const response = await fetch(`/api/training/patients?limit=${actualCount}`);
-            if (response.ok) {
-                const newTrainingPatients = await response.json();
+            // 游标分页：从上次加载的位置继续，只请求选择器需要的字段
+            let url = `/api/training/patients?limit=${actualCount}&fields=id,name`;
+            if (this.trainingCursor) {
+                url += `&cursor=${encodeURIComponent(this.trainingCursor)}`;
+            }
+            
+            // 训练患者分页和普通患者列表合并为一次请求
+            const results = await this.batch([
+                { id: 'training', path: url },
+                { id: 'patients', path: '/api/patients' }
+            ]);
+            const pageResult = results.training;
+            if (pageResult.status === 200) {
+                const page = pageResult.body;
+                const newTrainingPatients = page.patients;
+                this.trainingCursor = page.next_cursor;
                 
                 // 合并新患者（避免重复）
                 const existingIds = new Set(this.loadedTrainingPatients.map(p => p.id));
@@ -838,11 +922,9 @@ class VirtualDiagnostician {
                 
                 this.loadedTrainingPatients = [...this.loadedTrainingPatients, ...uniqueNewPatients];
                 
-                // 重新加载普通患者列表
-                const regularResponse = await fetch('/api/patients');
-                if (regularResponse.ok) {
-                    const allPatients = await regularResponse.json();
-                    const regularPatients = allPatients.filter(p => !p.id.startsWith('training_'));
+                // 更新普通患者列表
+                if (results.patients.status === 200) {
+                    const regularPatients = results.patients.body.filter(p => !p.id.startsWith('training_'));
                     this.updatePatientSelect(regularPatients, this.loadedTrainingPatients);
                 }
                 
@@ -851,8 +933,7 @@ class VirtualDiagnostician {
                 // 清空输入框
                 this.trainingLoadCount.value = '';
             } else {
-                const error = await response.json();
-                this.showError('Failed to load training patients: ' + error.error);
+                this.showError('Failed to load training patients: ' + pageResult.body.error);
             }
         } catch (error) {
             this.showError('Failed to load training patients: ' + error.message);
@@ -0,0 +1,318 @@
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import unquote_to_bytes
+
+logger = logging.getLogger(__name__)
+
+MAX_HEADER_SIZE = 64 * 1024
+KEEPALIVE_TIMEOUT = 5.0
+DEFAULT_MAX_CONNECTIONS = 4096
+
+STATUS_PHRASES = {
+    100: 'Continue', 200: 'OK', 201: 'Created', 202: 'Accepted', 204: 'No Content', 206: 'Partial Content',
+    301: 'Moved Permanently', 302: 'Found', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+    405: 'Method Not Allowed', 411: 'Length Required', 413: 'Payload Too Large', 415: 'Unsupported Media Type',
+    500: 'Internal Server Error', 503: 'Service Unavailable',
+}
+
+
+class _BadRequest(Exception):
+    """请求格式错误，返回400并关闭连接"""
+
+
+class _Connection:
+    """一个客户端连接：按顺序处理连接上的请求（HTTP/1.1 keep-alive，不支持管线化并发）"""
+
+    def __init__(self, server: 'AsgiHttpServer', reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.busy = False
+        self.closed = asyncio.Event()
+
+    async def _read_head(self) -> Optional[Tuple[str, bytes, str, List[Tuple[bytes, bytes]]]]:
+        try:
+            head = await asyncio.wait_for(self.reader.readuntil(b'\r\n\r\n'), self.server.keepalive_timeout)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            return None
+        except asyncio.LimitOverrunError:
+            raise _BadRequest('Header too large')
+
+        lines = head[:-4].split(b'\r\n')
+        try:
+            method, target, version = lines[0].decode('latin-1').split(' ', 2)
+        except ValueError:
+            raise _BadRequest('Malformed request line')
+        if version not in ('HTTP/1.0', 'HTTP/1.1'):
+            raise _BadRequest('Unsupported HTTP version')
+
+        headers = []
+        for line in lines[1:]:
+            name, sep, value = line.partition(b':')
+            if not sep:
+                raise _BadRequest('Malformed header')
+            headers.append((name.strip().lower(), value.strip()))
+        return method, target.encode('latin-1'), version[5:], headers
+
+    async def _read_body(self, headers: Dict[bytes, bytes]) -> bytes:
+        if b'chunked' in headers.get(b'transfer-encoding', b'').lower():
+            body = bytearray()
+            while True:
+                size_line = await self.reader.readuntil(b'\r\n')
+                size = int(size_line.split(b';', 1)[0], 16)
+                if size == 0:
+                    # 跳过trailer
+                    while await self.reader.readuntil(b'\r\n') != b'\r\n':
+                        pass
+                    return bytes(body)
+                body += await self.reader.readexactly(size)
+                await self.reader.readexactly(2)
+
+        length = headers.get(b'content-length')
+        if not length:
+            return b''
+        try:
+            length = int(length)
+        except ValueError:
+            raise _BadRequest('Invalid Content-Length')
+        if self.server.max_body_size is not None and length > self.server.max_body_size:
+            raise _BadRequest('Body too large')
+        return await self.reader.readexactly(length)
+
+    def _write_simple(self, status: int, body: bytes = b''):
+        self.writer.write(f'HTTP/1.1 {status} {STATUS_PHRASES.get(status, "")}\r\n'
+                          f'content-type: text/plain; charset=utf-8\r\ncontent-length: {len(body)}\r\n'
+                          f'connection: close\r\n\r\n'.encode('latin-1') + body)
+
+    async def serve(self):
+        try:
+            while not self.server.stopping:
+                try:
+                    request = await self._read_head()
+                except _BadRequest as e:
+                    self._write_simple(400, str(e).encode())
+                    break
+                if request is None:
+                    break
+                self.busy = True
+                try:
+                    keep_alive = await self._handle(*request)
+                finally:
+                    self.busy = False
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.error(f"Connection error: {str(e)}")
+        finally:
+            self.closed.set()
+            self.writer.close()
+
+    async def _handle(self, method: str, target: bytes, http_version: str,
+                      header_list: List[Tuple[bytes, bytes]]) -> bool:
+        headers = dict(header_list)
+        connection = headers.get(b'connection', b'').lower()
+        keep_alive = connection != b'close' if http_version == '1.1' else connection == b'keep-alive'
+
+        if headers.get(b'expect', b'').lower() == b'100-continue':
+            self.writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+        try:
+            body = await self._read_body(headers)
+        except (_BadRequest, ValueError) as e:
+            self._write_simple(400, str(e).encode())
+            return False
+
+        raw_path, _, query_string = target.partition(b'?')
+        client = self.writer.get_extra_info('peername')
+        sockname = self.writer.get_extra_info('sockname')
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0', 'spec_version': '2.3'},
+            'http_version': http_version,
+            'method': method,
+            'scheme': 'http',
+            'path': unquote_to_bytes(raw_path).decode('utf-8', errors='replace'),
+            'raw_path': raw_path,
+            'query_string': query_string,
+            'root_path': '',
+            'headers': header_list,
+            'client': tuple(client[:2]) if client else None,
+            'server': tuple(sockname[:2]) if sockname else None,
+        }
+
+        state = {'started': False, 'chunked': False, 'complete': False, 'keep_alive': keep_alive}
+        body_sent = False
+
+        async def receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            await self.closed.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                state['started'] = True
+                state['status'] = message['status']
+                state['headers'] = list(message.get('headers', []))
+                return
+            if message['type'] != 'http.response.body' or state['complete']:
+                return
+
+            chunk = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if 'head_sent' not in state:
+                self._write_head(state, chunk, more_body, http_version, method)
+            if method != 'HEAD':
+                if state['chunked']:
+                    if chunk:
+                        self.writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                    if not more_body:
+                        self.writer.write(b'0\r\n\r\n')
+                elif chunk:
+                    self.writer.write(chunk)
+            if not more_body:
+                state['complete'] = True
+            await self.writer.drain()
+
+        try:
+            await self.server.app(scope, receive, send)
+        except Exception as e:
+            logger.error(f"ASGI application error: {method} {scope['path']}: {str(e)}")
+            if not state['started'] or 'head_sent' not in state:
+                self._write_simple(500, b'Internal Server Error')
+            return False
+
+        if not state['started']:
+            self._write_simple(500, b'Internal Server Error')
+            return False
+        if not state['complete']:
+            return False  # 响应没有正常结束，连接状态未知
+        return state['keep_alive']
+
+    def _write_head(self, state: Dict, first_chunk: bytes, more_body: bool, http_version: str, method: str):
+        headers = state['headers']
+        names = {name.lower() for name, _ in headers}
+        status = state['status']
+        if b'content-length' not in names and status not in (204, 304) and status >= 200:
+            if not more_body:
+                headers.append((b'content-length', str(len(first_chunk)).encode()))
+            elif http_version == '1.1':
+                state['chunked'] = method != 'HEAD'
+                headers.append((b'transfer-encoding', b'chunked'))
+            else:
+                state['keep_alive'] = False  # HTTP/1.0流式响应以关闭连接结束
+        if not state['keep_alive'] or self.server.stopping:
+            state['keep_alive'] = False
+            headers.append((b'connection', b'close'))
+
+        lines = [f'HTTP/1.1 {status} {STATUS_PHRASES.get(status, "")}'.encode('latin-1')]
+        lines.extend(name + b': ' + value for name, value in headers)
+        self.writer.write(b'\r\n'.join(lines) + b'\r\n\r\n')
+        state['head_sent'] = True
+
+
+class AsgiHttpServer:
+    """最小的asyncio HTTP/1.1服务器，用于在没有uvicorn的环境中运行ASGI应用
+
+    - 每个连接一个协程，空闲的keep-alive连接不占用线程，超过keepalive_timeout后关闭；
+    - 连接数超过max_connections时新连接直接返回503；
+    - 支持lifespan事件（启动和停止后台服务），停止时等待进行中的请求完成。
+    不支持HTTPS、WebSocket和HTTP/2，生产环境建议使用uvicorn。
+    """
+
+    def __init__(self, app: Callable, host: str = '127.0.0.1', port: int = 8000,
+                 max_connections: int = DEFAULT_MAX_CONNECTIONS, keepalive_timeout: float = KEEPALIVE_TIMEOUT,
+                 max_body_size: Optional[int] = None, backlog: int = 2048, graceful_timeout: float = 30.0):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self.max_body_size = max_body_size
+        self.backlog = backlog
+        self.graceful_timeout = graceful_timeout
+
+        self.stopping = False
+        self.connections: Set[_Connection] = set()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._lifespan: Optional[asyncio.Task] = None
+        self._lifespan_receive: Optional[asyncio.Queue] = None
+        self._lifespan_send: Optional[asyncio.Queue] = None
+        self._lifespan_supported = True
+
+    # lifespan
+    async def _lifespan_event(self, event: str) -> bool:
+        """发送lifespan事件并等待应用完成；应用不支持lifespan时返回False"""
+        if self._lifespan is None:
+            self._lifespan_receive = asyncio.Queue()
+            self._lifespan_send = asyncio.Queue()
+
+            async def run():
+                try:
+                    await self.app({'type': 'lifespan', 'asgi': {'version': '3.0'}},
+                                   self._lifespan_receive.get, self._lifespan_send.put)
+                except Exception as e:
+                    logger.info(f"Application does not support lifespan: {str(e)}")
+                    self._lifespan_supported = False
+                    await self._lifespan_send.put({'type': 'lifespan.unsupported'})
+
+            self._lifespan = asyncio.ensure_future(run())
+
+        if not self._lifespan_supported:
+            return False
+        await self._lifespan_receive.put({'type': f'lifespan.{event}'})
+        message = await self._lifespan_send.get()
+        if message['type'].endswith('.failed'):
+            raise RuntimeError(f"Lifespan {event} failed: {message.get('message', '')}")
+        return message['type'] != 'lifespan.unsupported'
+
+    # 连接
+    async def _on_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if len(self.connections) >= self.max_connections or self.stopping:
+            writer.write(b'HTTP/1.1 503 Service Unavailable\r\ncontent-length: 0\r\nconnection: close\r\n\r\n')
+            writer.close()
+            return
+        connection = _Connection(self, reader, writer)
+        self.connections.add(connection)
+        try:
+            await connection.serve()
+        finally:
+            self.connections.discard(connection)
+
+    async def start(self):
+        await self._lifespan_event('startup')
+        self._server = await asyncio.start_server(self._on_connection, self.host, self.port,
+                                                  limit=MAX_HEADER_SIZE, backlog=self.backlog)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Listening on http://{self.host}:{self.port} (max {self.max_connections} connections)")
+
+    async def stop(self):
+        """平滑停止：不再接受新连接，关闭空闲连接，等待进行中的请求完成"""
+        self.stopping = True
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+        deadline = asyncio.get_running_loop().time() + self.graceful_timeout
+        while self.connections and asyncio.get_running_loop().time() < deadline:
+            for connection in list(self.connections):
+                if not connection.busy:
+                    connection.writer.close()
+            await asyncio.sleep(0.05)
+        for connection in list(self.connections):
+            connection.writer.close()
+
+        await self._lifespan_event('shutdown')
+
+    async def serve(self, stop_event: Optional[asyncio.Event] = None):
+        """运行直到stop_event被设置（或任务被取消）"""
+        await self.start()
+        stop_event = stop_event or asyncio.Event()
+        try:
+            await stop_event.wait()
+        finally:
+            await self.stop()
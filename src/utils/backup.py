@@ -0,0 +1,274 @@
+import io
+import gzip
+import json
+import hashlib
+import logging
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from utils import serialization
+
+logger = logging.getLogger(__name__)
+
+try:
+    # 可选依赖：安装zstandard后可使用zstd压缩（速度快、压缩率高）
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BACKUP_FORMAT = 'vd-backup'
+BACKUP_VERSION = '2.0'
+
+# 备份的表及排序键（按主键顺序导出）
+BACKUP_TABLES = [
+    ('patients', 'id'),
+    ('chat_messages', 'id'),
+    ('diagnosis_records', 'id'),
+]
+
+# 墓碑表：增量/差异备份中该分段的每一行表示一次删除，恢复时在写入数据行之前执行
+TOMBSTONE_TABLE = 'deleted_rows'
+
+COMPRESSIONS = ('gzip', 'zstd', 'none')
+EXTENSIONS = {'gzip': '.ndjson.gz', 'zstd': '.ndjson.zst', 'none': '.ndjson'}
+
+_GZIP_MAGIC = b'\x1f\x8b'
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+class BackupFormatError(ValueError):
+    """备份文件格式错误、被截断或校验和不匹配"""
+
+
+# 压缩
+def available_compressions() -> List[str]:
+    """当前环境可用的压缩方式"""
+    return [c for c in COMPRESSIONS if c != 'zstd' or zstandard is not None]
+
+
+def backup_extension(compression: str) -> str:
+    return EXTENSIONS[compression]
+
+
+def detect_compression(path: str) -> str:
+    """根据文件头判断压缩方式"""
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    if magic.startswith(_GZIP_MAGIC):
+        return 'gzip'
+    if magic == _ZSTD_MAGIC:
+        return 'zstd'
+    return 'none'
+
+
+def open_backup_file(path: str, mode: str = 'r', compression: Optional[str] = None) -> BinaryIO:
+    """以二进制流打开（压缩的）备份文件；读取时自动识别压缩方式"""
+    if mode not in ('r', 'w'):
+        raise ValueError(f'Unsupported mode: {mode}')
+    if compression is None:
+        compression = detect_compression(path) if mode == 'r' else 'gzip'
+    if compression not in COMPRESSIONS:
+        raise ValueError(f'Unknown compression: {compression}')
+
+    if compression == 'gzip':
+        return gzip.open(path, mode + 'b', compresslevel=6)
+
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('zstandard is required for zstd backups')
+        raw = open(path, mode + 'b')
+        if mode == 'w':
+            return zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=True)
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True))
+
+    return open(path, mode + 'b')
+
+
+# 写入
+def encode_line(obj: Any) -> bytes:
+    return serialization.dumps_bytes(obj) + b'\n'
+
+
+class BackupWriter:
+    """NDJSON备份写入器
+
+    文件结构（每行一个JSON对象）:
+        {"_type": "header", ...}
+        {"_type": "section", "table": "patients"}
+        <数据行>...
+        {"_type": "section_end", "table": "patients", "count": N, "sha256": "..."}
+        ...
+        {"_type": "trailer", "counts": {...}, "sha256": {...}, "total_rows": N}
+
+    每个表的sha256基于该表所有数据行的字节计算，读取时逐段校验。
+    """
+
+    def __init__(self, fileobj: BinaryIO, backup_type: str = 'full', **header_fields):
+        self.fileobj = fileobj
+        self.header = {
+            '_type': 'header',
+            'format': BACKUP_FORMAT,
+            'version': BACKUP_VERSION,
+            'backup_type': backup_type,
+            'created_at': datetime.now().isoformat(),
+            **header_fields
+        }
+        self.counts: Dict[str, int] = {}
+        self.checksums: Dict[str, str] = {}
+        self._table: Optional[str] = None
+        self._hash = None
+        self.fileobj.write(encode_line(self.header))
+
+    def begin_section(self, table: str):
+        if self._table is not None:
+            self.end_section()
+        self._table = table
+        self._hash = hashlib.sha256()
+        self.counts[table] = 0
+        self.fileobj.write(encode_line({'_type': 'section', 'table': table}))
+
+    def write_rows(self, rows: List[Dict]):
+        if self._table is None:
+            raise BackupFormatError('write_rows called outside of a section')
+        data = b''.join(encode_line(row) for row in rows)
+        self._hash.update(data)
+        self.fileobj.write(data)
+        self.counts[self._table] += len(rows)
+
+    def end_section(self):
+        if self._table is None:
+            return
+        self.checksums[self._table] = self._hash.hexdigest()
+        self.fileobj.write(encode_line({
+            '_type': 'section_end',
+            'table': self._table,
+            'count': self.counts[self._table],
+            'sha256': self.checksums[self._table]
+        }))
+        self._table = None
+        self._hash = None
+
+    def close(self, **trailer_fields) -> Dict:
+        """写入尾部并返回尾部内容（不关闭底层文件）"""
+        self.end_section()
+        trailer = {
+            '_type': 'trailer',
+            'counts': dict(self.counts),
+            'sha256': dict(self.checksums),
+            'total_rows': sum(self.counts.values()),
+            'finished_at': datetime.now().isoformat(),
+            **trailer_fields
+        }
+        self.fileobj.write(encode_line(trailer))
+        return trailer
+
+
+def dump_table(writer: BackupWriter, db_manager, table: str, order_by: str,
+               where: str = '', params: tuple = (), chunk_size: int = 1000):
+    """通过数据库游标分块把一个表写入备份分段"""
+    writer.begin_section(table)
+    query = f"SELECT * FROM {table} {('WHERE ' + where) if where else ''} ORDER BY {order_by}"
+    for rows in db_manager.iter_query(query, params, chunk_size=chunk_size):
+        writer.write_rows(rows)
+    writer.end_section()
+
+
+def group_tombstones(rows: List[Dict]) -> Dict[str, List[tuple]]:
+    """把墓碑行按表分组为 {表名: [(主键,), ...]}，忽略不属于备份表的记录"""
+    tables = {table for table, _ in BACKUP_TABLES}
+    grouped: Dict[str, List[tuple]] = {}
+    for row in rows:
+        if row.get('table_name') in tables:
+            grouped.setdefault(row['table_name'], []).append((row['row_id'],))
+    return grouped
+
+
+# 读取
+def iter_backup(fileobj: BinaryIO, chunk_size: int = 1000) -> Iterator[Tuple[str, Optional[str], Any]]:
+    """流式读取备份文件并逐段校验
+
+    产出 ('header', None, 头部)、('rows', 表名, 数据行列表)、
+    ('section_end', 表名, 分段信息)、('trailer', None, 尾部)。
+    数据行按chunk_size分块产出；校验失败或文件被截断时抛出BackupFormatError。
+    """
+    header = None
+    table = None
+    digest = None
+    count = 0
+    chunk: List[Dict] = []
+
+    for line_number, line in enumerate(fileobj, 1):
+        if not line.strip():
+            continue
+        try:
+            obj = serialization.loads(line)
+        except json.JSONDecodeError as e:
+            raise BackupFormatError(f'Invalid JSON on line {line_number}: {str(e)}')
+
+        if header is None:
+            if not isinstance(obj, dict) or obj.get('_type') != 'header' or obj.get('format') != BACKUP_FORMAT:
+                raise BackupFormatError('Missing backup header')
+            header = obj
+            yield 'header', None, header
+            continue
+
+        marker = obj.get('_type') if isinstance(obj, dict) else None
+        if marker is None:
+            if table is None:
+                raise BackupFormatError(f'Row outside of a section on line {line_number}')
+            digest.update(line)
+            count += 1
+            chunk.append(obj)
+            if len(chunk) >= chunk_size:
+                yield 'rows', table, chunk
+                chunk = []
+        elif marker == 'section':
+            table = obj['table']
+            digest = hashlib.sha256()
+            count = 0
+        elif marker == 'section_end':
+            if chunk:
+                yield 'rows', table, chunk
+                chunk = []
+            if obj.get('table') != table or obj.get('count') != count or obj.get('sha256') != digest.hexdigest():
+                raise BackupFormatError(f'Checksum mismatch in section {table}')
+            yield 'section_end', table, obj
+            table = None
+        elif marker == 'trailer':
+            if table is not None:
+                raise BackupFormatError(f'Section {table} is not closed')
+            yield 'trailer', None, obj
+            return
+        else:
+            raise BackupFormatError(f'Unknown marker {marker} on line {line_number}')
+
+    raise BackupFormatError('Backup is truncated (no trailer)')
+
+
+def read_backup_header(path: str) -> Dict:
+    """只读取备份头部"""
+    with open_backup_file(path, 'r') as f:
+        line = f.readline()
+    try:
+        header = serialization.loads(line)
+    except json.JSONDecodeError:
+        raise BackupFormatError('Missing backup header')
+    if not isinstance(header, dict) or header.get('format') != BACKUP_FORMAT:
+        raise BackupFormatError('Missing backup header')
+    return header
+
+
+def verify_backup(path: str) -> Dict:
+    """完整读取并校验备份文件，返回头部、尾部和各表行数"""
+    try:
+        header = trailer = None
+        with open_backup_file(path, 'r') as f:
+            for kind, _, payload in iter_backup(f):
+                if kind == 'header':
+                    header = payload
+                elif kind == 'trailer':
+                    trailer = payload
+        return {'valid': True, 'header': header, 'trailer': trailer, 'counts': trailer['counts']}
+    except (BackupFormatError, OSError, EOFError) as e:
+        logger.error(f"Backup verification failed for {path}: {str(e)}")
+        return {'valid': False, 'error': str(e)}
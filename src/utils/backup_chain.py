@@ -0,0 +1,245 @@
+import os
+import json
+import shutil
+import logging
+import tempfile
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from database.db_manager import DatabaseManager
+from utils.backup import (BACKUP_TABLES, TOMBSTONE_TABLE, BackupWriter, backup_extension, dump_table,
+                          group_tombstones, iter_backup, open_backup_file)
+
+logger = logging.getLogger(__name__)
+
+FULL = 'full'
+INCREMENTAL = 'incremental'
+DIFFERENTIAL = 'differential'
+BACKUP_TYPES = (FULL, INCREMENTAL, DIFFERENTIAL)
+
+# 各表的高水位列：
+#   patients按updated_at（秒级精度，使用 >= 以免漏掉同一秒内的更新，重复的行在恢复时按主键覆盖）
+#   chat_messages / diagnosis_records按自增id（只能发现新增的行）
+#   删除由触发器写入墓碑表，按墓碑的自增id增量导出
+HIGH_WATER_COLUMNS = {
+    'patients': ('updated_at', '>='),
+    'chat_messages': ('id', '>'),
+    'diagnosis_records': ('id', '>'),
+    TOMBSTONE_TABLE: ('id', '>'),
+}
+
+
+class BackupChain:
+    """备份链 - 记录全量/增量/差异备份及其高水位，并可将整条链压缩为新的全量备份
+
+    链清单保存在备份目录下的 backup_chain.manifest 中，每个条目记录文件名、类型、
+    基于的上一个备份（parent）、起始水位（since）和结束水位（marks）。
+    增量备份基于链上最近的任意备份，差异备份基于最近的全量备份。
+    增量/差异备份先写入水位之间的墓碑分段（删除的行），再写入新增和修改的行。
+    """
+
+    MANIFEST_NAME = 'backup_chain.manifest'
+
+    def __init__(self, backup_dir: str):
+        self.backup_dir = backup_dir
+        self.manifest_path = os.path.join(backup_dir, self.MANIFEST_NAME)
+        self._lock = threading.Lock()
+
+    # 清单
+    def load(self) -> List[Dict]:
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('backups', [])
+        except FileNotFoundError:
+            return []
+
+    def _save(self, entries: List[Dict]):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'backups': entries}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def record(self, entry: Dict):
+        """追加一个备份条目"""
+        with self._lock:
+            entries = self.load()
+            entries.append(entry)
+            self._save(entries)
+
+    def current_chain(self) -> List[Dict]:
+        """最近一个全量备份及其之后的备份（恢复时需要的文件）
+
+        若存在差异备份，只需全量备份 + 最近的差异备份 + 其后的增量备份。
+        """
+        entries = [e for e in self.load() if os.path.exists(os.path.join(self.backup_dir, e['filename']))]
+        full_index = max((i for i, e in enumerate(entries) if e['backup_type'] == FULL), default=None)
+        if full_index is None:
+            return []
+
+        chain = [entries[full_index]]
+        rest = entries[full_index + 1:]
+        diff_index = max((i for i, e in enumerate(rest) if e['backup_type'] == DIFFERENTIAL), default=None)
+        if diff_index is not None:
+            chain.append(rest[diff_index])
+            rest = rest[diff_index + 1:]
+        chain.extend(rest)
+        return chain
+
+    def base_for(self, backup_type: str) -> Optional[Dict]:
+        """新备份所基于的备份条目（全量备份返回None）"""
+        if backup_type == FULL:
+            return None
+        chain = self.current_chain()
+        if not chain:
+            return None
+        return chain[0] if backup_type == DIFFERENTIAL else chain[-1]
+
+    def effective_type(self, backup_type: str) -> str:
+        """链上还没有全量备份时，增量/差异备份退化为全量备份"""
+        if backup_type != FULL and not self.current_chain():
+            logger.info("No full backup in the chain yet, writing a full backup instead")
+            return FULL
+        return backup_type
+
+    # 水位
+    @staticmethod
+    def current_marks(db_manager) -> Dict:
+        """读取各表当前的高水位"""
+        marks = {}
+        for table, (column, _) in HIGH_WATER_COLUMNS.items():
+            result = db_manager.execute_query(f"SELECT MAX({column}) AS mark FROM {table}")
+            marks[table] = result[0]['mark'] if result else None
+        return marks
+
+    @staticmethod
+    def table_filter(table: str, since: Optional[Dict], marks: Dict):
+        """生成某个表的增量过滤条件 (where, params)"""
+        column, operator = HIGH_WATER_COLUMNS[table]
+        clauses = []
+        params = []
+        if since and since.get(table) is not None:
+            clauses.append(f"{column} {operator} ?")
+            params.append(since[table])
+        if operator == '>' and marks.get(table) is not None:
+            # 自增id有明确的上界，使相邻两次增量备份之间不重叠
+            clauses.append(f"{column} <= ?")
+            params.append(marks[table])
+        return ' AND '.join(clauses), tuple(params)
+
+    # 备份
+    def write_backup(self, db_manager, filepath: str, backup_type: str = FULL,
+                     compression: str = 'gzip', chunk_size: int = 1000) -> Dict:
+        """写入一个全量/增量/差异备份并追加到链清单，返回链条目"""
+        if backup_type not in BACKUP_TYPES:
+            raise ValueError(f'Unknown backup type: {backup_type}')
+
+        backup_type = self.effective_type(backup_type)
+        base = self.base_for(backup_type)
+
+        since = base['marks'] if base else None
+        marks = self.current_marks(db_manager)
+
+        with open_backup_file(filepath + '.tmp', 'w', compression) as f:
+            writer = BackupWriter(f, backup_type=backup_type, compression=compression,
+                                  parent=base['filename'] if base else None,
+                                  since=since, marks=marks)
+            if backup_type != FULL:
+                where, params = self.table_filter(TOMBSTONE_TABLE, since, marks)
+                dump_table(writer, db_manager, TOMBSTONE_TABLE, 'id', where, params, chunk_size)
+            for table, order_by in BACKUP_TABLES:
+                where, params = self.table_filter(table, since, marks)
+                dump_table(writer, db_manager, table, order_by, where, params, chunk_size)
+            trailer = writer.close()
+        os.replace(filepath + '.tmp', filepath)
+
+        entry = {
+            'filename': os.path.basename(filepath),
+            'backup_type': backup_type,
+            'created_at': writer.header['created_at'],
+            'parent': base['filename'] if base else None,
+            'since': since,
+            'marks': marks,
+            'counts': trailer['counts'],
+            'sha256': trailer['sha256'],
+            'size': os.path.getsize(filepath)
+        }
+        self.record(entry)
+
+        if backup_type == FULL:
+            self._prune_tombstones(db_manager)
+        return entry
+
+    def _prune_tombstones(self, db_manager):
+        """删除所有仍存在的全量备份都已包含的墓碑（任何一个全量备份都可能成为之后增量备份的基础）"""
+        marks = [e['marks'].get(TOMBSTONE_TABLE) for e in self.load()
+                 if e['backup_type'] == FULL and os.path.exists(os.path.join(self.backup_dir, e['filename']))]
+        if marks and None not in marks:
+            db_manager.execute_update(f"DELETE FROM {TOMBSTONE_TABLE} WHERE id <= ?", (min(marks),))
+
+    # 压缩备份链
+    def compact(self, compression: str = 'gzip', chunk_size: int = 1000) -> Dict:
+        """把当前链（全量 + 差异 + 增量）合并成一个新的全量备份，不访问线上数据库
+
+        链上的备份按顺序载入临时SQLite数据库（按主键覆盖），再从中导出全量备份，
+        因此内存占用与数据量无关。
+        """
+        chain = self.current_chain()
+        if not chain:
+            raise ValueError('No full backup to compact')
+        if len(chain) == 1:
+            logger.info("Backup chain has a single full backup, nothing to compact")
+            return chain[0]
+
+        work_dir = tempfile.mkdtemp(prefix='backup_compact_', dir=self.backup_dir)
+        try:
+            scratch = DatabaseManager(os.path.join(work_dir, 'compact.db'))
+            for entry in chain:
+                self._load_into(scratch, os.path.join(self.backup_dir, entry['filename']), chunk_size)
+
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"database_backup_{timestamp}_compacted{backup_extension(compression)}"
+            filepath = os.path.join(self.backup_dir, filename)
+
+            marks = chain[-1]['marks']
+            with open_backup_file(filepath + '.tmp', 'w', compression) as f:
+                writer = BackupWriter(f, backup_type=FULL, compression=compression, parent=None, since=None,
+                                      marks=marks, compacted_from=[e['filename'] for e in chain])
+                for table, order_by in BACKUP_TABLES:
+                    dump_table(writer, scratch, table, order_by, chunk_size=chunk_size)
+                trailer = writer.close()
+            os.replace(filepath + '.tmp', filepath)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        entry = {
+            'filename': filename,
+            'backup_type': FULL,
+            'created_at': writer.header['created_at'],
+            'parent': None,
+            'since': None,
+            'marks': marks,
+            'counts': trailer['counts'],
+            'sha256': trailer['sha256'],
+            'size': os.path.getsize(filepath),
+            'compacted_from': [e['filename'] for e in chain]
+        }
+        self.record(entry)
+        logger.info(f"Compacted {len(chain)} backups into {filename}")
+        return entry
+
+    @staticmethod
+    def _load_into(db_manager, path: str, chunk_size: int):
+        """把一个备份文件按主键覆盖写入数据库，并删除墓碑记录的行"""
+        with open_backup_file(path, 'r') as f:
+            for kind, table, rows in iter_backup(f, chunk_size):
+                if kind != 'rows':
+                    continue
+                if table == TOMBSTONE_TABLE:
+                    for target, keys in group_tombstones(rows).items():
+                        db_manager.execute_many(f"DELETE FROM {target} WHERE id = ?", keys)
+                    continue
+                columns = list(rows[0].keys())
+                query = (f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) "
+                         f"VALUES ({', '.join('?' for _ in columns)})")
+                db_manager.execute_many(query, [tuple(row.get(c) for c in columns) for row in rows])
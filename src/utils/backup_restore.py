@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import logging
+from typing import Dict, List, Optional
+
+from utils.backup import (BACKUP_TABLES, TOMBSTONE_TABLE, group_tombstones, iter_backup, open_backup_file,
+                          verify_backup)
+from utils.validation import backup_row_validators
+
+logger = logging.getLogger(__name__)
+
+
+class BackupRestorer:
+    """备份恢复器 - 流式读取（压缩的）备份文件并批量写入数据库
+
+    - 每个数据块通过一次executemany写入并单独提交事务，按主键覆盖（INSERT OR REPLACE），
+      因此重复执行或与增量备份重叠都是安全的；
+    - 加载期间删除各表的二级索引（定义从sqlite_master读取），结束时无论成功与否都重建；
+    - 每次提交后更新断点文件，失败后再次运行会跳过已提交的行继续恢复；
+    - 每块数据用备份行格式验证，不合格的行跳过并计入报告；
+    - 增量/差异备份中的墓碑分段按主键删除对应的行。
+    """
+
+    def __init__(self, db_manager, chunk_size: int = 5000, checkpoint_path: Optional[str] = None):
+        self.db_manager = db_manager
+        self.chunk_size = chunk_size
+        self.checkpoint_path = checkpoint_path or db_manager.db_path + '.restore.json'
+        self._table_columns: Dict[str, List[str]] = {}
+
+    # 断点
+    def _load_checkpoint(self) -> Optional[Dict]:
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _save_checkpoint(self, checkpoint: Dict):
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, ensure_ascii=False)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _clear_checkpoint(self):
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    @staticmethod
+    def _file_signature(path: str) -> List:
+        file_stat = os.stat(path)
+        return [os.path.abspath(path), file_stat.st_size, file_stat.st_mtime_ns]
+
+    # 索引
+    @staticmethod
+    def _drop_indexes(conn) -> List[Dict]:
+        """删除备份表上的二级索引，返回重建所需的SQL"""
+        tables = [table for table, _ in BACKUP_TABLES]
+        rows = conn.execute(
+            f"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+            f"AND tbl_name IN ({', '.join('?' for _ in tables)})", tables
+        ).fetchall()
+        indexes = [{'name': row['name'], 'sql': row['sql']} for row in rows]
+        for index in indexes:
+            conn.execute(f'DROP INDEX IF EXISTS "{index["name"]}"')
+        conn.commit()
+        return indexes
+
+    @staticmethod
+    def _rebuild_indexes(conn, indexes: List[Dict]):
+        for index in indexes:
+            conn.execute(index['sql'].replace('CREATE INDEX', 'CREATE INDEX IF NOT EXISTS', 1)
+                         .replace('CREATE UNIQUE INDEX', 'CREATE UNIQUE INDEX IF NOT EXISTS', 1))
+        conn.commit()
+
+    # 写入
+    def _columns(self, conn, table: str) -> List[str]:
+        if table not in self._table_columns:
+            self._table_columns[table] = [row['name'] for row in conn.execute(f"PRAGMA table_info({table})")]
+        return self._table_columns[table]
+
+    def _insert_chunk(self, conn, table: str, rows: List[Dict]) -> int:
+        """验证并写入一块数据，返回跳过的无效行数"""
+        validator = backup_row_validators.get(table)
+        if validator is not None:
+            report = validator.validate_batch(rows, include_records=False)
+            if report['invalid']:
+                invalid = set(report['invalid_indexes'])
+                logger.warning(f"Skipping {len(invalid)} invalid {table} rows: {report['error_counts']}")
+                rows = [row for i, row in enumerate(rows) if i not in invalid]
+        else:
+            report = {'invalid': 0}
+
+        if rows:
+            # 只写入当前表结构中存在的列（兼容新旧版本的备份）
+            known = self._columns(conn, table)
+            columns = [column for column in rows[0] if column in known]
+            query = (f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) "
+                     f"VALUES ({', '.join('?' for _ in columns)})")
+            conn.executemany(query, [tuple(row.get(column) for column in columns) for row in rows])
+        return report['invalid']
+
+    @staticmethod
+    def _apply_tombstones(conn, rows: List[Dict]):
+        for table, keys in group_tombstones(rows).items():
+            conn.executemany(f"DELETE FROM {table} WHERE id = ?", keys)
+
+    # 恢复
+    def restore(self, paths: List[str], resume: bool = True, clear: bool = False, verify: bool = True) -> Dict:
+        """按顺序恢复一个或多个备份文件（如全量备份 + 增量备份链）"""
+        signatures = [self._file_signature(path) for path in paths]
+        checkpoint = self._load_checkpoint() if resume else None
+        if checkpoint and checkpoint.get('files') != signatures:
+            logger.info("Restore checkpoint belongs to a different set of backups, starting over")
+            checkpoint = None
+
+        stats = {'status': 'success', 'files': len(paths), 'rows': 0, 'tombstones': 0, 'skipped_invalid': 0,
+                 'resumed_rows': 0, 'tables': {}, 'seconds': 0.0, 'rows_per_sec': 0.0}
+
+        if verify and not checkpoint:
+            for path in paths:
+                result = verify_backup(path)
+                if not result['valid']:
+                    raise ValueError(f"Backup {os.path.basename(path)} failed verification: {result['error']}")
+
+        start = time.time()
+        conn = self.db_manager.get_connection()
+        indexes = []
+        try:
+            conn.execute("PRAGMA synchronous = NORMAL")
+
+            if checkpoint:
+                stats['resumed_rows'] = sum(checkpoint['position'])
+                logger.info(f"Resuming restore after {stats['resumed_rows']} rows")
+            else:
+                checkpoint = {'files': signatures, 'position': [0] * len(paths), 'indexes': [], 'clear': clear}
+                if clear:
+                    for table, _ in reversed(BACKUP_TABLES):
+                        conn.execute(f"DELETE FROM {table}")
+                    # 清空产生的墓碑与恢复后的数据无关
+                    conn.execute(f"DELETE FROM {TOMBSTONE_TABLE}")
+                    conn.commit()
+
+            # 索引定义以sqlite_master为准；断点中保存的定义只用于补回被强制终止的上一次运行删除的索引
+            dropped = self._drop_indexes(conn)
+            names = {index['name'] for index in dropped}
+            indexes = dropped + [index for index in checkpoint.get('indexes', []) if index['name'] not in names]
+            checkpoint['indexes'] = indexes
+            self._save_checkpoint(checkpoint)
+
+            for file_index, path in enumerate(paths):
+                done = checkpoint['position'][file_index]
+                seen = 0
+                with open_backup_file(path, 'r') as f:
+                    for kind, table, rows in iter_backup(f, self.chunk_size):
+                        if kind != 'rows':
+                            continue
+
+                        # 跳过已提交的行
+                        if seen + len(rows) <= done:
+                            seen += len(rows)
+                            continue
+                        if seen < done:
+                            rows = rows[done - seen:]
+                            seen = done
+
+                        if table == TOMBSTONE_TABLE:
+                            self._apply_tombstones(conn, rows)
+                            skipped = 0
+                        else:
+                            skipped = self._insert_chunk(conn, table, rows)
+                        seen += len(rows)
+                        checkpoint['position'][file_index] = seen
+                        conn.commit()
+                        self._save_checkpoint(checkpoint)
+
+                        if table == TOMBSTONE_TABLE:
+                            stats['tombstones'] += len(rows)
+                            continue
+                        stats['rows'] += len(rows) - skipped
+                        stats['skipped_invalid'] += skipped
+                        stats['tables'][table] = stats['tables'].get(table, 0) + len(rows) - skipped
+
+            if checkpoint.get('clear'):
+                # 数据库已替换为备份中的状态，恢复过程中执行删除产生的墓碑同样不需要
+                conn.execute(f"DELETE FROM {TOMBSTONE_TABLE}")
+                conn.commit()
+            self._rebuild_indexes(conn, indexes)
+            indexes = []
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Restore failed (run again to resume): {str(e)}")
+            raise
+        finally:
+            # 失败时也重建索引，不让数据库在没有索引的状态下继续提供服务
+            if indexes:
+                try:
+                    self._rebuild_indexes(conn, indexes)
+                except Exception as e:
+                    logger.error(f"Failed to rebuild indexes after restore: {str(e)}")
+            conn.close()
+
+        self._clear_checkpoint()
+        stats['seconds'] = round(time.time() - start, 3)
+        stats['rows_per_sec'] = round(stats['rows'] / stats['seconds'], 1) if stats['seconds'] else 0.0
+        logger.info(f"Restored {stats['rows']} rows in {stats['seconds']}s ({stats['rows_per_sec']} rows/sec)")
+        return stats
@@ -0,0 +1,126 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from flask import has_request_context, request
+
+from utils import serialization
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_REQUESTS = 20
+SAFE_METHODS = ('GET', 'HEAD')
+
+# 子请求environ中指向外层（/api/batch）请求environ的键，供指标等按请求统计的组件找到外层请求
+PARENT_ENVIRON_KEY = 'vd.parent_environ'
+
+
+class BatchRequestError(ValueError):
+    """批量请求格式错误"""
+
+
+class BatchExecutor:
+    """批量请求执行器 - 在进程内依次分发子请求，把多次往返合并为一次
+
+    子请求经过完整的Flask请求流程（路由、钩子、错误处理），结果与单独请求一致。
+    相邻的GET子请求在线程池中并行执行；写请求（POST/DELETE等）按顺序执行，
+    并作为屏障：它之前的子请求全部完成后才执行，它之后的子请求能看到它的结果。
+    """
+
+    def __init__(self, app, max_workers: int = 4, max_requests: int = MAX_BATCH_REQUESTS):
+        self.app = app
+        self.max_workers = max_workers
+        self.max_requests = max_requests
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        # 第一次使用时才创建线程（多进程部署时在fork之后）
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix='batch')
+        return self._executor
+
+    def parse(self, data) -> List[Dict]:
+        """验证并规范化子请求列表"""
+        if not isinstance(data, dict) or not isinstance(data.get('requests'), list):
+            raise BatchRequestError('Body must be an object with a "requests" list')
+        requests = data['requests']
+        if not requests:
+            raise BatchRequestError('At least one request is required')
+        if len(requests) > self.max_requests:
+            raise BatchRequestError(f'At most {self.max_requests} requests per batch')
+
+        parsed = []
+        for index, item in enumerate(requests):
+            if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+                raise BatchRequestError(f'Request {index} must be an object with a "path"')
+            path = item['path']
+            if not path.startswith('/api/') or path.split('?', 1)[0].rstrip('/') == '/api/batch':
+                raise BatchRequestError(f'Request {index}: only /api/ paths can be batched')
+            parsed.append({
+                'id': str(item.get('id', index)),
+                'method': str(item.get('method', 'GET')).upper(),
+                'path': path,
+                'body': item.get('body')
+            })
+        return parsed
+
+    def _dispatch(self, sub_request: Dict, parent_environ: Optional[Dict] = None) -> Dict:
+        """在新的请求上下文中执行一个子请求"""
+        kwargs = {'method': sub_request['method'], 'environ_base': {PARENT_ENVIRON_KEY: parent_environ}}
+        if sub_request['body'] is not None:
+            kwargs['data'] = serialization.dumps_bytes(sub_request['body'])
+            kwargs['content_type'] = 'application/json'
+
+        try:
+            with self.app.test_request_context(sub_request['path'], **kwargs):
+                response = self.app.full_dispatch_request()
+                response.direct_passthrough = False  # 文件响应也读入内存
+                data = response.get_data()
+                response.close()
+                if response.is_json:
+                    body = serialization.loads(data) if data else None
+                else:
+                    body = data.decode('utf-8', errors='replace')
+                return {'id': sub_request['id'], 'status': response.status_code, 'body': body}
+
+        except Exception as e:
+            logger.error(f"Batch sub-request failed: {sub_request['method']} {sub_request['path']}: {str(e)}")
+            return {'id': sub_request['id'], 'status': 500, 'body': {'error': 'Internal server error'}}
+
+    def execute(self, sub_requests: List[Dict]) -> List[Dict]:
+        """执行子请求，按请求顺序返回结果"""
+        results: List[Optional[Dict]] = [None] * len(sub_requests)
+        pending = []  # 等待并行执行的相邻GET请求: (位置, 子请求)
+        # 并行的子请求在其他线程中执行，通过environ把外层请求传给它们
+        parent_environ = request.environ if has_request_context() else None
+
+        def flush():
+            if len(pending) == 1:
+                index, sub_request = pending[0]
+                results[index] = self._dispatch(sub_request, parent_environ)
+            elif pending:
+                futures = [(index, self.executor.submit(self._dispatch, sub_request, parent_environ))
+                           for index, sub_request in pending]
+                for index, future in futures:
+                    results[index] = future.result()
+            pending.clear()
+
+        for index, sub_request in enumerate(sub_requests):
+            if sub_request['method'] in SAFE_METHODS:
+                pending.append((index, sub_request))
+            else:
+                flush()
+                results[index] = self._dispatch(sub_request, parent_environ)
+        flush()
+        return results
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
@@ -0,0 +1,251 @@
+import time
+import zlib
+import logging
+import threading
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+from flask import current_app, request
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+try:
+    # 可选依赖：安装brotli后，浏览器支持时优先使用br编码（JSON压缩率比gzip高15-25%）
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/javascript',
+    'application/x-ndjson',
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/javascript',
+}
+
+DEFAULT_MIN_SIZE = 1024  # 小于该字节数的响应不压缩（压缩头部开销和CPU时间得不偿失）
+
+
+def compress(enabled: bool = True, min_size: Optional[int] = None, level: Optional[int] = None):
+    """路由级压缩配置装饰器（放在@app.route下方）
+
+    @compress(enabled=False) 关闭该路由的压缩；min_size/level覆盖全局设置。
+    """
+    def decorator(view: Callable) -> Callable:
+        view._compression = {'enabled': enabled, 'min_size': min_size, 'level': level}
+        return view
+    return decorator
+
+
+class _GzipEncoder:
+    """gzip编码器（zlib，wbits=31输出gzip格式）"""
+
+    name = 'gzip'
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def process(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliEncoder:
+    name = 'br'
+
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def process(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ResponseCompressor:
+    """响应压缩 - 按Accept-Encoding协商br/gzip压缩较大的文本和JSON响应
+
+    - 普通响应整体压缩；流式响应（生成器、send_file）逐块压缩并在每块后刷新，
+      客户端可以立即收到已生成的部分，服务端不需要缓冲整个响应；
+    - 已编码、部分内容（206）、带Cache-Control: no-transform或类型不可压缩的响应保持原样；
+    - 统计压缩前后字节数、压缩率和压缩耗费的CPU时间。
+    """
+
+    def __init__(self, app=None, min_size: int = DEFAULT_MIN_SIZE, level: int = 6, brotli_quality: int = 4,
+                 mimetypes: Optional[Iterable[str]] = None):
+        self.min_size = min_size
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.mimetypes = set(mimetypes or COMPRESSIBLE_MIMETYPES)
+        self.encodings = (['br'] if brotli is not None else []) + ['gzip']
+
+        self._lock = threading.Lock()
+        self._stats = {'compressed': 0, 'skipped': 0, 'streamed': 0, 'bytes_in': 0, 'bytes_out': 0,
+                       'cpu_seconds': 0.0, 'by_encoding': {}}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.after_request(self.after_request)
+        app.extensions['compression'] = self
+        metrics.registry.register_collector('compression', self._collect_metrics)
+
+    # 协商
+    def _route_options(self) -> Dict:
+        view = current_app.view_functions.get(request.endpoint) if request.endpoint else None
+        return getattr(view, '_compression', None) or {}
+
+    def _choose_encoding(self) -> Optional[str]:
+        encoding = request.accept_encodings.best_match(self.encodings)
+        return encoding if encoding in self.encodings else None
+
+    def _should_compress(self, response, options: Dict) -> bool:
+        if not options.get('enabled', True):
+            return False
+        if response.status_code != 200 or request.method == 'HEAD':
+            return False
+        if 'Content-Encoding' in response.headers or 'Content-Range' in response.headers:
+            return False
+        if response.mimetype not in self.mimetypes:
+            return False
+        if 'no-transform' in response.headers.get('Cache-Control', ''):
+            return False
+        min_size = options.get('min_size')
+        min_size = self.min_size if min_size is None else min_size
+        length = response.content_length
+        if length is not None and length < min_size:
+            return False
+        return True
+
+    def _encoder(self, encoding: str, options: Dict):
+        if encoding == 'br':
+            return _BrotliEncoder(self.brotli_quality)
+        level = options.get('level')
+        return _GzipEncoder(self.level if level is None else level)
+
+    # 压缩
+    def after_request(self, response):
+        options = self._route_options()
+        if not self._should_compress(response, options):
+            self._record_skip()
+            return response
+
+        # 不同Accept-Encoding得到不同的响应，缓存需要区分
+        response.vary.add('Accept-Encoding')
+        encoding = self._choose_encoding()
+        if encoding is None:
+            self._record_skip()
+            return response
+
+        if response.is_streamed or response.direct_passthrough:
+            response.response = self._compress_stream(response.response, self._encoder(encoding, options))
+            response.direct_passthrough = False
+            response.headers.pop('Content-Length', None)
+            response.headers.pop('Accept-Ranges', None)
+            response.headers['Content-Encoding'] = encoding
+            self._weaken_etag(response)
+            return response
+
+        data = response.get_data()
+        min_size = options.get('min_size')
+        if len(data) < (self.min_size if min_size is None else min_size):
+            self._record_skip()
+            return response
+
+        start = time.thread_time()
+        encoder = self._encoder(encoding, options)
+        compressed = encoder.process(data) + encoder.finish()
+        cpu = time.thread_time() - start
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        self._weaken_etag(response)
+        self._record(encoding, len(data), len(compressed), cpu)
+        return response
+
+    @staticmethod
+    def _weaken_etag(response):
+        if response.headers.get('ETag'):
+            # 压缩后字节不同，强ETag改为弱ETag
+            etag, weak = response.get_etag()
+            response.set_etag(etag, weak=True)
+
+    def _compress_stream(self, body: Iterable[bytes], encoder) -> Iterator[bytes]:
+        bytes_in = bytes_out = 0
+        cpu = 0.0
+        try:
+            for chunk in body:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                if not chunk:
+                    continue
+                start = time.thread_time()
+                out = encoder.process(chunk) + encoder.flush()
+                cpu += time.thread_time() - start
+                bytes_in += len(chunk)
+                bytes_out += len(out)
+                if out:
+                    yield out
+            start = time.thread_time()
+            tail = encoder.finish()
+            cpu += time.thread_time() - start
+            bytes_out += len(tail)
+            if tail:
+                yield tail
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+            self._record(encoder.name, bytes_in, bytes_out, cpu, streamed=True)
+
+    # 统计
+    def _record_skip(self):
+        with self._lock:
+            self._stats['skipped'] += 1
+
+    def _record(self, encoding: str, bytes_in: int, bytes_out: int, cpu: float, streamed: bool = False):
+        with self._lock:
+            stats = self._stats
+            stats['compressed'] += 1
+            stats['streamed'] += int(streamed)
+            stats['bytes_in'] += bytes_in
+            stats['bytes_out'] += bytes_out
+            stats['cpu_seconds'] += cpu
+            stats['by_encoding'][encoding] = stats['by_encoding'].get(encoding, 0) + 1
+
+    def _collect_metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+        return [
+            ('http_compression_bytes_in_total', 'counter', 'Response bytes before compression',
+             [({}, stats['bytes_in'])]),
+            ('http_compression_bytes_out_total', 'counter', 'Response bytes after compression',
+             [({}, stats['bytes_out'])]),
+            ('http_compression_cpu_seconds_total', 'counter', 'CPU time spent compressing responses',
+             [({}, stats['cpu_seconds'])]),
+        ]
+
+    def get_stats(self) -> Dict:
+        """获取压缩统计（压缩率 = 压缩后字节 / 压缩前字节）"""
+        with self._lock:
+            stats = dict(self._stats, by_encoding=dict(self._stats['by_encoding']))
+        stats['ratio'] = round(stats['bytes_out'] / stats['bytes_in'], 4) if stats['bytes_in'] else None
+        stats['bytes_saved'] = stats['bytes_in'] - stats['bytes_out']
+        stats['cpu_ms_per_response'] = (round(stats['cpu_seconds'] * 1000 / stats['compressed'], 3)
+                                        if stats['compressed'] else None)
+        stats['cpu_seconds'] = round(stats['cpu_seconds'], 6)
+        stats['encodings'] = list(self.encodings)
+        stats['min_size'] = self.min_size
+        return stats
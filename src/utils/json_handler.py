@@ -1,15 +1,37 @@
-import json
 import os
+import re
+import base64
+import hashlib
 import logging
+import threading
 from datetime import datetime
 from typing import Dict, List, Any, Optional
+from utils.validation import export_file_validator
+from utils import serialization
+from utils.backup import backup_extension
+from utils.backup_chain import BackupChain
 
 logger = logging.getLogger(__name__)
 
+# 导出文件名格式：<类型>_<患者ID>_<时间戳>.json
+EXPORT_FILENAME_PATTERN = re.compile(r'^(patient|chat_history|diagnosis_report)_(.+)_(\d{8}_\d{6})\.json$')
+BACKUP_FILENAME_PATTERN = re.compile(r'^database_backup_.+\.(json|ndjson|ndjson\.gz|ndjson\.zst)$')
+
+# 每次导出都会变化的时间字段：计算内容哈希前置空，单独保存在目录表中
+VOLATILE_FIELDS = {
+    'patient': ('export_info', 'export_timestamp'),
+    'chat_history': ('export_timestamp',),
+    'diagnosis_report': ('report_timestamp',),
+    'backup': ('backup_timestamp',),
+}
+
 class JSONHandler:
     """JSON处理工具 - 处理数据的导入导出"""
     
-    def __init__(self, export_dir: str = 'exports'):
+    # 导出列表单页最大条数
+    MAX_PAGE_SIZE = 500
+    
+    def __init__(self, export_dir: str = 'exports', db_manager=None):
         import os
         # 确保导出文件存储在项目根目录的exports文件夹中
         if not os.path.isabs(export_dir):
@@ -18,6 +40,16 @@ class JSONHandler:
         else:
             self.export_dir = export_dir
         self._ensure_export_dir()
+        
+        # 有数据库时使用导出目录表，否则退回到列目录
+        self.db_manager = db_manager
+        self.blob_dir = os.path.join(self.export_dir, 'blobs')
+        # 按内容哈希存储的导出在需要文件路径时还原到这里（见export_path）
+        self.materialized_dir = os.path.join(self.blob_dir, 'files')
+        self._blob_lock = threading.Lock()
+        # 已有导出文件的登记推迟到第一次读写目录表时（或由 manage.py bootstrap 完成），创建实例不访问数据库
+        self._catalog_checked = db_manager is None
+        self._catalog_lock = threading.Lock()
     
     def _ensure_export_dir(self):
         """确保导出目录存在"""
@@ -30,13 +62,11 @@ class JSONHandler:
         try:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"patient_{patient_id}_{timestamp}.json"
-            filepath = os.path.join(self.export_dir, filename)
             
             # 格式化数据以便阅读
             formatted_data = self._format_export_data(data)
             
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(formatted_data, f, ensure_ascii=False, indent=2)
+            filepath = self._write_export(filename, formatted_data, 'patient', patient_id)
             
             logger.info(f"患者数据已保存: {filepath}")
             return filename
@@ -45,17 +75,30 @@ class JSONHandler:
             logger.error(f"保存患者数据错误: {str(e)}")
             raise
     
+    def save_training_patient_data(self, patient_id: str, original_data: Dict) -> str:
+        """保存训练数据患者（原始格式）到JSON文件"""
+        try:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"patient_{patient_id}_{timestamp}.json"
+            filepath = self._write_export(filename, original_data, 'patient', patient_id)
+            
+            logger.info(f"训练数据患者已保存: {filepath}")
+            return filename
+            
+        except Exception as e:
+            logger.error(f"保存训练数据患者错误: {str(e)}")
+            raise
+    
     def load_patient_data(self, filename: str) -> Optional[Dict]:
         """从JSON文件加载患者数据"""
         try:
             filepath = os.path.join(self.export_dir, filename)
             
-            if not os.path.exists(filepath):
+            if self.get_export_entry(filename) is None and not os.path.exists(filepath):
                 logger.error(f"文件不存在: {filepath}")
                 return None
             
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = serialization.loads(self.read_export(filename))
             
             logger.info(f"患者数据已加载: {filepath}")
             return data
@@ -69,7 +112,6 @@ class JSONHandler:
         try:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"chat_history_{patient_id}_{timestamp}.json"
-            filepath = os.path.join(self.export_dir, filename)
             
             export_data = {
                 'patient_id': patient_id,
@@ -78,8 +120,7 @@ class JSONHandler:
                 'chat_history': chat_history
             }
             
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(export_data, f, ensure_ascii=False, indent=2)
+            filepath = self._write_export(filename, export_data, 'chat_history', patient_id)
             
             logger.info(f"聊天历史已保存: {filepath}")
             return filename
@@ -93,7 +134,6 @@ class JSONHandler:
         try:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"diagnosis_report_{patient_id}_{timestamp}.json"
-            filepath = os.path.join(self.export_dir, filename)
             
             report_data = {
                 'patient_id': patient_id,
@@ -101,8 +141,7 @@ class JSONHandler:
                 'diagnosis': diagnosis_data
             }
             
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(report_data, f, ensure_ascii=False, indent=2)
+            filepath = self._write_export(filename, report_data, 'diagnosis_report', patient_id)
             
             logger.info(f"诊断报告已保存: {filepath}")
             return filename
@@ -114,8 +153,7 @@ class JSONHandler:
     def import_patient_data(self, filepath: str) -> Dict:
         """从JSON文件导入患者数据"""
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = serialization.load_file(filepath)
             
             # 验证数据格式
             if not self._validate_patient_data(data):
@@ -144,8 +182,7 @@ class JSONHandler:
                 'chat_messages': all_chats
             }
             
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(backup_data, f, ensure_ascii=False, indent=2)
+            self._write_export(filename, backup_data, 'backup')
             
             logger.info(f"数据库备份已保存: {filepath}")
             return filename
@@ -154,6 +191,40 @@ class JSONHandler:
             logger.error(f"导出数据库备份错误: {str(e)}")
             raise
     
+    def export_database_backup_stream(self, db_manager, compression: str = 'gzip',
+                                      chunk_size: int = 1000, backup_type: str = 'full') -> Dict:
+        """流式导出数据库备份（NDJSON分段 + gzip/zstd压缩），内存占用与数据库大小无关
+        
+        backup_type为 full / incremental / differential；增量和差异备份只导出
+        备份链上一个备份的高水位之后变化的行和删除记录。
+        """
+        filepath = None
+        try:
+            chain = self.get_backup_chain()
+            backup_type = chain.effective_type(backup_type)
+            
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            suffix = '' if backup_type == 'full' else f'_{backup_type}'
+            filename = f"database_backup_{timestamp}{suffix}{backup_extension(compression)}"
+            filepath = os.path.join(self.export_dir, filename)
+            
+            # 先写入临时文件，完成后再重命名，避免留下不完整的备份
+            entry = chain.write_backup(db_manager, filepath, backup_type, compression, chunk_size)
+            self.register_export(filename, kind='backup')
+            
+            logger.info(f"数据库备份已保存: {filepath} ({entry['backup_type']}, {sum(entry['counts'].values())} 行)")
+            return entry
+            
+        except Exception as e:
+            logger.error(f"导出数据库备份错误: {str(e)}")
+            if filepath and os.path.exists(filepath + '.tmp'):
+                os.remove(filepath + '.tmp')
+            raise
+    
+    def get_backup_chain(self) -> BackupChain:
+        """导出目录下的备份链"""
+        return BackupChain(self.export_dir)
+    
     def _format_export_data(self, data: Dict) -> Dict:
         """格式化导出数据"""
         return {
@@ -201,34 +272,384 @@ class JSONHandler:
     
     def _validate_patient_data(self, data: Dict) -> bool:
         """验证患者数据格式"""
+        return export_file_validator.validate(data)['valid']
+    
+    # 导出存储（save_*返回的文件名在有数据库时不一定在导出目录中，通过export_path或read_export访问）
+    def _write_export(self, filename: str, data: Any, kind: str, patient_id: Optional[str] = None) -> str:
+        """写入导出内容并登记到目录表
+        
+        有数据库时按内容哈希存储（时间字段不计入哈希），内容未变化的重复导出只增加引用计数；
+        否则直接写入导出目录中的文件。返回实际存储路径。
+        """
+        if self.db_manager is None:
+            filepath = os.path.join(self.export_dir, filename)
+            with open(filepath, 'wb') as f:
+                f.write(serialization.dumps_bytes(data, pretty=True))
+            return filepath
+        
+        self._sync_catalog_if_empty()
+        stable_data, export_timestamp = self._split_volatile(data, kind)
+        content = serialization.dumps_bytes(stable_data, pretty=True)
+        sha256 = hashlib.sha256(content).hexdigest()
+        
+        with self._blob_lock:
+            # 先写blob再登记，目录表中的条目总是指向已存在的文件
+            blob_path = self._store_blob(sha256, content)
+            with self.db_manager.get_connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                # 其他进程可能在写入之后、加锁之前回收了同一个blob：持有写锁时再确认一次
+                self._store_blob(sha256, content)
+                previous = conn.execute(
+                    "SELECT sha256, storage FROM export_catalog WHERE filename = ?", (filename,)
+                ).fetchone()
+                conn.execute('''
+                    INSERT INTO export_blobs (sha256, size, refcount) VALUES (?, ?, 1)
+                    ON CONFLICT(sha256) DO UPDATE SET refcount = refcount + 1
+                ''', (sha256, len(content)))
+                now = datetime.now().isoformat()
+                conn.execute('''
+                    INSERT OR REPLACE INTO export_catalog
+                        (filename, patient_id, kind, size, sha256, created_at, modified_at, storage, export_timestamp)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, 'blob', ?)
+                ''', (filename, patient_id, kind, len(content), sha256, now, now, export_timestamp))
+                released = self._release_blob(conn, previous['sha256']) if previous and previous['storage'] == 'blob' else None
+                conn.commit()
+            
+            self._remove_materialized(filename)
+            if released:
+                self._collect_blob(released)
+        
+        return blob_path
+    
+    @staticmethod
+    def _write_atomic(path: str, content: bytes):
+        """临时文件 + os.replace 写入（临时文件名按进程和线程区分）"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    
+    def _store_blob(self, sha256: str, content: bytes) -> str:
+        """写入blob文件（相同内容已存在时无需再写），返回路径"""
+        blob_path = self._blob_path(sha256)
+        if not os.path.exists(blob_path):
+            self._write_atomic(blob_path, content)
+        return blob_path
+    
+    def _blob_path(self, sha256: str) -> str:
+        return os.path.join(self.blob_dir, sha256[:2], f'{sha256}.json')
+    
+    @staticmethod
+    def _split_volatile(data: Any, kind: str) -> tuple:
+        """返回 (时间字段置空后的数据, 时间字段的值)，不修改传入的数据"""
+        path = VOLATILE_FIELDS.get(kind)
+        if not path or not isinstance(data, dict):
+            return data, None
+        
+        stable = dict(data)
+        parent = stable
+        for key in path[:-1]:
+            if not isinstance(parent.get(key), dict):
+                return data, None
+            parent[key] = dict(parent[key])
+            parent = parent[key]
+        value = parent.get(path[-1])
+        if path[-1] in parent:
+            parent[path[-1]] = None
+        return stable, value
+    
+    @staticmethod
+    def _restore_volatile(data: Any, kind: str, value: Optional[str]) -> Any:
+        path = VOLATILE_FIELDS.get(kind)
+        if not path or value is None or not isinstance(data, dict):
+            return data
+        parent = data
+        for key in path[:-1]:
+            parent = parent.get(key)
+            if not isinstance(parent, dict):
+                return data
+        if path[-1] in parent:
+            parent[path[-1]] = value
+        return data
+    
+    @staticmethod
+    def _release_blob(conn, sha256: str) -> Optional[str]:
+        """引用计数减一；归零时删除记录并返回需要删除的blob"""
+        conn.execute("UPDATE export_blobs SET refcount = refcount - 1 WHERE sha256 = ?", (sha256,))
+        row = conn.execute("SELECT refcount FROM export_blobs WHERE sha256 = ?", (sha256,)).fetchone()
+        if row is not None and row['refcount'] <= 0:
+            conn.execute("DELETE FROM export_blobs WHERE sha256 = ?", (sha256,))
+            return sha256
+        return None
+    
+    def _collect_blob(self, sha256: str):
+        """回收引用计数已归零的blob：在新的写事务中确认仍未被引用后才删除文件
+        
+        写入方在自己的写事务中确认blob存在后才增加引用，因此两者不会交错。
+        """
+        with self.db_manager.get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT refcount FROM export_blobs WHERE sha256 = ?", (sha256,)).fetchone()
+            if row is None or row['refcount'] <= 0:
+                blob_path = self._blob_path(sha256)
+                if os.path.exists(blob_path):
+                    os.remove(blob_path)
+                    logger.info(f"删除未引用的导出内容: {sha256}")
+            conn.commit()
+    
+    def _remove_materialized(self, filename: str):
+        """删除还原出的完整文件（包括materialize_exports写到导出目录中的副本），内容已变化或导出已删除"""
+        for directory in (self.materialized_dir, self.export_dir):
+            path = os.path.join(directory, filename)
+            if os.path.exists(path):
+                os.remove(path)
+    
+    def _materialize(self, entry: Dict, path: str):
+        """把blob存储的导出还原为完整文件：没有时间字段时直接硬链接blob，否则写入还原后的内容"""
+        if entry['export_timestamp'] is None:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.link(self._blob_path(entry['sha256']), path)
+                return
+            except OSError:
+                pass  # 不支持硬链接（或跨文件系统）时写入副本
+        self._write_atomic(path, self.read_export(entry['filename']))
+    
+    def export_path(self, filename: str) -> str:
+        """导出文件的路径：导出目录中的文件直接返回；按内容哈希存储的导出在第一次请求时还原为完整文件"""
+        filename = os.path.basename(filename)
+        entry = self.get_export_entry(filename)
+        if entry is None or entry['storage'] != 'blob':
+            return os.path.join(self.export_dir, filename)
+        
+        for path in (os.path.join(self.export_dir, filename), os.path.join(self.materialized_dir, filename)):
+            if os.path.exists(path):
+                return path
+        self._materialize(entry, path)
+        return path
+    
+    def materialize_exports(self, patient_id: Optional[str] = None) -> Dict:
+        """把blob存储的导出还原为导出目录中的普通文件（manage.py export-files）
+        
+        导出默认只按内容哈希保存在 exports/blobs 中；需要直接从导出目录收集文件时运行一次。
+        已存在的文件不会重写，导出被覆盖或删除时对应的文件一并删除。
+        """
+        self._sync_catalog_if_empty()
+        query = "SELECT * FROM export_catalog WHERE storage = 'blob'"
+        params: tuple = ()
+        if patient_id is not None:
+            query += " AND patient_id = ?"
+            params = (patient_id,)
+        
+        stats = {'written': 0, 'existing': 0}
+        for rows in self.db_manager.iter_query(query, params):
+            for entry in rows:
+                path = os.path.join(self.export_dir, entry['filename'])
+                if os.path.exists(path):
+                    stats['existing'] += 1
+                    continue
+                self._materialize(entry, path)
+                stats['written'] += 1
+        logger.info(f"导出文件已还原到导出目录: {stats}")
+        return stats
+    
+    def get_export_entry(self, filename: str) -> Optional[Dict]:
+        """获取导出文件的目录表条目"""
+        if self.db_manager is None:
+            return None
+        rows = self.db_manager.execute_query(
+            "SELECT * FROM export_catalog WHERE filename = ?", (os.path.basename(filename),)
+        )
+        return rows[0] if rows else None
+    
+    def read_export(self, filename: str) -> bytes:
+        """读取导出文件内容（blob存储时还原时间字段）"""
+        entry = self.get_export_entry(filename)
+        if entry is None or entry['storage'] != 'blob':
+            with open(os.path.join(self.export_dir, os.path.basename(filename)), 'rb') as f:
+                return f.read()
+        
+        with open(self._blob_path(entry['sha256']), 'rb') as f:
+            content = f.read()
+        if entry['export_timestamp'] is None:
+            return content
+        data = self._restore_volatile(serialization.loads(content), entry['kind'], entry['export_timestamp'])
+        return serialization.dumps_bytes(data, pretty=True)
+    
+    # 导出目录表
+    
+    @staticmethod
+    def _classify_export(filename: str) -> Optional[tuple]:
+        """根据文件名判断导出类型和患者ID，不是导出文件时返回None"""
+        match = EXPORT_FILENAME_PATTERN.match(filename)
+        if match:
+            return match.group(1), match.group(2)
+        if BACKUP_FILENAME_PATTERN.match(filename):
+            return 'backup', None
+        if filename.endswith('.json'):
+            return 'other', None
+        return None
+    
+    @staticmethod
+    def _file_sha256(filepath: str) -> str:
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def register_export(self, filename: str, patient_id: Optional[str] = None, kind: Optional[str] = None,
+                        sha256: Optional[str] = None):
+        """登记（或更新）一个导出文件"""
+        if self.db_manager is None:
+            return
+        self._sync_catalog_if_empty()
+        
+        filepath = os.path.join(self.export_dir, filename)
+        stat = os.stat(filepath)
+        if kind is None:
+            kind, patient_id = self._classify_export(filename) or ('other', patient_id)
+        
+        self.db_manager.execute_update('''
+            INSERT OR REPLACE INTO export_catalog
+                (filename, patient_id, kind, size, sha256, created_at, modified_at, storage)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 'file')
+        ''', (
+            filename, patient_id, kind, stat.st_size, sha256 or self._file_sha256(filepath),
+            datetime.fromtimestamp(stat.st_ctime).isoformat(),
+            datetime.fromtimestamp(stat.st_mtime).isoformat()
+        ))
+    
+    def _sync_catalog_if_empty(self):
+        """目录表为空时从导出目录导入已有文件（每个实例只在第一次读写目录表前检查一次）"""
+        if self._catalog_checked:
+            return
+        with self._catalog_lock:
+            if self._catalog_checked:
+                return
+            self._catalog_checked = True
+            try:
+                if self.db_manager.execute_query("SELECT 1 FROM export_catalog LIMIT 1"):
+                    return
+                self.sync_catalog()
+            except Exception as e:
+                logger.error(f"同步导出目录表错误: {str(e)}")
+    
+    def sync_catalog(self) -> Dict:
+        """以导出目录为准重建目录表：登记新文件、删除已不存在的条目（blob存储的条目不受影响）"""
+        catalog = self.db_manager.execute_query("SELECT filename, size, modified_at, storage FROM export_catalog")
+        known = {row['filename']: row for row in catalog if row['storage'] == 'file'}
+        # materialize_exports写出的副本仍由blob条目管理
+        materialized = {row['filename'] for row in catalog if row['storage'] == 'blob'}
+        present = set()
+        added = 0
+        for filename in os.listdir(self.export_dir):
+            if self._classify_export(filename) is None or filename in materialized:
+                continue
+            present.add(filename)
+            stat = os.stat(os.path.join(self.export_dir, filename))
+            row = known.get(filename)
+            if row and row['size'] == stat.st_size and row['modified_at'] == datetime.fromtimestamp(stat.st_mtime).isoformat():
+                continue
+            self.register_export(filename)
+            added += 1
+        
+        removed = [(filename,) for filename in known if filename not in present]
+        if removed:
+            self.db_manager.execute_many("DELETE FROM export_catalog WHERE filename = ?", removed)
+        
+        logger.info(f"导出目录表已同步: 新增/更新 {added}, 删除 {len(removed)}")
+        return {'added': added, 'removed': len(removed), 'total': len(present)}
+    
+    def list_exports(self, limit: int = 50, cursor: Optional[str] = None,
+                     patient_id: Optional[str] = None, kind: Optional[str] = None) -> Dict:
+        """分页获取导出文件列表（按修改时间倒序），可按患者和类型过滤"""
+        limit = max(1, min(limit, self.MAX_PAGE_SIZE))
+        
+        if self.db_manager is None:
+            files = [f for f in self.get_export_files()
+                     if (patient_id is None or f.get('patient_id') == patient_id) and (kind is None or f.get('kind') == kind)]
+            start = int(self._decode_cursor(cursor)) if cursor else 0
+            page = files[start:start + limit]
+            has_more = start + limit < len(files)
+            return {'files': page, 'next_cursor': self._encode_cursor(str(start + limit)) if has_more else None,
+                    'has_more': has_more, 'limit': limit}
+        
+        self._sync_catalog_if_empty()
+        clauses = []
+        params: List[Any] = []
+        if patient_id is not None:
+            clauses.append("patient_id = ?")
+            params.append(patient_id)
+        if kind is not None:
+            clauses.append("kind = ?")
+            params.append(kind)
+        if cursor:
+            modified_at, _, filename = self._decode_cursor(cursor).partition('|')
+            clauses.append("(modified_at < ? OR (modified_at = ? AND filename < ?))")
+            params.extend([modified_at, modified_at, filename])
+        
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self.db_manager.execute_query(f'''
+            SELECT filename, patient_id, kind, size, sha256, created_at, modified_at
+            FROM export_catalog {where}
+            ORDER BY modified_at DESC, filename DESC
+            LIMIT ?
+        ''', tuple(params) + (limit + 1,))
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        files = [self._catalog_entry(row) for row in rows]
+        next_cursor = self._encode_cursor(f"{rows[-1]['modified_at']}|{rows[-1]['filename']}") if has_more else None
+        return {'files': files, 'next_cursor': next_cursor, 'has_more': has_more, 'limit': limit}
+    
+    @staticmethod
+    def _catalog_entry(row: Dict) -> Dict:
+        return {
+            'filename': row['filename'],
+            'patient_id': row['patient_id'],
+            'kind': row['kind'],
+            'size': row['size'],
+            'sha256': row['sha256'],
+            'created_time': row['created_at'],
+            'modified_time': row['modified_at']
+        }
+    
+    @staticmethod
+    def _encode_cursor(value: str) -> str:
+        return base64.urlsafe_b64encode(value.encode('utf-8')).decode('ascii').rstrip('=')
+    
+    @staticmethod
+    def _decode_cursor(cursor: str) -> str:
         try:
-            # 检查必要字段
-            if 'patient_data' not in data:
-                return False
-            
-            patient_data = data['patient_data']
-            required_fields = ['name']
-            
-            for field in required_fields:
-                if field not in patient_data:
-                    return False
-            
-            return True
-            
-        except Exception:
-            return False
+            padded = cursor + '=' * (-len(cursor) % 4)
+            return base64.b64decode(padded.encode('ascii'), altchars=b'-_', validate=True).decode('utf-8')
+        except (ValueError, UnicodeError):
+            raise ValueError('Invalid cursor')
     
     def get_export_files(self) -> List[Dict]:
         """获取所有导出文件列表"""
         try:
+            if self.db_manager is not None:
+                self._sync_catalog_if_empty()
+                rows = self.db_manager.execute_query('''
+                    SELECT filename, patient_id, kind, size, sha256, created_at, modified_at
+                    FROM export_catalog ORDER BY modified_at DESC, filename DESC
+                ''')
+                return [self._catalog_entry(row) for row in rows]
+            
             files = []
             for filename in os.listdir(self.export_dir):
                 if filename.endswith('.json'):
                     filepath = os.path.join(self.export_dir, filename)
                     stat = os.stat(filepath)
+                    kind, patient_id = self._classify_export(filename)
                     
                     files.append({
                         'filename': filename,
+                        'patient_id': patient_id,
+                        'kind': kind,
                         'size': stat.st_size,
                         'created_time': datetime.fromtimestamp(stat.st_ctime).isoformat(),
                         'modified_time': datetime.fromtimestamp(stat.st_mtime).isoformat()
@@ -245,7 +666,28 @@ class JSONHandler:
     def delete_export_file(self, filename: str) -> bool:
         """删除导出文件"""
         try:
+            filename = os.path.basename(filename)
             filepath = os.path.join(self.export_dir, filename)
+            if self.db_manager is not None:
+                self._sync_catalog_if_empty()
+                with self._blob_lock:
+                    with self.db_manager.get_connection() as conn:
+                        conn.execute("BEGIN IMMEDIATE")
+                        entry = conn.execute(
+                            "SELECT sha256, storage FROM export_catalog WHERE filename = ?", (filename,)
+                        ).fetchone()
+                        conn.execute("DELETE FROM export_catalog WHERE filename = ?", (filename,))
+                        released = self._release_blob(conn, entry['sha256']) if entry and entry['storage'] == 'blob' else None
+                        conn.commit()
+                    
+                    # 最后一个引用被删除时回收blob
+                    if entry is not None and entry['storage'] == 'blob':
+                        self._remove_materialized(filename)
+                    if released:
+                        self._collect_blob(released)
+                if entry is not None and entry['storage'] == 'blob':
+                    logger.info(f"删除导出文件: {filename}")
+                    return True
             if os.path.exists(filepath):
                 os.remove(filepath)
                 logger.info(f"删除导出文件: {filepath}")
@@ -254,4 +696,4 @@ class JSONHandler:
             
         except Exception as e:
             logger.error(f"删除导出文件错误: {str(e)}")
-            return False 
\ No newline at end of file
+            return False
@@ -0,0 +1,407 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    from flask import request
+    from utils.batch import PARENT_ENVIRON_KEY
+except ImportError:
+    # 模型训练脚本等非Web环境只使用指标注册表
+    request = None
+    PARENT_ENVIRON_KEY = None
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# 采集器返回的指标族: (名称, 类型, 说明, [(标签字典, 值[, 名称后缀]), ...])
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+class _ThreadShards:
+    """按线程分片的存储 - 每个线程只写自己的分片（无锁），采集时汇总所有分片
+
+    只有线程第一次写入时需要加锁登记分片。已退出线程的分片在登记新分片和采集时
+    用merge合并到基础分片中并释放，分片数不会随线程的创建和退出无限增长。
+    """
+
+    def __init__(self, merge: Callable[[Dict, Dict], None]):
+        self._merge = merge
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._base: Dict = {}
+        self._shards: List[Tuple[threading.Thread, Dict]] = []
+
+    def get(self) -> Dict:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = {}
+            self._local.shard = shard
+            with self._lock:
+                self._fold_dead()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _fold_dead(self):
+        """合并并释放已退出线程的分片（调用方持有锁）"""
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                self._merge(self._base, shard)
+        self._shards = live
+
+    def snapshot(self) -> List[Dict]:
+        with self._lock:
+            self._fold_dead()
+            base = {}
+            self._merge(base, self._base)  # 复制而不共享基础分片中可变的值
+            shards = [base] + [shard.copy() for _, shard in self._shards]
+        return shards
+
+    def __len__(self) -> int:
+        return len(self._shards)
+
+
+class _Metric:
+    TYPE = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._shards = _ThreadShards(self._merge_shard)
+        self._children: Dict[Tuple, '_Child'] = {}
+
+    def labels(self, *values) -> '_Child':
+        """按标签值取子指标（标签值按labelnames的顺序传入）"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f'{self.name} expects labels {self.labelnames}')
+            child = self._children.setdefault(key, _Child(self, key))
+        return child
+
+    def _label_dict(self, key: Tuple) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    @staticmethod
+    def _merge_shard(target: Dict, shard: Dict):
+        """把一个分片累加到target中（不修改shard）"""
+        for key, value in shard.items():
+            target[key] = target.get(key, 0) + value
+
+    def collect(self) -> List[Family]:
+        raise NotImplementedError
+
+
+class _Child:
+    """绑定了标签值的子指标"""
+
+    __slots__ = ('metric', 'key')
+
+    def __init__(self, metric: _Metric, key: Tuple):
+        self.metric = metric
+        self.key = key
+
+    def inc(self, amount: float = 1.0):
+        shard = self.metric._shards.get()
+        shard[self.key] = shard.get(self.key, 0) + amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def observe(self, value: float):
+        self.metric._observe(self.key, value)
+
+
+class Counter(_Metric):
+    TYPE = 'counter'
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def collect(self) -> List[Family]:
+        totals: Dict[Tuple, float] = {}
+        for shard in self._shards.snapshot():
+            self._merge_shard(totals, shard)
+        samples = [(self._label_dict(key), value) for key, value in sorted(totals.items())]
+        return [(self.name, self.TYPE, self.documentation, samples)]
+
+
+class Gauge(Counter):
+    """可增可减的计量（如进行中的请求数）；绝对值类指标请用采集器提供"""
+
+    TYPE = 'gauge'
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+
+class Histogram(_Metric):
+    TYPE = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float):
+        self._observe((), value)
+
+    def _observe(self, key: Tuple, value: float):
+        shard = self._shards.get()
+        state = shard.get(key)
+        if state is None:
+            # [各桶计数（最后一个为+Inf）, 总和, 次数]
+            state = shard[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    @staticmethod
+    def _merge_shard(target: Dict, shard: Dict):
+        for key, (counts, total, count) in shard.items():
+            state = target.get(key)
+            if state is None:
+                target[key] = [list(counts), total, count]
+            else:
+                state[0] = [a + b for a, b in zip(state[0], counts)]
+                state[1] += total
+                state[2] += count
+
+    def collect(self) -> List[Family]:
+        merged: Dict[Tuple, list] = {}
+        for shard in self._shards.snapshot():
+            self._merge_shard(merged, shard)
+
+        samples = []
+        for key, (counts, total, count) in sorted(merged.items()):
+            labels = self._label_dict(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                samples.append(({**labels, 'le': _format_bound(bound)}, cumulative, '_bucket'))
+            samples.append((labels, total, '_sum'))
+            samples.append((labels, count, '_count'))
+        return [(self.name, self.TYPE, self.documentation, samples)]
+
+
+def _format_bound(bound: float) -> str:
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    """指标注册表 - 管理指标和采集器，输出Prometheus文本格式
+
+    计数、计量和直方图按线程分片记录（请求路径上不加锁）；缓存统计、任务数等
+    已经由服务自己维护的数据通过采集器在抓取时读取。多进程部署时每个工作进程有独立的注册表。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: Dict[str, Callable[[], Iterable[Family]]] = {}
+        self._caches: Dict[str, Callable[[], Dict]] = {}
+        self.start_time = time.time()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, name: str, collector: Callable[[], Iterable[Family]]):
+        """注册采集器（同名覆盖），抓取时调用，返回指标族列表"""
+        with self._lock:
+            self._collectors[name] = collector
+
+    def register_cache(self, name: str, stats: Callable[[], Dict]):
+        """注册缓存，stats返回包含hits、misses（可选entries）的字典"""
+        with self._lock:
+            self._caches[name] = stats
+
+    def _collect_caches(self) -> List[Family]:
+        with self._lock:
+            caches = list(self._caches.items())
+        hits, misses, ratios, entries = [], [], [], []
+        for name, stats in caches:
+            try:
+                values = stats()
+            except Exception as e:
+                logger.error(f"Error collecting cache stats for {name}: {str(e)}")
+                continue
+            labels = {'cache': name}
+            lookups = values.get('hits', 0) + values.get('misses', 0)
+            hits.append((labels, values.get('hits', 0)))
+            misses.append((labels, values.get('misses', 0)))
+            ratios.append((labels, values.get('hits', 0) / lookups if lookups else 0.0))
+            if 'entries' in values:
+                entries.append((labels, values['entries']))
+        return [
+            ('cache_hits_total', 'counter', 'Cache lookups that found an entry', hits),
+            ('cache_misses_total', 'counter', 'Cache lookups that missed', misses),
+            ('cache_hit_ratio', 'gauge', 'Fraction of cache lookups that hit', ratios),
+            ('cache_entries', 'gauge', 'Entries currently held by the cache', entries),
+        ]
+
+    def collect(self) -> List[Family]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.items())
+
+        families = [
+            ('process_start_time_seconds', 'gauge', 'Start time of the process since the epoch',
+             [({'pid': str(os.getpid())}, self.start_time)]),
+        ]
+        for metric in metrics:
+            families.extend(metric.collect())
+        families.extend(self._collect_caches())
+        for name, collector in collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                logger.error(f"Error running metrics collector {name}: {str(e)}")
+        return families
+
+    def render(self) -> str:
+        """输出Prometheus文本格式"""
+        lines = []
+        for name, metric_type, documentation, samples in self.collect():
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for sample in samples:
+                labels, value = sample[0], sample[1]
+                suffix = sample[2] if len(sample) > 2 else ''
+                label_text = ','.join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+                lines.append(f'{name}{suffix}{{{label_text}}} {_format_value(value)}' if label_text
+                             else f'{name}{suffix} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+# 默认注册表（每个进程一个）
+registry = MetricsRegistry()
+
+
+class RequestMetrics:
+    """Flask请求指标 - 按路由、方法和状态码统计请求数、延迟、进行中的请求数和每个请求的数据库耗时
+
+    路由标签使用URL规则（如 /api/patient/<patient_id>），避免标签数量随参数增长。
+    应在其他after_request钩子（如压缩）之前初始化，这样延迟包含这些钩子的耗时。
+    请求状态保存在WSGI environ中，进程内嵌套分发的子请求（/api/batch）各自单独统计；
+    子请求的数据库耗时同时计入外层请求，在线程池中并行执行的子请求通过environ中的外层请求找到它。
+    """
+
+    ENVIRON_KEY = 'vd.metrics'
+
+    def __init__(self, app=None, metrics_registry: Optional[MetricsRegistry] = None, db_manager=None):
+        self.registry = metrics_registry or registry
+        self._local = threading.local()
+        self._parent_lock = threading.Lock()  # 并行子请求同时累加外层请求的耗时
+
+        self.requests = self.registry.counter(
+            'http_requests_total', 'HTTP requests by route, method and status', ('method', 'route', 'status'))
+        self.latency = self.registry.histogram(
+            'http_request_duration_seconds', 'HTTP request latency', ('method', 'route', 'status'))
+        self.in_flight = self.registry.gauge(
+            'http_requests_in_flight', 'HTTP requests currently being handled', ('method', 'route'))
+        self.request_db_time = self.registry.histogram(
+            'http_request_db_seconds', 'Database time spent per HTTP request', ('method', 'route'), DB_BUCKETS)
+        self.db_latency = self.registry.histogram(
+            'db_query_duration_seconds', 'Duration of individual database statements', ('operation',), DB_BUCKETS)
+
+        if db_manager is not None:
+            db_manager.add_query_observer(self.observe_query)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.extensions['metrics'] = self
+
+    @staticmethod
+    def _route() -> str:
+        return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+    def observe_query(self, query: str, seconds: float):
+        """数据库语句耗时回调（由DatabaseManager调用）"""
+        operation = query.lstrip().split(None, 1)[0].upper() if query.strip() else 'UNKNOWN'
+        self.db_latency.labels(operation).observe(seconds)
+        # 计入本线程上最内层的请求，以及它的外层请求（批量请求的子请求同时计入外层请求）
+        stack = getattr(self._local, 'stack', None)
+        if not stack:
+            return
+        state = stack[-1]
+        state['db'] += seconds
+        parent = state['parent']
+        if parent is not None:
+            with self._parent_lock:
+                while parent is not None:
+                    parent['db'] += seconds
+                    parent = parent['parent']
+
+    def _before_request(self):
+        route = self._route()
+        parent_environ = request.environ.get(PARENT_ENVIRON_KEY)
+        parent = parent_environ.get(self.ENVIRON_KEY) if parent_environ else None
+        state = {'start': time.perf_counter(), 'db': 0.0, 'route': route, 'parent': parent}
+        request.environ[self.ENVIRON_KEY] = state
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        self._local.stack.append(state)
+        self.in_flight.labels(request.method, route).inc()
+
+    def _after_request(self, response):
+        state = request.environ.get(self.ENVIRON_KEY)
+        if state is not None:
+            state['status'] = response.status_code
+        return response
+
+    def _teardown_request(self, exc=None):
+        state = request.environ.pop(self.ENVIRON_KEY, None)
+        if state is None:
+            return
+        stack = getattr(self._local, 'stack', [])
+        for index, item in enumerate(stack):
+            if item is state:
+                del stack[index]
+                break
+
+        method, route = request.method, state['route']
+        status = str(state.get('status', 500))
+        self.in_flight.labels(method, route).dec()
+        self.requests.labels(method, route, status).inc()
+        self.latency.labels(method, route, status).observe(time.perf_counter() - state['start'])
+        self.request_db_time.labels(method, route).observe(state['db'])
@@ -0,0 +1,87 @@
+import os
+import logging
+from collections import deque, namedtuple
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+from utils import serialization
+
+logger = logging.getLogger(__name__)
+
+# 单个任务的结果：原始输入、返回值、异常（成功时为None）
+LoadResult = namedtuple('LoadResult', ['item', 'value', 'error'])
+
+# 读取文件属于I/O密集型任务，线程数可以多于CPU核数
+DEFAULT_MAX_WORKERS = min(16, (os.cpu_count() or 1) * 4)
+
+
+def _run(func: Callable, item: Any) -> LoadResult:
+    try:
+        return LoadResult(item, func(item), None)
+    except Exception as e:
+        return LoadResult(item, None, e)
+
+
+def create_loader_pool(max_workers: Optional[int] = None) -> ThreadPoolExecutor:
+    """创建长期复用的读取线程池（由服务持有，关闭时调用shutdown）"""
+    return ThreadPoolExecutor(max_workers=max_workers or DEFAULT_MAX_WORKERS, thread_name_prefix='loader')
+
+
+def _iter_submitted(executor: Executor, func: Callable, items: Iterable, max_in_flight: int) -> Iterator[LoadResult]:
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(executor.submit(_run, func, item))
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # 调用方提前停止迭代时取消尚未开始的任务，不占用共享线程池
+        for future in pending:
+            future.cancel()
+
+
+def iter_parallel(func: Callable, items: Iterable, max_workers: Optional[int] = None,
+                  max_in_flight: Optional[int] = None, executor: Optional[Executor] = None) -> Iterator[LoadResult]:
+    """并行执行func，按输入顺序逐个产出结果
+
+    同时提交的任务数不超过max_in_flight，因此输入可以是任意长的迭代器；
+    单个任务抛出的异常被捕获到结果的error字段中，不影响其他任务。
+    传入executor时在该线程池中执行（不创建也不关闭线程池），否则为本次调用创建临时线程池。
+    """
+    max_workers = max_workers or getattr(executor, '_max_workers', None) or DEFAULT_MAX_WORKERS
+    max_in_flight = max(max_in_flight or max_workers * 2, 1)
+
+    if executor is not None:
+        yield from _iter_submitted(executor, func, items, max_in_flight)
+        return
+
+    if max_workers <= 1:
+        for item in items:
+            yield _run(func, item)
+        return
+
+    with create_loader_pool(max_workers) as executor:
+        yield from _iter_submitted(executor, func, items, max_in_flight)
+
+
+def parallel_map(func: Callable, items: Iterable, max_workers: Optional[int] = None,
+                 max_in_flight: Optional[int] = None, executor: Optional[Executor] = None) -> List[LoadResult]:
+    """并行执行func并返回按输入顺序排列的结果列表"""
+    return list(iter_parallel(func, items, max_workers, max_in_flight, executor))
+
+
+def read_json_file(path: str) -> Any:
+    """读取单个JSON文件"""
+    return serialization.load_file(path)
+
+
+def load_json_files(paths: Iterable[str], max_workers: Optional[int] = None,
+                    max_in_flight: Optional[int] = None) -> List[LoadResult]:
+    """并行读取多个JSON文件，结果顺序与paths一致"""
+    results = parallel_map(read_json_file, paths, max_workers, max_in_flight)
+    for result in results:
+        if result.error is not None:
+            logger.warning(f"Failed to load {result.item}: {str(result.error)}")
+    return results
@@ -0,0 +1,167 @@
+import os
+import time
+import hashlib
+import logging
+from typing import Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class PatientPathResolver:
+    """患者路径解析器 - 统一解析Set-N目录下扁平或哈希分片布局的患者路径
+
+    扁平布局:  <root>/patient_<id>/
+    分片布局:  <root>/<h[0:2]>/<h[2:4]>/patient_<id>/   (h = md5(id))
+
+    当前布局记录在 <root>/.layout 中；迁移过程中标记为 "migrating:<目标布局>"。
+    查找患者目录时优先使用当前布局路径，找不到时总是回退到另一种布局，
+    因此迁移可以在线进行，其他进程在缓存的布局过期前按旧布局创建的目录也能找到。
+    """
+
+    FLAT = 'flat'
+    SHARDED = 'sharded'
+    LAYOUT_FILE = '.layout'
+    MIGRATING_PREFIX = 'migrating:'
+
+    # 布局标记的重新读取间隔（秒），使其他进程的迁移能被及时发现
+    LAYOUT_TTL = 2.0
+
+    def __init__(self, root: str):
+        self.root = root
+        self._layout_state = None
+        self._layout_checked_at = 0.0
+
+    # 布局
+    def _read_layout_state(self) -> str:
+        now = time.monotonic()
+        if self._layout_state is None or now - self._layout_checked_at >= self.LAYOUT_TTL:
+            try:
+                with open(os.path.join(self.root, self.LAYOUT_FILE), 'r', encoding='utf-8') as f:
+                    self._layout_state = f.read().strip() or self.FLAT
+            except FileNotFoundError:
+                self._layout_state = self.FLAT
+            self._layout_checked_at = now
+        return self._layout_state
+
+    def _write_layout_state(self, state: str):
+        os.makedirs(self.root, exist_ok=True)
+        marker = os.path.join(self.root, self.LAYOUT_FILE)
+        with open(marker + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(state)
+        os.replace(marker + '.tmp', marker)
+        self._layout_state = state
+        self._layout_checked_at = time.monotonic()
+
+    @property
+    def layout(self) -> str:
+        """新建患者目录使用的布局（迁移中为目标布局）"""
+        state = self._read_layout_state()
+        if state.startswith(self.MIGRATING_PREFIX):
+            return state[len(self.MIGRATING_PREFIX):]
+        return state
+
+    @property
+    def migrating(self) -> bool:
+        return self._read_layout_state().startswith(self.MIGRATING_PREFIX)
+
+    # 路径
+    @staticmethod
+    def shard_prefix(patient_id: str) -> Tuple[str, str]:
+        """患者ID对应的两级分片目录名"""
+        digest = hashlib.md5(patient_id.encode('utf-8')).hexdigest()
+        return digest[0:2], digest[2:4]
+
+    def layout_dir(self, patient_id: str, layout: str) -> str:
+        """指定布局下的患者目录路径"""
+        if layout == self.SHARDED:
+            return os.path.join(self.root, *self.shard_prefix(patient_id), f'patient_{patient_id}')
+        return os.path.join(self.root, f'patient_{patient_id}')
+
+    def patient_dir(self, patient_id: str) -> str:
+        """患者目录路径（当前布局下不存在时回退到另一种布局中已存在的目录）"""
+        path = self.layout_dir(patient_id, self.layout)
+        if not os.path.exists(path):
+            other = self.FLAT if self.layout == self.SHARDED else self.SHARDED
+            fallback = self.layout_dir(patient_id, other)
+            if os.path.exists(fallback):
+                return fallback
+        return path
+
+    def history_file(self, patient_id: str) -> str:
+        """患者病史JSON文件路径"""
+        return os.path.join(self.patient_dir(patient_id), f'patient_{patient_id}_history.json')
+
+    def record_dir(self, patient_id: str) -> str:
+        """患者记录子目录路径（如COVID数据集的clinical_data.json所在目录）"""
+        return os.path.join(self.patient_dir(patient_id), f'patient_{patient_id}_record')
+
+    def exists(self, patient_id: str) -> bool:
+        return os.path.exists(self.patient_dir(patient_id))
+
+    # 遍历
+    @staticmethod
+    def _is_shard_name(name: str) -> bool:
+        return len(name) == 2 and all(c in '0123456789abcdef' for c in name)
+
+    def iter_patient_dirs(self) -> Iterator[Tuple[str, str]]:
+        """遍历所有患者目录，产出 (患者ID, 目录路径)，同时兼容两种布局"""
+        if not os.path.isdir(self.root):
+            return
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if not entry.is_dir():
+                    continue
+                if entry.name.startswith('patient_'):
+                    yield entry.name[len('patient_'):], entry.path
+                elif self._is_shard_name(entry.name):
+                    with os.scandir(entry.path) as level2:
+                        for shard in level2:
+                            if not (shard.is_dir() and self._is_shard_name(shard.name)):
+                                continue
+                            with os.scandir(shard.path) as patients:
+                                for patient in patients:
+                                    if patient.name.startswith('patient_') and patient.is_dir():
+                                        yield patient.name[len('patient_'):], patient.path
+
+    # 迁移
+    def migrate(self, target_layout: str) -> Dict:
+        """在线迁移到目标布局，每个患者目录通过一次rename原子移动"""
+        if target_layout not in (self.FLAT, self.SHARDED):
+            raise ValueError(f'Unknown layout: {target_layout}')
+
+        stats = {'moved': 0, 'skipped': 0, 'failed': 0, 'layout': target_layout}
+        self._write_layout_state(self.MIGRATING_PREFIX + target_layout)
+        # 等待其他进程缓存的布局过期：此后新建的患者目录都使用目标布局，遍历不会漏掉
+        time.sleep(self.LAYOUT_TTL)
+
+        for patient_id, current_path in list(self.iter_patient_dirs()):
+            target_path = self.layout_dir(patient_id, target_layout)
+            if os.path.abspath(current_path) == os.path.abspath(target_path):
+                stats['skipped'] += 1
+                continue
+            try:
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                os.rename(current_path, target_path)
+                stats['moved'] += 1
+            except OSError as e:
+                logger.error(f"Failed to move {current_path} to {target_path}: {str(e)}")
+                stats['failed'] += 1
+
+        # 迁移到扁平布局后清理空的分片目录
+        if target_layout == self.FLAT:
+            with os.scandir(self.root) as entries:
+                for entry in entries:
+                    if entry.is_dir() and self._is_shard_name(entry.name):
+                        for shard in os.listdir(entry.path):
+                            try:
+                                os.rmdir(os.path.join(entry.path, shard))
+                            except OSError:
+                                pass
+                        try:
+                            os.rmdir(entry.path)
+                        except OSError:
+                            pass
+
+        if stats['failed'] == 0:
+            self._write_layout_state(target_layout)
+        logger.info(f"Layout migration finished for {self.root}: {stats}")
+        return stats
@@ -0,0 +1,76 @@
+import os
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class RecordCache:
+    """解析结果缓存 - 以 (路径, mtime_ns, 大小) 为键的有界LRU缓存"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    @staticmethod
+    def _signature(file_stat: os.stat_result) -> tuple:
+        return (file_stat.st_mtime_ns, file_stat.st_size)
+
+    def get(self, path: str, file_stat: os.stat_result) -> Optional[Any]:
+        """查找缓存；文件的mtime或大小变化时视为未命中"""
+        signature = self._signature(file_stat)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(path)
+                self._hits += 1
+                return entry[1]
+            self._misses += 1
+            return None
+
+    def put(self, path: str, file_stat: os.stat_result, value: Any):
+        """写入缓存，超过容量时淘汰最久未使用的记录"""
+        with self._lock:
+            self._entries[path] = (self._signature(file_stat), value)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate_prefix(self, prefix: str) -> int:
+        """删除路径以prefix开头的所有记录（例如一个患者目录）"""
+        prefix = os.path.join(prefix, '')
+        with self._lock:
+            stale = [path for path in self._entries if path.startswith(prefix)]
+            for path in stale:
+                del self._entries[path]
+            self._invalidations += len(stale)
+        if stale:
+            logger.debug(f"Invalidated {len(stale)} cached records under {prefix}")
+        return len(stale)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._invalidations += len(self._entries)
+            self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        """获取缓存命中统计"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'invalidations': self._invalidations,
+                'hit_rate': self._hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,120 @@
+import json
+import logging
+import dataclasses
+from datetime import date, time
+from typing import Any, Callable, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+try:
+    # 可选依赖：安装orjson后使用更快的编码器，否则使用标准库json
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:
+    # 模型训练脚本等非Web环境只使用编解码函数
+    DefaultJSONProvider = object
+
+BACKENDS = ('orjson', 'stdlib')
+
+_backend = 'orjson' if orjson is not None else 'stdlib'
+
+
+def get_backend() -> str:
+    """当前使用的JSON编码后端"""
+    return _backend
+
+
+def use_backend(name: str):
+    """切换JSON编码后端（主要用于基准测试和排查问题）"""
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown JSON backend: {name}')
+    if name == 'orjson' and orjson is None:
+        raise RuntimeError('orjson is not installed')
+    _backend = name
+
+
+def json_default(obj: Any) -> Any:
+    """两种后端共用的默认编码：日期时间按ISO 8601（与orjson的内置编码一致），其余转为字符串"""
+    if isinstance(obj, (date, time)):
+        return obj.isoformat()
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    return str(obj)
+
+
+def _stdlib_dumps(obj: Any, pretty: bool, sort_keys: bool, default: Callable) -> str:
+    if pretty:
+        return json.dumps(obj, ensure_ascii=False, indent=2, sort_keys=sort_keys, default=default)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), sort_keys=sort_keys, default=default)
+
+
+def dumps_bytes(obj: Any, pretty: bool = False, sort_keys: bool = False,
+                default: Optional[Callable] = None) -> bytes:
+    """编码为UTF-8字节串；pretty为2空格缩进，否则为紧凑格式
+
+    orjson无法处理的值（如超过64位的整数）自动回退到标准库。
+    """
+    default = default or json_default
+    if _backend == 'orjson':
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=default, option=option)
+        except TypeError:
+            pass
+    return _stdlib_dumps(obj, pretty, sort_keys, default).encode('utf-8')
+
+
+def dumps(obj: Any, pretty: bool = False, sort_keys: bool = False, default: Optional[Callable] = None) -> str:
+    """编码为字符串"""
+    if _backend == 'orjson':
+        return dumps_bytes(obj, pretty, sort_keys, default).decode('utf-8')
+    return _stdlib_dumps(obj, pretty, sort_keys, default or json_default)
+
+
+def loads(data: Union[str, bytes, bytearray]) -> Any:
+    """解析JSON字符串或字节串"""
+    if _backend == 'orjson':
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dump_file(obj: Any, filepath: str, pretty: bool = True):
+    """写入JSON文件（默认缩进，便于阅读）"""
+    with open(filepath, 'wb') as f:
+        f.write(dumps_bytes(obj, pretty=pretty))
+
+
+def load_file(filepath: str) -> Any:
+    """读取JSON文件"""
+    with open(filepath, 'rb') as f:
+        return loads(f.read())
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON提供器 - jsonify和request.get_json使用本模块的编码器
+
+    保留Flask的sort_keys和compact设置；datetime按ISO 8601编码（不使用Flask默认的HTTP日期格式），
+    因此响应格式与是否安装orjson无关。
+    """
+
+    def dumps(self, obj: Any, **kwargs) -> str:
+        return dumps(obj, pretty=bool(kwargs.get('indent')), sort_keys=kwargs.get('sort_keys', self.sort_keys),
+                     default=kwargs.get('default', json_default))
+
+    def loads(self, s: Union[str, bytes], **kwargs) -> Any:
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        body = dumps_bytes(obj, pretty=pretty, sort_keys=self.sort_keys, default=json_default)
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
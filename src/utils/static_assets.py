@@ -0,0 +1,104 @@
+import os
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+from flask import current_app, request
+from werkzeug.security import safe_join
+
+logger = logging.getLogger(__name__)
+
+ONE_YEAR = 365 * 24 * 3600
+FINGERPRINT_PARAM = 'v'
+FINGERPRINT_LENGTH = 12
+
+
+class StaticAssets:
+    """静态资源指纹 - 启动时计算静态文件的内容哈希，url_for('static', ...)自动附加 ?v=<哈希>
+
+    - 模板中通过url_for引用的静态资源URL随内容变化，内容不变时URL不变；
+    - 带有当前指纹的请求返回一年有效的immutable缓存头，重复访问页面时浏览器不再请求这些资源；
+    - 没有指纹或指纹已过期（旧页面引用旧版本）的请求保持Flask默认的协商缓存，不会被长期缓存；
+    - 调试模式下每次生成URL时检查文件是否变化，修改静态文件后刷新页面即可生效，无需构建步骤。
+    """
+
+    def __init__(self, app=None, max_age: int = ONE_YEAR):
+        self.max_age = max_age
+        self.static_folder: Optional[str] = None
+
+        self._lock = threading.Lock()
+        self._fingerprints: Dict[str, Tuple[int, int, str]] = {}  # 文件名 -> (mtime_ns, size, 哈希)
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        self.build()
+        app.url_defaults(self._add_fingerprint)
+        app.after_request(self.after_request)
+        app.extensions['static_assets'] = self
+
+    # 指纹
+    def build(self) -> int:
+        """计算静态目录中所有文件的指纹，返回文件数"""
+        if not self.static_folder or not os.path.isdir(self.static_folder):
+            return 0
+        for root, _dirs, files in os.walk(self.static_folder):
+            for name in files:
+                relative = os.path.relpath(os.path.join(root, name), self.static_folder)
+                self.fingerprint(relative.replace(os.sep, '/'), check=True)
+        logger.debug(f"Fingerprinted {len(self._fingerprints)} static files")
+        return len(self._fingerprints)
+
+    def fingerprint(self, filename: str, check: bool = False) -> Optional[str]:
+        """返回静态文件的内容指纹；check为True时按mtime和大小检查文件是否变化"""
+        entry = self._fingerprints.get(filename)
+        if entry is not None and not check:
+            return entry[2]
+
+        path = safe_join(self.static_folder, filename) if self.static_folder else None
+        try:
+            stat = os.stat(path) if path else None
+        except OSError:
+            stat = None
+        if stat is None:
+            self._fingerprints.pop(filename, None)
+            return None
+        if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+            return entry[2]
+
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:FINGERPRINT_LENGTH]
+        with self._lock:
+            self._fingerprints[filename] = (stat.st_mtime_ns, stat.st_size, digest)
+        return digest
+
+    def _add_fingerprint(self, endpoint: str, values: Dict):
+        """url_for的默认参数回调：为静态资源URL附加指纹"""
+        if endpoint != 'static' or FINGERPRINT_PARAM in values or 'filename' not in values:
+            return
+        digest = self.fingerprint(values['filename'], check=current_app.debug)
+        if digest:
+            values[FINGERPRINT_PARAM] = digest
+
+    # 缓存头
+    def after_request(self, response):
+        if request.endpoint != 'static' or response.status_code not in (200, 304):
+            return response
+        version = request.args.get(FINGERPRINT_PARAM)
+        filename = (request.view_args or {}).get('filename')
+        # 按mtime和大小确认指纹仍对应磁盘上的内容（一次stat），否则修改后的文件会以旧指纹被永久缓存
+        if not version or not filename or version != self.fingerprint(filename, check=True):
+            return response
+
+        # URL中的指纹与内容一一对应，内容变化后URL也会变化，因此可以永久缓存
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = self.max_age
+        response.cache_control.immutable = True
+        return response
+
+    def get_stats(self) -> Dict:
+        return {'files': len(self._fingerprints), 'max_age': self.max_age}
@@ -0,0 +1,265 @@
+import logging
+from collections import Counter
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# 字段不存在时使用的占位值（与值为None区分）
+MISSING = object()
+
+# 训练数据患者JSON（Set-0）的格式定义
+TRAINING_PATIENT_SCHEMA = {
+    'fields': {
+        'name': {'required': True},
+        'birthdate': {'recommended': True},
+        'gender': {
+            'recommended': True,
+            'choices': ['M', 'F', 'Male', 'Female'],
+            'choices_message': 'Gender should be M/F or Male/Female'
+        },
+        'blood_type': {'recommended': True},
+        'address': {'recommended': True},
+        'weight': {'recommended': True, 'type': 'number', 'type_message': 'Weight should be a number'},
+        'height': {'recommended': True, 'type': 'number', 'type_message': 'Height should be a number'}
+    }
+}
+
+# JSONHandler导出/导入文件的格式定义（只要求字段存在）
+EXPORT_FILE_SCHEMA = {
+    'fields': {
+        'patient_data': {
+            'required': 'present',
+            'type': 'object',
+            'type_message': 'patient_data should be an object',
+            'schema': {
+                'fields': {
+                    'name': {'required': 'present'}
+                }
+            }
+        }
+    }
+}
+
+# 数据库备份行的格式定义（恢复时按表使用）
+BACKUP_ROW_SCHEMAS = {
+    'patients': {
+        'fields': {
+            'id': {'required': True},
+            'name': {'required': True},
+            'weight': {'type': 'number', 'type_message': 'Weight should be a number'},
+            'height': {'type': 'number', 'type_message': 'Height should be a number'}
+        }
+    },
+    'chat_messages': {
+        'fields': {
+            'patient_id': {'required': True},
+            'message_type': {'required': True, 'choices': ['user', 'assistant'], 'choices_level': 'error',
+                             'choices_message': 'message_type should be user or assistant'},
+            'content': {'required': 'present', 'type': 'string'}
+        }
+    },
+    'diagnosis_records': {
+        'fields': {
+            'patient_id': {'required': True},
+            'confidence': {'type': 'number', 'type_message': 'Confidence should be a number'}
+        }
+    }
+}
+
+_TYPE_TESTS = {
+    'number': lambda v: isinstance(v, (int, float)),
+    'string': lambda v: isinstance(v, str),
+    'object': lambda v: isinstance(v, dict),
+    'list': lambda v: isinstance(v, list)
+}
+
+
+class _Check:
+    """编译后的单项检查：test(value)为True表示不通过"""
+
+    __slots__ = ('field', 'test', 'message', 'level')
+
+    def __init__(self, field: str, test: Callable[[Any], bool], message: str, level: str):
+        self.field = field
+        self.test = test
+        self.message = message
+        self.level = level
+
+
+class SchemaValidator:
+    """格式验证器 - 由声明式格式定义编译一次，可逐条或按列批量验证
+
+    检查顺序：必需字段 -> 推荐字段 -> 类型 -> 取值范围 -> 嵌套对象，
+    错误和警告信息与原有的逐条验证逻辑保持一致。
+    """
+
+    def __init__(self, schema: Dict, prefix: str = ''):
+        self.schema = schema
+        self.prefix = prefix
+        self.checks: List[_Check] = []
+        self.nested: Dict[str, 'SchemaValidator'] = {}
+        self._compile(schema)
+
+    def _compile(self, schema: Dict):
+        fields = schema.get('fields', {})
+        phases = {'required': [], 'recommended': [], 'type': [], 'choices': []}
+
+        for field, rule in fields.items():
+            label = self.prefix + field
+
+            required = rule.get('required')
+            if required == 'present':
+                phases['required'].append(_Check(field, lambda v: v is MISSING,
+                                                 f'Missing required field: {label}', 'error'))
+            elif required:
+                phases['required'].append(_Check(field, lambda v: v is MISSING or not v,
+                                                 f'Missing required field: {label}', 'error'))
+
+            if rule.get('recommended'):
+                phases['recommended'].append(_Check(field, lambda v: v is MISSING or not v,
+                                                    f'Missing recommended field: {label}', 'warning'))
+
+            if rule.get('type'):
+                type_test = _TYPE_TESTS[rule['type']]
+                message = rule.get('type_message', f"{label} should be a {rule['type']}")
+                if rule['type'] == 'object':
+                    # 对象类型：字段存在即检查
+                    test = lambda v, t=type_test: v is not MISSING and not t(v)
+                else:
+                    # 其他类型：与原逻辑一致，只检查非空值
+                    test = lambda v, t=type_test: v is not MISSING and bool(v) and not t(v)
+                phases['type'].append(_Check(field, test, message, rule.get('type_level', 'error')))
+
+            if rule.get('choices'):
+                choices = frozenset(rule['choices'])
+                message = rule.get('choices_message', f"{label} should be one of {'/'.join(rule['choices'])}")
+                phases['choices'].append(_Check(
+                    field, lambda v, c=choices: v is not MISSING and bool(v) and v not in c,
+                    message, rule.get('choices_level', 'warning')
+                ))
+
+            if rule.get('schema'):
+                self.nested[field] = SchemaValidator(rule['schema'], prefix=label + '.')
+
+        self.checks = phases['required'] + phases['recommended'] + phases['type'] + phases['choices']
+
+    # 逐条验证
+    def validate(self, record: Any) -> Dict:
+        """验证单条记录，返回 {'valid', 'errors', 'warnings'}"""
+        errors = []
+        warnings = []
+        self._validate_into(record, errors, warnings)
+        return {'valid': len(errors) == 0, 'errors': errors, 'warnings': warnings}
+
+    def _validate_into(self, record: Any, errors: List[str], warnings: List[str]):
+        if not isinstance(record, dict):
+            errors.append(f"{self.prefix.rstrip('.') or 'Record'} must be a JSON object")
+            return
+
+        for check in self.checks:
+            if check.test(record.get(check.field, MISSING)):
+                (errors if check.level == 'error' else warnings).append(check.message)
+
+        for field, validator in self.nested.items():
+            value = record.get(field, MISSING)
+            if isinstance(value, dict):
+                validator._validate_into(value, errors, warnings)
+
+    # 批量验证
+    def validate_batch(self, records: List[Any], include_records: bool = True) -> Dict:
+        """按列批量验证多条记录，返回汇总报告
+
+        每个字段的值只提取一次，再对整列执行该字段的所有检查。
+        """
+        total = len(records)
+        errors: List[List[str]] = [[] for _ in range(total)]
+        warnings: List[List[str]] = [[] for _ in range(total)]
+        self._validate_columns(records, list(range(total)), errors, warnings)
+
+        error_counts = Counter(message for row in errors for message in row)
+        warning_counts = Counter(message for row in warnings for message in row)
+        invalid = [i for i in range(total) if errors[i]]
+
+        report = {
+            'total': total,
+            'valid': total - len(invalid),
+            'invalid': len(invalid),
+            'invalid_indexes': invalid,
+            'error_counts': dict(error_counts),
+            'warning_counts': dict(warning_counts)
+        }
+        if include_records:
+            report['records'] = [
+                {'valid': not errors[i], 'errors': errors[i], 'warnings': warnings[i]}
+                for i in range(total)
+            ]
+        return report
+
+    def _validate_columns(self, records: List[Any], positions: List[int],
+                          errors: List[List[str]], warnings: List[List[str]]):
+        objects = []
+        for record, position in zip(records, positions):
+            if isinstance(record, dict):
+                objects.append((record, position))
+            else:
+                errors[position].append(f"{self.prefix.rstrip('.') or 'Record'} must be a JSON object")
+
+        columns: Dict[str, List[Any]] = {}
+        for check in self.checks:
+            column = columns.get(check.field)
+            if column is None:
+                column = columns[check.field] = [record.get(check.field, MISSING) for record, _ in objects]
+            target = errors if check.level == 'error' else warnings
+            for value, (_, position) in zip(column, objects):
+                if check.test(value):
+                    target[position].append(check.message)
+
+        for field, validator in self.nested.items():
+            nested_records = []
+            nested_positions = []
+            for record, position in objects:
+                value = record.get(field, MISSING)
+                if isinstance(value, dict):
+                    nested_records.append(value)
+                    nested_positions.append(position)
+            if nested_records:
+                validator._validate_columns(nested_records, nested_positions, errors, warnings)
+
+
+class ValidationSummary:
+    """跨多个批次（或逐条）验证结果的汇总，用于分批流式导入"""
+
+    def __init__(self):
+        self.total = 0
+        self.valid = 0
+        self.error_counts = Counter()
+        self.warning_counts = Counter()
+
+    def add(self, result: Dict):
+        self.total += 1
+        if result['valid']:
+            self.valid += 1
+        self.error_counts.update(result['errors'])
+        self.warning_counts.update(result['warnings'])
+
+    def merge(self, report: Dict):
+        """合并一份validate_batch报告"""
+        self.total += report['total']
+        self.valid += report['valid']
+        self.error_counts.update(report['error_counts'])
+        self.warning_counts.update(report['warning_counts'])
+
+    def to_dict(self) -> Dict:
+        return {
+            'total': self.total,
+            'valid': self.valid,
+            'invalid': self.total - self.valid,
+            'error_counts': dict(self.error_counts),
+            'warning_counts': dict(self.warning_counts)
+        }
+
+
+# 预编译的验证器
+training_patient_validator = SchemaValidator(TRAINING_PATIENT_SCHEMA)
+export_file_validator = SchemaValidator(EXPORT_FILE_SCHEMA)
+backup_row_validators = {table: SchemaValidator(schema) for table, schema in BACKUP_ROW_SCHEMAS.items()}
@@ -6,6 +6,7 @@
 
 import os
 import sys
+import argparse
 import subprocess
 
 def check_requirements():
@@ -20,7 +21,7 @@ def check_requirements():
         print("请运行: pip install -r requirements.txt")
         return False
 
-def start_system():
+def start_system(args):
     """启动系统"""
     print("🏥 虚拟诊断助手系统")
     print("=" * 50)
@@ -31,16 +32,35 @@ def start_system():
     
     # 进入src目录
     src_dir = os.path.join(os.path.dirname(__file__), 'src')
+    db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'virtual_diagnostician.db')
     
     try:
         print("\n🚀 正在启动系统...")
         print("📁 工作目录:", src_dir)
-        print("🌐 服务地址: http://localhost:5000")
+        print("⚙️  运行模式:", "ASGI（异步）" if args.asgi else "生产（多进程）" if args.prod else "开发")
+        print(f"🌐 服务地址: http://localhost:{args.port if args.prod or args.asgi else 5000}")
         print("按 Ctrl+C 停止服务\n")
         
-        # 启动Flask应用
         os.chdir(src_dir)
-        subprocess.run([sys.executable, 'main.py'])
+        
+        # 首次启动时初始化数据库和示例数据（只执行一次）
+        if not os.path.exists(db_path):
+            print("🗄️  首次启动，正在初始化数据库...")
+            subprocess.run([sys.executable, 'manage.py', 'bootstrap'], check=True)
+        
+        if args.asgi:
+            # ASGI模式：聊天接口异步处理（uvicorn或内置的asyncio服务器）
+            subprocess.run([sys.executable, 'asgi.py', '--port', str(args.port), '--threads', str(args.threads)])
+        elif args.prod:
+            # 生产模式：多进程服务器（gunicorn或内置的预派生服务器）
+            command = [sys.executable, 'server.py', '--port', str(args.port),
+                       '--workers', str(args.workers), '--threads', str(args.threads)]
+            if args.server:
+                command += ['--server', args.server]
+            subprocess.run(command)
+        else:
+            # 开发模式：Flask开发服务器（调试模式，单进程）
+            subprocess.run([sys.executable, 'main.py'])
         
     except KeyboardInterrupt:
         print("\n\n👋 系统已停止")
@@ -49,6 +69,16 @@ def start_system():
         print(f"\n❌ 启动失败: {e}")
         return False
 
+def parse_args():
+    parser = argparse.ArgumentParser(description='Start the Virtual Diagnostician')
+    parser.add_argument('--prod', action='store_true', help='Serve with multiple worker processes instead of the dev server')
+    parser.add_argument('--asgi', action='store_true', help='Serve the async ASGI entry point (asgi.py)')
+    parser.add_argument('--port', type=int, default=5000, help='Port for --prod / --asgi')
+    parser.add_argument('--workers', type=int, default=min(os.cpu_count() or 1, 4), help='Worker processes for --prod')
+    parser.add_argument('--threads', type=int, default=8, help='Threads per worker for --prod, executor threads for --asgi')
+    parser.add_argument('--server', choices=['auto', 'gunicorn', 'prefork'], help='Server for --prod (default: auto)')
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    success = start_system()
+    success = start_system(parse_args())
     sys.exit(0 if success else 1) 
\ No newline at end of file
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 应用代码以src为导入根目录（与 python src/main.py 一致）
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
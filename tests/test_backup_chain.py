@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+from database.db_manager import DatabaseManager
+from services.chat_service import ChatService
+from utils.backup_chain import DIFFERENTIAL, FULL, INCREMENTAL, BackupChain
+from utils.backup_restore import BackupRestorer
+
+
+@pytest.fixture
+def source(tmp_path):
+    db_manager = DatabaseManager(str(tmp_path / 'source.db'))
+    db_manager.insert_patient({'id': 'p1', 'name': 'Alice'})
+    db_manager.insert_patient({'id': 'p2', 'name': 'Bob'})
+    for i in range(5):
+        db_manager.insert_chat_message('p1', 'user', f'message {i}')
+    return db_manager
+
+
+@pytest.fixture
+def chain(tmp_path):
+    backup_dir = tmp_path / 'backups'
+    backup_dir.mkdir()
+    return BackupChain(str(backup_dir))
+
+
+def write(chain, db_manager, name, backup_type):
+    return chain.write_backup(db_manager, os.path.join(chain.backup_dir, name), backup_type)
+
+
+def restore(tmp_path, chain, entries, name='restored.db'):
+    target = DatabaseManager(str(tmp_path / name))
+    BackupRestorer(target).restore([os.path.join(chain.backup_dir, e['filename']) for e in entries], clear=True)
+    return target
+
+
+def snapshot(db_manager):
+    return {
+        'patients': [row['id'] for row in db_manager.execute_query("SELECT id FROM patients ORDER BY id")],
+        'chat_messages': [row['content'] for row in
+                          db_manager.execute_query("SELECT content FROM chat_messages ORDER BY id")],
+    }
+
+
+@pytest.mark.parametrize('backup_type', [INCREMENTAL, DIFFERENTIAL])
+def test_deletions_survive_restore(tmp_path, source, chain, backup_type):
+    full = write(chain, source, 'full.ndjson.gz', FULL)
+
+    ChatService(source).clear_chat_history('p1')
+    source.execute_update("DELETE FROM patients WHERE id = ?", ('p2',))
+    source.insert_chat_message('p1', 'user', 'after clear')
+    changes = write(chain, source, 'changes.ndjson.gz', backup_type)
+
+    assert changes['counts']['deleted_rows'] == 6
+    assert snapshot(restore(tmp_path, chain, [full, changes])) == snapshot(source) == {
+        'patients': ['p1'], 'chat_messages': ['after clear']
+    }
+
+
+def test_compacted_backup_keeps_deletions(tmp_path, source, chain):
+    write(chain, source, 'full.ndjson.gz', FULL)
+    ChatService(source).clear_chat_history('p1')
+    source.insert_chat_message('p1', 'user', 'after clear')
+    write(chain, source, 'inc1.ndjson.gz', INCREMENTAL)
+    source.execute_update("DELETE FROM chat_messages WHERE content = ?", ('after clear',))
+    source.insert_chat_message('p1', 'user', 'latest')
+    write(chain, source, 'inc2.ndjson.gz', INCREMENTAL)
+
+    compacted = chain.compact()
+
+    assert compacted['counts']['chat_messages'] == 1
+    assert snapshot(restore(tmp_path, chain, [compacted])) == snapshot(source)
+
+
+def test_full_backup_prunes_tombstones(source, chain):
+    write(chain, source, 'full1.ndjson.gz', FULL)
+    ChatService(source).clear_chat_history('p1')
+    write(chain, source, 'full2.ndjson.gz', FULL)
+
+    # 第一个全量备份仍在，它之后的墓碑需要保留
+    assert source.execute_query("SELECT COUNT(*) AS count FROM deleted_rows")[0]['count'] == 5
+
+    os.remove(os.path.join(chain.backup_dir, 'full1.ndjson.gz'))
+    write(chain, source, 'full3.ndjson.gz', FULL)
+    assert source.execute_query("SELECT COUNT(*) AS count FROM deleted_rows")[0]['count'] == 0